@@ -1,20 +1,410 @@
 import uuid
 import os
 import json
-from typing import Dict, Union
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Union
 import datetime
 import pandas as pd
 import numpy as np
+from storage_engine import STORAGE_ENGINES, CELL_FORMATS, DEFAULT_MEMSTORE_FLUSH_SIZE, TableStore, LSMTableStore, new_timestamp, cell_timestamp, select_versions
+from bloom import DEFAULT_BLOOM_FALSE_POSITIVE_RATE
+from compaction import CompactionPolicy, Compactor, compact
+from catalog import TableCatalog
+from cache import RowCache, DEFAULT_ROW_CACHE_SIZE
+from scanner import ScanCursor, Scanner, parse_columns, prefix_stop_row, project_row, read_families
+from filters import Filter
+from bulk_load import frame_cells, frame_rows, stored_records
+from group_commit import CommitPipeline, DEFAULT_MAX_BATCH_MUTATIONS, DEFAULT_MAX_BATCH_DELAY_MS
+from mutations import Batch, RowMutations, PUT, DELETE_ROW, check_row
+from regions import RegionedTableStore
+from parallel import ShardPool, DEFAULT_SCAN_WORKERS
+from aggregation import AGGREGATE_OPS, ColumnAggregate, aggregate_rows, aggregate_shard, newest_value
+from indexes import IndexCatalog, SecondaryIndex, index_name, index_changes, collect_entries
 
 def prettyPrint(data:dict) -> str:
         print(json.dumps(data, indent=4))
 
 class EBase:
-    def __init__(self, db:str = 'root') -> None:
+    def __init__(self, db:str = 'root', storage_engine:str = 'lsm', memstore_flush_size:int = DEFAULT_MEMSTORE_FLUSH_SIZE, wal_sync:bool = True, compaction_policy:CompactionPolicy = None, background_compaction:bool = True, row_cache_size:int = DEFAULT_ROW_CACHE_SIZE, cell_format:str = 'json', region_split_size:int = None, scan_workers:int = DEFAULT_SCAN_WORKERS) -> None:
+        """
+        @param db: str - database name, tables live in storage/<db>
+        @param storage_engine: str - engine used for new tables, 'lsm' or 'json'
+        @param memstore_flush_size: int - bytes buffered per lsm table before flushing a segment
+        @param wal_sync: bool - fsync the write-ahead log on every write
+        @param compaction_policy: CompactionPolicy (optional) - when and how fast lsm tables are compacted
+        @param background_compaction: bool - compact lsm tables in a background thread
+        @param row_cache_size: int - byte budget of the row cache used by get, 0 disables it
+        @param cell_format: str - segment format of new lsm tables, 'json' or 'binary'
+        @param region_split_size: int (optional) - new tables are split into row key regions of about this many bytes, None keeps them whole
+        @param scan_workers: int - processes of parallel scans and exact counts, the number of cores as default
+        """
+        if storage_engine not in STORAGE_ENGINES:
+            raise ValueError(f'Unknown storage engine {storage_engine}')
+        if cell_format not in CELL_FORMATS:
+            raise ValueError(f'Unknown cell format {cell_format}')
         self.db = db
+        self.storage_engine = storage_engine
+        self.cell_format = cell_format
+        self.region_split_size = region_split_size
+        self.store_options = {
+            "memstore_flush_size": memstore_flush_size,
+            "wal_sync": wal_sync
+        }
+        self.compaction_policy = compaction_policy or CompactionPolicy()
+        self.compactor = Compactor(self.compaction_policy) if background_compaction else None
+        self.row_cache = RowCache(row_cache_size)
         self.relative_path = os.path.join(os.path.dirname(__file__), 'storage', db)
         if not os.path.exists(self.relative_path):
             os.makedirs(self.relative_path)
+        self.catalog = TableCatalog(self.relative_path, self.store_options, on_open=self._on_open)
+        self.indexes = IndexCatalog(self.relative_path, self.store_options, on_open=self._on_open)
+        self.pipelines = {}
+        self.pipelines_lock = threading.Lock()
+        self.shard_pool = ShardPool(scan_workers)
+
+    def _store(self, table_name:str) -> TableStore:
+        """
+        Get the open storage engine of a table, opening it on first use
+        @param table_name: str
+        @return: TableStore
+        """
+        return self.catalog.store(table_name)
+
+    def _on_open(self, store:TableStore) -> None:
+        """
+        Hand lsm tables opened by the catalog, and the lsm regions of split tables, to the background compactor
+        @param store: TableStore
+        """
+        if isinstance(store, RegionedTableStore):
+            store.watch_regions(self._on_open)
+        elif self.compactor is not None and isinstance(store, LSMTableStore):
+            self.compactor.register(store)
+
+    def _release(self, table_name:str) -> None:
+        """
+        Forget the open storage engine of a table after it was renamed or dropped
+        Its commit pipeline has to be closed before, while the files of the table and its lock file still exist
+        @param table_name: str
+        """
+        self.catalog.remove(table_name)
+        self.row_cache.invalidate_table(table_name)
+
+    def _get_row(self, table_name:str, store:TableStore, row_key:str, families:list[str] = None) -> Union[dict, None]:
+        """
+        Read a row through the row cache
+        @param table_name: str
+        @param store: TableStore
+        @param row_key: str
+        @param families: list[str] (optional) - only read these column families on a cache miss, the
+                         partial row is not cached; a cached row is returned whole
+        @return: dict - {family: {column: {timestamp: value}}} or None if the row does not exist
+        """
+        generation = store.generation
+        # the read lock keeps a writer from invalidating the row between the read and the put
+        with store.lock.read():
+            hit, row = self.row_cache.get(table_name, row_key, generation)
+            if not hit:
+                row = store.get_row(row_key, families)
+                if row is not None and families is None:
+                    self.row_cache.put(table_name, row_key, row, generation)
+        return row
+
+    def _get_rows(self, table_name:str, store:TableStore, row_keys:list[str], families:list[str] = None) -> dict:
+        """
+        Read many rows through the row cache, the rows it does not hold are read from the table in one pass
+        @param table_name: str
+        @param store: TableStore
+        @param row_keys: list[str]
+        @param families: list[str] (optional) - as for _get_row
+        @return: dict - {row_key: {family: {column: {timestamp: value}}}} of the rows that exist
+        """
+        generation = store.generation
+        rows = {}
+        with store.lock.read():
+            missing = []
+            for row_key in row_keys:
+                hit, row = self.row_cache.get(table_name, row_key, generation)
+                if not hit:
+                    missing.append(row_key)
+                elif row is not None:
+                    rows[row_key] = row
+            if missing:
+                for row_key, row in store.get_rows(missing, families).items():
+                    if families is None:
+                        self.row_cache.put(table_name, row_key, row, generation)
+                    rows[row_key] = row
+        return rows
+
+    def _apply(self, table_name:str, store:TableStore, mutations:list[dict]) -> None:
+        """
+        Write mutations to a table, update its secondary indexes and drop the cached copies of the rows they touch
+        @param table_name: str
+        @param store: TableStore
+        @param mutations: list[dict]
+        """
+        with store.lock.write():
+            indexes = self._table_indexes(table_name, store)
+            changes = index_changes(store, indexes, mutations) if indexes else []
+            try:
+                store.apply(mutations)
+            finally:
+                for row_key in {mutation['row'] for mutation in mutations}:
+                    self.row_cache.invalidate(table_name, row_key)
+            for index, entries in changes:
+                index.apply(entries)
+
+    def _table_indexes(self, table_name:str, store:TableStore) -> list[SecondaryIndex]:
+        """
+        Get the secondary indexes of a table
+        @param table_name: str
+        @param store: TableStore
+        @return: list[SecondaryIndex]
+        """
+        names = store.metadata.get('indexes')
+        if not names:
+            return []
+        return self.indexes.table_indexes(table_name, names)
+
+    def _load_rows(self, table_name:str, store:TableStore, rows) -> int:
+        """
+        Bulk load new rows into a table and its secondary indexes
+        @param table_name: str
+        @param store: TableStore
+        @param rows: iterator of (row_key, row) sorted by row key
+        @return: int - number of rows loaded
+        """
+        with store.lock.write():
+            indexes = self._table_indexes(table_name, store)
+            entries = {}
+            if indexes:
+                rows = collect_entries(rows, indexes, entries)
+            loaded = store.load_rows(rows, new_rows=True)
+            for index in indexes:
+                index.load(entries.get(index.name, []))
+            return loaded
+
+    def _pipeline(self, table_name:str, store:TableStore) -> Union[CommitPipeline, None]:
+        """
+        Get the commit pipeline of a table with group commit, starting it on first use
+        @param table_name: str
+        @param store: TableStore
+        @return: CommitPipeline or None if the writes of the table are not batched
+        """
+        settings = store.metadata.get('group_commit')
+        with self.pipelines_lock:
+            entry = self.pipelines.get(table_name)
+            if entry is not None and entry[0] is store and settings is not None:
+                return entry[1]
+            # the table was reopened or group commit was turned off
+            stale = self.pipelines.pop(table_name, None)
+            pipeline = None
+            if settings is not None:
+                pipeline = CommitPipeline(
+                    lambda mutations: self._apply(table_name, store, mutations),
+                    store.lock.write,
+                    settings['max_batch_mutations'],
+                    settings['max_batch_delay_ms'],
+                    name=f'ebase-commit-{table_name}'
+                )
+                self.pipelines[table_name] = (store, pipeline)
+        if stale is not None:
+            # the caller holds the write lock: joining the commit thread, which may be waiting
+            # for that lock, would never return. The queue of the same store is committed here
+            # before the new write, the thread of a reopened store commits it once the lock is released
+            if stale[0] is store:
+                stale[1].flush()
+            stale[1].close(wait=False)
+        return pipeline
+
+    def _close_pipeline(self, table_name:str) -> None:
+        """
+        Commit the queued writes of a table and stop its commit pipeline
+        The write lock of the table must not be held, the commit thread may be waiting for it
+        @param table_name: str
+        """
+        with self.pipelines_lock:
+            entry = self.pipelines.pop(table_name, None)
+        if entry is not None:
+            entry[1].close()
+
+    def _get_row_for_write(self, table_name:str, store:TableStore, row_key:str, existence_only:bool = False) -> Union[dict, None]:
+        """
+        Read a row that is about to be changed, its queued writes are committed first
+        The write lock of the table has to be held
+        @param table_name: str
+        @param store: TableStore
+        @param row_key: str
+        @param existence_only: bool (optional) - the caller only checks that the row exists, queued
+                               writes that neither create nor delete it are not committed
+        @return: dict - {family: {column: {timestamp: value}}} or None if the row does not exist
+        """
+        self._flush_pipeline(table_name, row_key, existence_only)
+        return self._get_row(table_name, store, row_key)
+
+    def _flush_pipeline(self, table_name:str, row_key:str = None, existence_only:bool = False) -> None:
+        """
+        Commit the queued writes of a table now
+        @param table_name: str
+        @param row_key: str (optional) - only if writes of this row are queued
+        @param existence_only: bool (optional) - only if writes creating or deleting the row are queued
+        """
+        with self.pipelines_lock:
+            entry = self.pipelines.get(table_name)
+        if entry is not None and (row_key is None or entry[1].is_pending(row_key, existence_only)):
+            entry[1].flush()
+
+    def _write(self, table_name:str, store:TableStore, mutations:list[dict]) -> Union[Future, None]:
+        """
+        Write mutations now, or queue them when the table batches its writes
+        The write lock of the table has to be held, a returned future must be waited for after releasing it
+        @param table_name: str
+        @param store: TableStore
+        @param mutations: list[dict]
+        @return: Future or None if the mutations were already written
+        """
+        pipeline = self._pipeline(table_name, store)
+        if pipeline is None:
+            self._apply(table_name, store, mutations)
+            return None
+        return pipeline.submit(mutations)
+
+    def set_group_commit(self, table_name:str, enabled:bool = True, max_batch_mutations:int = DEFAULT_MAX_BATCH_MUTATIONS, max_batch_delay_ms:float = DEFAULT_MAX_BATCH_DELAY_MS) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Batch the put and delete calls of a table, concurrent calls share one durable write
+        A batch is written once it holds max_batch_mutations mutations or its first call
+        waited max_batch_delay_ms. The setting is stored with the table
+        @param table_name: str
+        @param enabled: bool (optional) - False writes every call on its own again
+        @param max_batch_mutations: int (optional) - 1000 as default
+        @param max_batch_delay_ms: float (optional) - 5 as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+            if max_batch_mutations < 1:
+                return {'success': False, 'message': 'Max batch mutations should be greater than 0', "data": {}}
+            if max_batch_delay_ms < 0:
+                return {'success': False, 'message': 'Max batch delay cannot be negative', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            settings = None
+            if enabled:
+                settings = {
+                    "max_batch_mutations": max_batch_mutations,
+                    "max_batch_delay_ms": max_batch_delay_ms
+                }
+            # writes pick their pipeline with the lock held, so none starts one with the old settings
+            with store.lock.write():
+                store.update_metadata({
+                    "group_commit": settings,
+                    "updated_at": str(datetime.datetime.now())
+                })
+                with self.pipelines_lock:
+                    entry = self.pipelines.pop(table_name, None)
+                # queued writes stay visible to the next writes, which only look at the new pipeline
+                if entry is not None and entry[0] is store:
+                    entry[1].flush()
+            if entry is not None:
+                entry[1].close()
+            res = {
+                "group_commit": settings
+            }
+            return {'success': True, 'message': 'Group commit updated successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def cache_stats(self) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Get the counters of the row cache
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            return {'success': True, 'message': 'Cache stats fetched successfully', "data": self.row_cache.stats()}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def invalidate(self, table_name:str = None) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Drop the cached table list and table contents, e.g. after another process changed the files
+        @param table_name: str (optional) - only this table, every table if not provided
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            if table_name is not None:
+                table_name = table_name.replace(' ', '_')
+                self.row_cache.invalidate_table(table_name)
+            else:
+                self.row_cache.clear()
+            res = {
+                "generation": self.catalog.invalidate(table_name)
+            }
+            return {'success': True, 'message': 'Catalog invalidated successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def flush(self, table_name:str) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Flush the buffered writes of a table to disk
+        @param table_name: str
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            self._flush_pipeline(table_name)
+            store.flush()
+            return {'success': True, 'message': 'Table flushed successfully', "data": store.stats()}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def close(self) -> None:
+        """
+        Flush and close every open table
+        """
+        for table_name in list(self.pipelines):
+            self._close_pipeline(table_name)
+        self.indexes.close()
+        self.catalog.close()
+        if self.compactor is not None:
+            self.compactor.stop()
+        self.shard_pool.close()
+
+    def compact(self, table_name:str, major:bool = False) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Compact the segment files of a table now
+        @param table_name: str
+        @param major: bool (optional) - merge every segment and drop deleted cells and expired versions
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            if store.engine_name != LSMTableStore.engine_name:
+                return {'success': False, 'message': 'Only lsm tables can be compacted', "data": {}}
+            if isinstance(store, RegionedTableStore):
+                regions = {}
+                for region_store in store.region_stores():
+                    stats = compact(region_store, major, self.compaction_policy)
+                    if stats is not None:
+                        regions[region_store.table_name] = stats
+                if not regions:
+                    return {'success': True, 'message': 'Nothing to compact', "data": {}}
+                return {'success': True, 'message': 'Table compacted successfully', "data": {"regions": regions}}
+            stats = compact(store, major, self.compaction_policy)
+            if stats is None:
+                return {'success': True, 'message': 'Nothing to compact', "data": {}}
+            return {'success': True, 'message': 'Table compacted successfully', "data": stats}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
     
     def table_exists(self, table_name:str) -> Dict[str, Union[bool, str, dict]]:
         """
@@ -24,7 +414,7 @@ class EBase:
         """
         try:
             table_name = table_name.replace(' ', '_')
-            if table_name+'.json' in os.listdir(self.relative_path):
+            if self.catalog.exists(table_name):
                 res = {
                     "exists": True
                 }
@@ -37,12 +427,16 @@ class EBase:
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
 
-    def create(self, table_name:str, column_families: list[str], max_timestamp: int = 1) -> Dict[str, Union[bool, str, dict]]:
+    def create(self, table_name:str, column_families: list[str], max_timestamp: int = 1, storage_engine: str = None, cell_format: str = None, bloom_false_positive_rate: float = None, region_split_size: int = None) -> Dict[str, Union[bool, str, dict]]:
         """
         Create a table
         @param table_name: str
         @param column_families: list[str]
         @param max_timestamp: int (optional) - 1 as default
+        @param storage_engine: str (optional) - 'lsm' or 'json', the database default if not provided
+        @param cell_format: str (optional) - 'json' or 'binary' segments for lsm tables, the database default if not provided
+        @param bloom_false_positive_rate: float (optional) - of the row key Bloom filter of every segment of lsm tables, 0.01 as default and 0 for no filters
+        @param region_split_size: int (optional) - split the table into row key regions of about this many bytes, the database default if not provided
         @return: dict - {'success': bool, 'message': str, 'data': dict}
         """
         try: 
@@ -53,28 +447,44 @@ class EBase:
                     return {'success': False, 'message': 'Column families cannot be empty', "data": {}}
                 if max_timestamp < 1:
                     return {'success': False, 'message': 'Max timestamp should be greater than 0', "data": {}}
+                storage_engine = storage_engine or self.storage_engine
+                if storage_engine not in STORAGE_ENGINES:
+                    return {'success': False, 'message': f'Storage engine {storage_engine} does not exist', "data": {}}
+                if cell_format is not None and storage_engine != LSMTableStore.engine_name:
+                    return {'success': False, 'message': 'Cell formats are only supported by the lsm storage engine', "data": {}}
+                cell_format = cell_format or self.cell_format
+                if cell_format not in CELL_FORMATS:
+                    return {'success': False, 'message': f'Cell format {cell_format} does not exist', "data": {}}
+                if bloom_false_positive_rate is not None and storage_engine != LSMTableStore.engine_name:
+                    return {'success': False, 'message': 'Bloom filters are only supported by the lsm storage engine', "data": {}}
+                if bloom_false_positive_rate is None:
+                    bloom_false_positive_rate = DEFAULT_BLOOM_FALSE_POSITIVE_RATE
+                if not 0 <= bloom_false_positive_rate < 1:
+                    return {'success': False, 'message': 'Bloom false positive rate should be between 0 and 1', "data": {}}
+                if region_split_size is None:
+                    region_split_size = self.region_split_size
+                if region_split_size is not None and region_split_size < 1:
+                    return {'success': False, 'message': 'Region split size should be greater than 0', "data": {}}
                 
                 table_name = table_name.replace(' ', '_')
-                table_path = os.path.join(self.relative_path, table_name+'.json')
-                with open(table_path, 'w') as f:
-                    f.write(
-                        json.dumps(
-                            {
-                                "table_metadata": {
-                                    "table_name": table_name,
-                                    "column_families": column_families,
-                                    "table_id": str(uuid.uuid4()),
-                                    "disabled": False,
-                                    "created_at": str(datetime.datetime.now()),
-                                    "updated_at": str(datetime.datetime.now()),
-                                    "rows": 0,
-                                    "max_timestamp": max_timestamp
-                                },
-                                "data": {}
-                            },
-                            indent=4
-                        )
-                    )
+                metadata = {
+                    "table_name": table_name,
+                    "column_families": column_families,
+                    "table_id": str(uuid.uuid4()),
+                    "disabled": False,
+                    "created_at": str(datetime.datetime.now()),
+                    "updated_at": str(datetime.datetime.now()),
+                    "rows": 0,
+                    "max_timestamp": max_timestamp
+                }
+                if storage_engine == LSMTableStore.engine_name:
+                    metadata["cell_format"] = cell_format
+                    metadata["bloom_false_positive_rate"] = bloom_false_positive_rate
+                if region_split_size is not None:
+                    store = RegionedTableStore.create(self.relative_path, table_name, metadata, storage_engine, region_split_size, **self.store_options)
+                else:
+                    store = STORAGE_ENGINES[storage_engine].create(self.relative_path, table_name, metadata, **self.store_options)
+                self.catalog.add(table_name, store)
                 return {'success': True, 'message': 'Table created successfully', "data": {}}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
@@ -85,10 +495,7 @@ class EBase:
         @return: dict - {'success': bool, 'message': str, 'data': dict}
         """
         try:
-            files = os.listdir(self.relative_path)
-            tables = []
-            for i in range(len(files)):
-                tables.append(files[i].replace('.json', ''))
+            tables = self.catalog.list()
             res = {
                 "tables": tables
             }
@@ -107,13 +514,10 @@ class EBase:
                 return {'success': False, 'message': 'Table does not exist', "data": {}}
 
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
-            data['table_metadata']['disabled'] = True
-            data['table_metadata']['updated_at'] = str(datetime.datetime.now())
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(data, indent=4))
+            self._store(table_name).update_metadata({
+                "disabled": True,
+                "updated_at": str(datetime.datetime.now())
+            })
             return {'success': True, 'message': 'Table disabled successfully', "data": {}}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
@@ -129,11 +533,8 @@ class EBase:
                 return {'success': False, 'message': 'Table does not exist', "data": {}}
 
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
             res = {
-                "is_enabled": not data['table_metadata']['disabled']
+                "is_enabled": not self._store(table_name).metadata['disabled']
             }
             return {'success': True, 'message': 'Table status fetched successfully', "data": res}
         except Exception as e:
@@ -150,13 +551,10 @@ class EBase:
                 return {'success': False, 'message': 'Table does not exist', "data": {}}
 
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
-            data['table_metadata']['disabled'] = False
-            data['table_metadata']['updated_at'] = str(datetime.datetime.now())
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(data, indent=4))
+            self._store(table_name).update_metadata({
+                "disabled": False,
+                "updated_at": str(datetime.datetime.now())
+            })
             return {'success': True, 'message': 'Table enabled successfully', "data": {}}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
@@ -177,19 +575,22 @@ class EBase:
                 return {'success': False, 'message': 'Table is enabled, please disable it first', "data": {}}
             else:
                 table_name = table_name.replace(' ', '_')
-                table_path = os.path.join(self.relative_path, table_name+'.json')
-                with open(table_path, 'r') as f:
-                    data = json.load(f)
+                store = self._store(table_name)
+                with store.lock.write():
+                    changes = {}
+                    if new_name:
+                        changes['table_name'] = new_name
+                        changes['updated_at'] = str(datetime.datetime.now())
+                    if new_column_family:
+                        changes['column_families'] = store.metadata['column_families'] + [new_column_family]
+                        changes['updated_at'] = str(datetime.datetime.now())
+                    store.update_metadata(changes)
+                # renaming closes the store, which takes the compaction lock before the table lock
                 if new_name:
-                    data['table_metadata']['table_name'] = new_name
-                    data['table_metadata']['updated_at'] = str(datetime.datetime.now())
-                if new_column_family:
-                    data['table_metadata']['column_families'].append(new_column_family)
-                    data['table_metadata']['updated_at'] = str(datetime.datetime.now())
-                with open(table_path, 'w') as f:
-                    f.write(json.dumps(data, indent=4))
-                if new_name:
-                    os.rename(table_path, os.path.join(self.relative_path, new_name+'.json'))
+                    self._close_pipeline(table_name)
+                    store.rename(new_name)
+                    self._release(table_name)
+                    self.indexes.rename_table(table_name, new_name)
 
                 return {'success': True, 'message': 'Table altered successfully', "data": {}}
 
@@ -210,8 +611,10 @@ class EBase:
                 return {'success': False, 'message': f'Table {table_name} is enabled, please disable it first', "data": {}}
             else:
                 table_name = table_name.replace(' ', '_')
-                table_path = os.path.join(self.relative_path, table_name+'.json')
-                os.remove(table_path)
+                self._close_pipeline(table_name)
+                self._store(table_name).drop()
+                self._release(table_name)
+                self.indexes.drop_table(table_name)
                 return {'success': True, 'message': f'Table {table_name} dropped successfully', "data": {}}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
@@ -254,17 +657,80 @@ class EBase:
                 return {'success': False, 'message': 'Table does not exist', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
+            store = self._store(table_name)
             res = {
-                "table_metadata": data['table_metadata']
+                "table_metadata": store.metadata,
+                "storage": store.stats()
             }
+            with self.pipelines_lock:
+                entry = self.pipelines.get(table_name)
+            if entry is not None:
+                res["group_commit"] = entry[1].stats()
+            indexes = self._table_indexes(table_name, store)
+            if indexes:
+                res["indexes"] = [index.stats() for index in indexes]
             return {'success': True, 'message': 'Table described successfully', "data": res}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
 
-    def put(self, table_name: str, column_family: str, column: str, value: str, row_key: str = None) -> Dict[str, Union[bool, str, dict]]:
+    def convert(self, table_name:str, storage_engine:str = 'lsm', cell_format:str = None) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Move a table to another storage engine or cell format, keeping its metadata and every stored version
+        @param table_name: str
+        @param storage_engine: str (optional) - 'lsm' as default
+        @param cell_format: str (optional) - 'json' or 'binary' segments when converting to lsm, the database default if not provided
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            start_time = datetime.datetime.now()
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+            if storage_engine not in STORAGE_ENGINES:
+                return {'success': False, 'message': f'Storage engine {storage_engine} does not exist', "data": {}}
+            if cell_format is not None and storage_engine != LSMTableStore.engine_name:
+                return {'success': False, 'message': 'Cell formats are only supported by the lsm storage engine', "data": {}}
+            if storage_engine == LSMTableStore.engine_name:
+                cell_format = cell_format or self.cell_format
+                if cell_format not in CELL_FORMATS:
+                    return {'success': False, 'message': f'Cell format {cell_format} does not exist', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            source = self._store(table_name)
+            if source.engine_name == storage_engine and getattr(source, 'cell_format', None) == cell_format:
+                if cell_format is None:
+                    return {'success': False, 'message': f'Table already uses the {storage_engine} storage engine', "data": {}}
+                return {'success': False, 'message': f'Table already uses the {storage_engine} storage engine with {cell_format} cells', "data": {}}
+
+            # queued writes are committed before the rows are copied
+            self._close_pipeline(table_name)
+            tmp_name = table_name+'__converting'
+            metadata = dict(source.metadata)
+            metadata.pop('storage_engine', None)
+            metadata.pop('cell_format', None)
+            region_split_size = metadata.pop('region_split_size', None)
+            if storage_engine != LSMTableStore.engine_name:
+                metadata.pop('bloom_false_positive_rate', None)
+            if cell_format is not None:
+                metadata['cell_format'] = cell_format
+            if region_split_size is not None:
+                target = RegionedTableStore.create(self.relative_path, tmp_name, metadata, storage_engine, region_split_size, **self.store_options)
+            else:
+                target = STORAGE_ENGINES[storage_engine].create(self.relative_path, tmp_name, metadata, **self.store_options)
+            rows = target.load_rows(source.scan_rows())
+            source.drop()
+            self._release(table_name)
+            target.rename(table_name)
+            res = {
+                "time_taken": str(datetime.datetime.now() - start_time),
+                "storage_engine": storage_engine,
+                "cell_format": cell_format,
+                "rows": rows
+            }
+            return {'success': True, 'message': 'Table converted successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def put(self, table_name: str, column_family: str, column: str, value: str, row_key: str = None, wait: bool = True) -> Dict[str, Union[bool, str, dict]]:
         """
         Insert data into a table
         @param table_name: str
@@ -272,7 +738,8 @@ class EBase:
         @param column: str
         @param value: str
         @param row_key: str (optional) - if not provided, a new row key will be generated
-        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        @param wait: bool (optional) - with group commit, wait until the batch is written, True as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}, data has the future of the batch when not waiting
         """
         try:
             if not self.table_exists(table_name)['data']['exists']:
@@ -282,111 +749,386 @@ class EBase:
                 return {'success': False, 'message': 'Table is disabled, please enable it first', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
-            if column_family not in data['table_metadata']['column_families']:
+            store = self._store(table_name)
+            if column_family not in store.metadata['column_families']:
                 return {'success': False, 'message': 'Column family does not exist', "data": {}}
-            if row_key:
-                if row_key is None:
-                    row_key = str(uuid.uuid4())
-                else:
-                    if row_key not in data['data']:
+            with store.lock.write():
+                if row_key:
+                    if self._get_row_for_write(table_name, store, row_key, existence_only=True) is None:
                         return {'success': False, 'message': 'Row key does not exist', "data": {}}
-                
-                if column_family not in data['data'][row_key]:
-                    data['data'][row_key][column_family] = {}
+                    new_row = False
+                else:
+                    row_key = str(uuid.uuid4())
+                    new_row = True
 
-                if column not in data['data'][row_key][column_family]:
-                    data['data'][row_key][column_family][column] = {}
-                
-                old_timestamps = list(data['data'][row_key][column_family][column].keys())
-                if len(old_timestamps) >= data['table_metadata']['max_timestamp']:
-                    old_timestamps.sort()
-                    del data['data'][row_key][column_family][column][old_timestamps[0]]
-                data['data'][row_key][column_family][column][str(datetime.datetime.now())] = value
-            else:
-                row_key = str(uuid.uuid4())
-                data['data'][row_key] = {
-                    column_family: {
-                        column: {
-                            str(datetime.datetime.now()): value
-                        }
-                    }
-                }
-                data['table_metadata']['rows'] = data['table_metadata']['rows'] + 1
-            
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(data, indent=4))
+                future = self._write(table_name, store, [{
+                    "op": "put",
+                    "row": row_key,
+                    "family": column_family,
+                    "column": column,
+                    "ts": new_timestamp(),
+                    "value": value,
+                    "new_row": new_row
+                }])
 
             res = {
                 "row_key": row_key
             }
+            if future is not None:
+                if not wait:
+                    res["future"] = future
+                    return {'success': True, 'message': 'Data queued successfully', "data": res}
+                future.result()
             return {'success': True, 'message': 'Data inserted successfully', "data": res}
 
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
 
-    def get(self, table_name: str, row_key: str) -> Dict[str, Union[bool, str, dict]]:
+    def get(self, table_name: str, row_key: str, versions: int = None, time_range: tuple = None, columns: list[str] = None) -> Dict[str, Union[bool, str, dict]]:
         """
         Get data from a table
         @param table_name: str
         @param row_key: str
+        @param columns: list[str] (optional) - 'family' or 'family:column' to return, every column if not provided;
+                        on lsm tables only the segments of the requested families are read
+        @param versions: int (optional) - return up to this many versions of every column, newest first
+        @param time_range: tuple (optional) - (min, max) timestamps as int microseconds or datetime, min inclusive and max exclusive, None leaves a side open
         @return: dict - {'success': bool, 'message': str, 'data': dict}
+            data is {family: {column: value}} with the newest values, or {family: {column: {timestamp: value}}}
+            when versions or time_range is given
         """
         try:
             if not self.table_exists(table_name)['data']['exists']:
                 return {'success': False, 'message': 'Table does not exist', "data": {}}
+            if versions is not None and versions < 1:
+                return {'success': False, 'message': 'Versions should be greater than 0', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
-            if row_key not in data['data']:
+            store = self._store(table_name)
+            projection = parse_columns(columns)
+            row = self._get_row(table_name, store, row_key, read_families(projection))
+            if row is None and projection is not None:
+                # the row may exist without the requested families
+                row = self._get_row(table_name, store, row_key)
+            if row is None:
                 return {'success': False, 'message': 'Row key does not exist', "data": {}}
-            row_families = data['data'][row_key].keys()
-            for family in row_families:
-                columns = data['data'][row_key][family].keys()
-                for column in columns:
-                    timestamps = list(data['data'][row_key][family][column].keys())
-                    timestamps.sort()
-                    data['data'][row_key][family][column] = data['data'][row_key][family][column][timestamps[-1]]
+            row = project_row(row, projection, None) or {}
+            if versions is None and time_range is None:
+                data = self._newest_cells(row)
+            else:
+                data = self._cell_versions(row, versions or 1, *(time_range or (None, None)))
             res = {
-                "data": data['data'][row_key]
+                "data": data
             }
             return {'success': True, 'message': 'Data fetched successfully', "data": res}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
         
-    def scan(self, table_name) -> Dict[str, Union[bool, str, dict]]:
+    def get_many(self, table_name: str, row_keys: list[str], columns: list[str] = None, versions: int = None) -> Dict[str, Union[bool, str, dict]]:
         """
-        Scan all data from a table
+        Get many rows of a table in one pass
+        The keys are sorted and read together, every segment is searched once moving forward
         @param table_name: str
+        @param row_keys: list[str]
+        @param columns: list[str] (optional) - 'family' or 'family:column' to return, every column if not provided;
+                        on lsm tables only the segments of the requested families are read
+        @param versions: int (optional) - return up to this many versions of every column, newest first
+        @return: dict - {'success': bool, 'message': str, 'data': {'rows': [{'row_key': str, 'found': bool, 'data': dict}], 'missing': list[str]}}
+            rows follow the order of row_keys, data is as returned by get
+        """
+        try:
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+            if versions is not None and versions < 1:
+                return {'success': False, 'message': 'Versions should be greater than 0', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            start_time = datetime.datetime.now()
+            store = self._store(table_name)
+            projection = parse_columns(columns)
+            row_keys_read = sorted(set(row_keys))
+            found = self._get_rows(table_name, store, row_keys_read, read_families(projection))
+            if projection is not None:
+                # rows may exist without the requested families
+                unresolved = [row_key for row_key in row_keys_read if row_key not in found]
+                if unresolved:
+                    found.update((row_key, {}) for row_key in self._get_rows(table_name, store, unresolved))
+            rows = []
+            missing = []
+            for row_key in row_keys:
+                row = found.get(row_key)
+                if row is None:
+                    rows.append({"row_key": row_key, "found": False, "data": {}})
+                    missing.append(row_key)
+                    continue
+                row = project_row(row, projection, versions) or {}
+                rows.append({
+                    "row_key": row_key,
+                    "found": True,
+                    "data": self._newest_cells(row) if versions is None else row
+                })
+            res = {
+                "time_taken": str(datetime.datetime.now() - start_time),
+                "rows": rows,
+                "missing": missing
+            }
+            return {'success': True, 'message': 'Data fetched successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    @staticmethod
+    def _newest_cells(row:dict) -> dict:
+        """
+        Keep the newest version of every cell of a row
+        @param row: dict - {family: {column: {timestamp: value}}}
+        @return: dict - {family: {column: value}}
+        """
+        data = {}
+        for family, columns in row.items():
+            data[family] = {}
+            for column, versions in columns.items():
+                if versions:
+                    data[family][column] = next(iter(versions.values()))
+        return data
+
+    @staticmethod
+    def _cell_versions(row: dict, versions: int, min_timestamp=None, max_timestamp=None) -> dict:
+        """
+        Keep the newest versions of every cell of a row written in [min_timestamp, max_timestamp)
+        @param row: dict - {family: {column: {timestamp: value}}}
+        @return: dict - {family: {column: {timestamp: value}}} newest first, columns without such a version are left out
+        """
+        min_timestamp = None if min_timestamp is None else cell_timestamp(min_timestamp)
+        max_timestamp = None if max_timestamp is None else cell_timestamp(max_timestamp)
+        data = {}
+        for family, columns in row.items():
+            data[family] = {}
+            for column, cells in columns.items():
+                selected = select_versions(cells, versions, min_timestamp, max_timestamp)
+                if selected:
+                    data[family][column] = selected
+        return data
+
+    def create_index(self, table_name: str, column_family: str, column: str) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Create a secondary index from the values of a column to the row keys holding them
+        The rows already in the table are indexed, later writes keep the index up to date
+        @param table_name: str
+        @param column_family: str
+        @param column: str
         @return: dict - {'success': bool, 'message': str, 'data': dict}
         """
         try:
+            start_time = datetime.datetime.now()
             if not self.table_exists(table_name)['data']['exists']:
                 return {'success': False, 'message': 'Table does not exist', "data": {}}
-            
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            name = index_name(column_family, column)
+            with store.lock.write():
+                metadata = store.metadata
+                if column_family not in metadata['column_families']:
+                    return {'success': False, 'message': 'Column family does not exist', "data": {}}
+                if name in metadata.get('indexes', []):
+                    return {'success': False, 'message': 'Index already exists', "data": {}}
+                self._flush_pipeline(table_name)
+                rows = self.indexes.index(table_name, name).rebuild(store.scan_rows())
+                store.update_metadata({
+                    "indexes": metadata.get('indexes', []) + [name],
+                    "updated_at": str(datetime.datetime.now())
+                })
+            res = {
+                "time_taken": str(datetime.datetime.now() - start_time),
+                "index": name,
+                "rows_indexed": rows
+            }
+            return {'success': True, 'message': 'Index created successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def drop_index(self, table_name: str, column_family: str, column: str) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Drop a secondary index
+        @param table_name: str
+        @param column_family: str
+        @param column: str
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            name = index_name(column_family, column)
+            with store.lock.write():
+                indexes = store.metadata.get('indexes', [])
+                if name not in indexes:
+                    return {'success': False, 'message': 'Index does not exist', "data": {}}
+                self._flush_pipeline(table_name)
+                store.update_metadata({
+                    "indexes": [index for index in indexes if index != name],
+                    "updated_at": str(datetime.datetime.now())
+                })
+                self.indexes.drop(table_name, name)
+            return {'success': True, 'message': 'Index dropped successfully', "data": {}}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def rebuild_index(self, table_name: str, column_family: str = None, column: str = None) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Rebuild secondary indexes from the rows of the table, e.g. after a crash left them stale
+        @param table_name: str
+        @param column_family: str (optional) - with column, only this index, every index of the table if not provided
+        @param column: str (optional)
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            start_time = datetime.datetime.now()
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            with store.lock.write():
+                names = store.metadata.get('indexes', [])
+                if column_family is not None or column is not None:
+                    name = index_name(column_family, column)
+                    if name not in names:
+                        return {'success': False, 'message': 'Index does not exist', "data": {}}
+                    names = [name]
+                if not names:
+                    return {'success': False, 'message': 'Table has no indexes', "data": {}}
+                self._flush_pipeline(table_name)
+                rows_indexed = {}
+                for index in self.indexes.table_indexes(table_name, names):
+                    rows_indexed[index.name] = index.rebuild(store.scan_rows())
+            res = {
+                "time_taken": str(datetime.datetime.now() - start_time),
+                "rows_indexed": rows_indexed
+            }
+            return {'success': True, 'message': 'Indexes rebuilt successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def get_by(self, table_name: str, column_family: str, column: str, value: str) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Get the rows whose newest value of an indexed column is value, through its secondary index
+        @param table_name: str
+        @param column_family: str
+        @param column: str
+        @param value: str
+        @return: dict - {'success': bool, 'message': str, 'data': {'rows': [{'row_key': str, 'data': dict}]}}
+        """
+        try:
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
+            store = self._store(table_name)
+            name = index_name(column_family, column)
+            if name not in store.metadata.get('indexes', []):
+                return {'success': False, 'message': f'Column {name} is not indexed', "data": {}}
+            self._flush_pipeline(table_name)
+            rows = []
+            for row_key in self.indexes.index(table_name, name).lookup(value):
+                row = self._get_row(table_name, store, row_key)
+                # the row changed between the index lookup and the read
+                if row is None or str(newest_value(row, column_family, column)) != str(value):
+                    continue
+                rows.append({
+                    "row_key": row_key,
+                    "data": self._newest_cells(row)
+                })
             res = {
-                "data": data['data']
+                "rows": rows
+            }
+            return {'success': True, 'message': 'Data fetched successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def scan(self, table_name: str, start_row: str = None, stop_row: str = None, prefix: str = None, columns: list[str] = None, limit: int = None, batch_size: int = 100, versions: int = None, filter: Filter = None, parallel: bool = False) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Scan the rows of a table in row key order
+        @param table_name: str
+        @param start_row: str (optional) - first row key, inclusive
+        @param stop_row: str (optional) - last row key, exclusive
+        @param prefix: str (optional) - only rows whose key starts with it
+        @param columns: list[str] (optional) - 'family' or 'family:column' to return, every column if not provided
+        @param limit: int (optional) - max number of rows
+        @param batch_size: int (optional) - rows per batch of the cursor, 100 as default
+        @param versions: int (optional) - newest versions returned per column, every stored version if not provided
+        @param filter: Filter (optional) - evaluated while the rows are read, rows it drops are never returned
+        @param parallel: bool (optional) - read ranges of the table in the scan worker processes, False as default
+        @return: dict - {'success': bool, 'message': str, 'data': {'cursor': ScanCursor}}
+        """
+        try:
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+            if limit is not None and limit < 1:
+                return {'success': False, 'message': 'Limit should be greater than 0', "data": {}}
+            if batch_size < 1:
+                return {'success': False, 'message': 'Batch size should be greater than 0', "data": {}}
+            if versions is not None and versions < 1:
+                return {'success': False, 'message': 'Versions should be greater than 0', "data": {}}
+
+            if prefix:
+                if start_row is None or start_row < prefix:
+                    start_row = prefix
+                prefix_stop = prefix_stop_row(prefix)
+                if prefix_stop is not None and (stop_row is None or stop_row > prefix_stop):
+                    stop_row = prefix_stop
+
+            table_name = table_name.replace(' ', '_')
+            if parallel:
+                store = self._store(table_name)
+                self._flush_pipeline(table_name)
+                rows = self.shard_pool.scan_rows(store, self.store_options, start_row, stop_row, prefix or None, columns, limit, versions, filter)
+                res = {
+                    "cursor": ScanCursor(rows, limit=limit, batch_size=batch_size)
+                }
+                return {'success': True, 'message': 'Data scanned successfully', "data": res}
+            key_filter = filter.filter_row_key if filter is not None else None
+            families = read_families(parse_columns(columns), filter)
+            rows = self._store(table_name).scan_rows(start_row, stop_row, key_filter, families)
+            res = {
+                "cursor": ScanCursor(rows, prefix or None, columns, limit, batch_size, versions, filter)
             }
             return {'success': True, 'message': 'Data scanned successfully', "data": res}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
 
-    def delete(self, table_name: str, row_key: str, column_family: str, column: str) -> Dict[str, Union[bool, str, dict]]:
+    def open_scanner(self, table_name: str, start_row: str = None, stop_row: str = None, prefix: str = None, columns: list[str] = None, limit: int = None, versions: int = None, filter: Filter = None) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Open a scanner streaming the cells of a table one at a time
+        @param table_name: str
+        @param start_row: str (optional) - first row key, inclusive
+        @param stop_row: str (optional) - last row key, exclusive
+        @param prefix: str (optional) - only rows whose key starts with it
+        @param columns: list[str] (optional) - 'family' or 'family:column' to return, every column if not provided
+        @param limit: int (optional) - max number of rows
+        @param versions: int (optional) - newest versions returned per column, every stored version if not provided
+        @param filter: Filter (optional) - evaluated while the rows are read
+        @return: dict - {'success': bool, 'message': str, 'data': {'scanner': Scanner}}
+        """
+        output = self.scan(table_name, start_row=start_row, stop_row=stop_row, prefix=prefix, columns=columns, limit=limit, versions=versions, filter=filter)
+        if not output['success']:
+            return output
+        res = {
+            "scanner": Scanner(output['data']['cursor'])
+        }
+        return {'success': True, 'message': 'Scanner opened successfully', "data": res}
+
+    def delete(self, table_name: str, row_key: str, column_family: str, column: str, wait: bool = True) -> Dict[str, Union[bool, str, dict]]:
         """
         Delete a cell from a table
         @param table_name: str
         @param row_key: str
         @param column_family: str
         @param column: str
-        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        @param wait: bool (optional) - with group commit, wait until the batch is written, True as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}, data has the future of the batch when not waiting
         """
 
         try:
@@ -397,29 +1139,37 @@ class EBase:
                 return {'success': False, 'message': 'Table is disabled, please enable it first', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
-            if row_key not in data['data']:
-                return {'success': False, 'message': 'Row key does not exist', "data": {}}
-            if column_family not in data['data'][row_key]:
-                return {'success': False, 'message': 'Column family does not exist', "data": {}}
-            if column not in data['data'][row_key][column_family]:
-                return {'success': False, 'message': 'Column does not exist', "data": {}}
+            store = self._store(table_name)
+            with store.lock.write():
+                row = self._get_row_for_write(table_name, store, row_key)
+                if row is None:
+                    return {'success': False, 'message': 'Row key does not exist', "data": {}}
+                if column_family not in row:
+                    return {'success': False, 'message': 'Column family does not exist', "data": {}}
+                if column not in row[column_family]:
+                    return {'success': False, 'message': 'Column does not exist', "data": {}}
 
-            data['data'][row_key][column_family][column] = {}
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(data, indent=4))
+                future = self._write(table_name, store, [{
+                    "op": "delete_column",
+                    "row": row_key,
+                    "family": column_family,
+                    "column": column
+                }])
+            if future is not None:
+                if not wait:
+                    return {'success': True, 'message': 'Delete queued successfully', "data": {"future": future}}
+                future.result()
             return {'success': True, 'message': 'Data deleted successfully', "data": {}}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
 
-    def delete_all(self, table_name: str, row_key: str) -> Dict[str, Union[bool, str, dict]]:
+    def delete_all(self, table_name: str, row_key: str, wait: bool = True) -> Dict[str, Union[bool, str, dict]]:
         """
         Delete a row from a table
         @param table_name: str
         @param row_key: str
-        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        @param wait: bool (optional) - with group commit, wait until the batch is written, True as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}, data has the future of the batch when not waiting
         """
         try:
             if not self.table_exists(table_name)['data']['exists']:
@@ -429,24 +1179,28 @@ class EBase:
                 return {'success': False, 'message': 'Table is disabled, please enable it first', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
-            if row_key not in data['data']:
-                return {'success': False, 'message': 'Row key does not exist', "data": {}}
+            store = self._store(table_name)
+            with store.lock.write():
+                if self._get_row_for_write(table_name, store, row_key, existence_only=True) is None:
+                    return {'success': False, 'message': 'Row key does not exist', "data": {}}
 
-            del data['data'][row_key]
-            data['table_metadata']['rows'] = data['table_metadata']['rows'] - 1
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(data, indent=4))
+                future = self._write(table_name, store, [{
+                    "op": "delete_row",
+                    "row": row_key
+                }])
+            if future is not None:
+                if not wait:
+                    return {'success': True, 'message': 'Delete queued successfully', "data": {"future": future}}
+                future.result()
             return {'success': True, 'message': 'Row deleted successfully', "data": {}}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
         
-    def count(self, table_name: str) -> Dict[str, Union[bool, str, dict]]:
+    def count(self, table_name: str, exact: bool = False) -> Dict[str, Union[bool, str, dict]]:
         """
         Count the number of rows in a table
         @param table_name: str
+        @param exact: bool (optional) - read every row in the scan worker processes instead of trusting the row counter of the table, False as default
         @return: dict - {'success': bool, 'message': str, 'data': dict}
         """
         try:
@@ -454,15 +1208,82 @@ class EBase:
                 return {'success': False, 'message': 'Table does not exist', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
+            store = self._store(table_name)
+            if exact:
+                self._flush_pipeline(table_name)
+                res = {
+                    "rows": self.shard_pool.count_rows(store, self.store_options)
+                }
+                return {'success': True, 'message': 'Rows counted successfully', "data": res}
             res = {
-                "rows": data['table_metadata']['rows']
+                "rows": store.metadata['rows']
             }
             return {'success': True, 'message': 'Rows counted successfully', "data": res}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
+
+
+    def aggregate(self, table_name: str, column_family: str, column: str, ops: list[str] = None, filter: Filter = None, group_by: str = None, start_row: str = None, stop_row: str = None, parallel: bool = False) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Aggregate the newest value of a column while the table is scanned, only the results are returned
+        @param table_name: str
+        @param column_family: str
+        @param column: str
+        @param ops: list[str] (optional) - some of count, sum, min, max and avg, every one as default
+        @param filter: Filter (optional) - only rows it keeps are aggregated
+        @param group_by: str (optional) - 'family:column' whose value groups the rows
+        @param start_row: str (optional) - first row key, inclusive
+        @param stop_row: str (optional) - last row key, exclusive
+        @param parallel: bool (optional) - aggregate ranges of the table in the scan worker processes, False as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        """
+        try:
+            start_time = datetime.datetime.now()
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+            ops = list(ops or AGGREGATE_OPS)
+            for op in ops:
+                if op not in AGGREGATE_OPS:
+                    return {'success': False, 'message': f'Aggregation {op} does not exist', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            column_families = store.metadata['column_families']
+            if column_family not in column_families:
+                return {'success': False, 'message': 'Column family does not exist', "data": {}}
+            group_column = None
+            if group_by is not None:
+                group_family, _, group_name = group_by.partition(':')
+                if not group_name:
+                    return {'success': False, 'message': "Group by should be 'family:column'", "data": {}}
+                if group_family not in column_families:
+                    return {'success': False, 'message': 'Group by column family does not exist', "data": {}}
+                group_column = (group_family, group_name)
+
+            aggregate = ColumnAggregate(column_family, column, group_column)
+            if parallel:
+                self._flush_pipeline(table_name)
+                tasks = (
+                    (self.relative_path, table_name, self.store_options, shard_start, shard_stop, ColumnAggregate(column_family, column, group_column), filter)
+                    for shard_start, shard_stop in self.shard_pool.shards(store, start_row, stop_row)
+                )
+                for shard in self.shard_pool.map(aggregate_shard, tasks):
+                    aggregate.merge(shard)
+            else:
+                key_filter = filter.filter_row_key if filter is not None else None
+                aggregate_rows(store.scan_rows(start_row, stop_row, key_filter), aggregate, filter)
+
+            res = {
+                "time_taken": str(datetime.datetime.now() - start_time),
+                "rows": aggregate.rows_matched
+            }
+            if group_column is None:
+                res.update(aggregate.results(ops))
+            else:
+                res["groups"] = aggregate.results(ops)
+            return {'success': True, 'message': 'Column aggregated successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
         
     def truncate(self, table_name: str) -> Dict[str, Union[bool, str, dict]]:
         """
@@ -481,17 +1302,18 @@ class EBase:
                 return disable_res
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                data = json.load(f)
+            store = self._store(table_name)
             
             print("- Truncating table...")
-            data['data'] = {}
-            row_num = data['table_metadata']['rows']
-            data['table_metadata']['rows'] = 0
-            data['table_metadata']['updated_at'] = str(datetime.datetime.now())
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(data, indent=4))
+            self._flush_pipeline(table_name)
+            row_num = store.metadata['rows']
+            store.truncate()
+            for index in self._table_indexes(table_name, store):
+                index.store.truncate()
+            self.row_cache.invalidate_table(table_name)
+            store.update_metadata({
+                "updated_at": str(datetime.datetime.now())
+            })
 
             print("- Enabling table...")
             enable_res = self.enable(table_name)
@@ -506,13 +1328,17 @@ class EBase:
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
     
-    def insert_many(self, table_name: str, column_family: str, data_frame: pd.DataFrame) -> Dict[str, Union[bool, str, dict]]:
+    def insert_many(self, table_name: str, column_family: str, data_frame: pd.DataFrame, return_rows: bool = True) -> Dict[str, Union[bool, str, dict]]:
         """
         Insert many rows into a table
+        Row keys and cells are built column by column and written at once, every cell
+        gets the same timestamp and empty cells are skipped
         @param table_name: str
         @param column_family: str
         @param data_frame: pd.DataFrame
-        @return: dict - {'success': bool, 'message': str, 'data': dict}
+        @param return_rows: bool - return the inserted rows in the response, True as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}, data['inserted_rows'] lists the rows
+            written, in frame order, with their stored str cells; rows whose cells are all empty are not written
         """
         try:
             start_time = datetime.datetime.now()
@@ -523,42 +1349,76 @@ class EBase:
                 return {'success': False, 'message': 'Table is disabled, please enable it first', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                table_data = json.load(f)
-
-            # Serialize data frame
-            for col in data_frame.select_dtypes(include=['int64', 'int32']).columns:
-                data_frame[col] = data_frame[col].astype(str)
-
-            inserted_rows = []
-            for i in range(len(data_frame)):
-                row_key = str(uuid.uuid4())
-                table_data['data'][row_key] = {
-                    column_family: {}
-                }
-                for j in range(len(data_frame.columns)):
-                    if data_frame.iloc[i, j] != "''":
-                        table_data['data'][row_key][column_family][data_frame.columns[j]] = {
-                            str(datetime.datetime.now()): data_frame.iloc[i, j]
-                        }
-                table_data['table_metadata']['rows'] = table_data['table_metadata']['rows'] + 1
-                inserted_rows.append({
-                    "row_key": row_key,
-                    "data": dict(data_frame.iloc[i])
-                })
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(table_data, indent=4))
-            
+            store = self._store(table_name)
+            if column_family not in store.metadata['column_families']:
+                return {'success': False, 'message': 'Column family does not exist', "data": {}}
+
+            cells = frame_cells(data_frame)
+            row_keys, rows = frame_rows(data_frame, column_family, new_timestamp(), cells)
+            inserted = self._load_rows(table_name, store, rows)
+
             res = {
                 "time_taken": str(datetime.datetime.now() - start_time),
-                "number_of_rows_inserted": len(data_frame),
-                "inserted_rows": inserted_rows
+                "number_of_rows_inserted": inserted
             }
+            if return_rows:
+                res["inserted_rows"] = stored_records(row_keys, cells)
             return {'success': True, 'message': 'Data inserted successfully', "data": res}
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
     
+    def import_csv(self, table_name: str, column_family: str, path: str, chunksize: int = 50000, progress: Callable[[dict], None] = None) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Stream a CSV file into a table, one chunk of rows at a time
+        Only one chunk is in memory at once, so files larger than the memory can be imported
+        @param table_name: str
+        @param column_family: str
+        @param path: str - path of the CSV file
+        @param chunksize: int (optional) - rows read and written at once, 50000 as default
+        @param progress: callable (optional) - called after every chunk with the counts so far
+        @return: dict - {'success': bool, 'message': str, 'data': {'rows_read', 'rows_inserted', 'chunks', 'time_taken', 'rows_per_second'}}
+        """
+        try:
+            start_time = datetime.datetime.now()
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+            
+            if not self.is_enabled(table_name)['data']['is_enabled']:
+                return {'success': False, 'message': 'Table is disabled, please enable it first', "data": {}}
+
+            if chunksize < 1:
+                return {'success': False, 'message': 'Chunk size should be greater than 0', "data": {}}
+
+            if not os.path.isfile(path):
+                return {'success': False, 'message': 'File does not exist', "data": {}}
+            
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            if column_family not in store.metadata['column_families']:
+                return {'success': False, 'message': 'Column family does not exist', "data": {}}
+
+            res = {
+                "rows_read": 0,
+                "rows_inserted": 0,
+                "chunks": 0,
+                "time_taken": "0:00:00",
+                "rows_per_second": 0.0
+            }
+            with pd.read_csv(path, chunksize=chunksize) as reader:
+                for chunk in reader:
+                    _, rows = frame_rows(chunk, column_family, new_timestamp())
+                    res["rows_inserted"] += self._load_rows(table_name, store, rows)
+                    res["rows_read"] += len(chunk)
+                    res["chunks"] += 1
+                    elapsed = datetime.datetime.now() - start_time
+                    res["time_taken"] = str(elapsed)
+                    res["rows_per_second"] = res["rows_read"] / max(elapsed.total_seconds(), 1e-6)
+                    if progress is not None:
+                        progress(dict(res))
+            return {'success': True, 'message': 'Data imported successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
     def update_many(self, table_name: str, data:list[dict]) -> Dict[str, Union[bool, str, dict]]:
         """
         Update many rows in a table
@@ -575,32 +1435,38 @@ class EBase:
                 return {'success': False, 'message': 'Table is disabled, please enable it first', "data": {}}
             
             table_name = table_name.replace(' ', '_')
-            table_path = os.path.join(self.relative_path, table_name+'.json')
-            with open(table_path, 'r') as f:
-                table_data = json.load(f)
+            store = self._store(table_name)
 
+            rows = {}
+            mutations = []
             updated_cells = []
-            for i in range(len(data)):
-                if data[i]['row_key'] not in table_data['data']:
-                    return {'success': False, 'message': 'Row key does not exist', "data": {}}
-                if data[i]['column_family'] not in table_data['data'][data[i]['row_key']]:
-                    return {'success': False, 'message': 'Column family does not exist', "data": {}}
-                if data[i]['column'] not in table_data['data'][data[i]['row_key']][data[i]['column_family']]:
-                    return {'success': False, 'message': 'Column does not exist', "data": {}}
-                
-                old_timestamps = list(table_data['data'][data[i]['row_key']][data[i]['column_family']][data[i]['column']].keys())
-                if len(old_timestamps) >= table_data['table_metadata']['max_timestamp']:
-                    old_timestamps.sort()
-                    del table_data['data'][data[i]['row_key']][data[i]['column_family']][data[i]['column']][old_timestamps[0]]
-                table_data['data'][data[i]['row_key']][data[i]['column_family']][data[i]['column']][str(datetime.datetime.now())] = data[i]['value']
-                updated_cells.append({
-                    "row_key": data[i]['row_key'],
-                    "column_family": data[i]['column_family'],
-                    "column": data[i]['column'],
-                    "value": data[i]['value']
-                })
-            with open(table_path, 'w') as f:
-                f.write(json.dumps(table_data, indent=4))
+            with store.lock.write():
+                for i in range(len(data)):
+                    if data[i]['row_key'] not in rows:
+                        rows[data[i]['row_key']] = self._get_row_for_write(table_name, store, data[i]['row_key'])
+                    row = rows[data[i]['row_key']]
+                    if row is None:
+                        return {'success': False, 'message': 'Row key does not exist', "data": {}}
+                    if data[i]['column_family'] not in row:
+                        return {'success': False, 'message': 'Column family does not exist', "data": {}}
+                    if data[i]['column'] not in row[data[i]['column_family']]:
+                        return {'success': False, 'message': 'Column does not exist', "data": {}}
+
+                    mutations.append({
+                        "op": "put",
+                        "row": data[i]['row_key'],
+                        "family": data[i]['column_family'],
+                        "column": data[i]['column'],
+                        "ts": new_timestamp(),
+                        "value": data[i]['value']
+                    })
+                    updated_cells.append({
+                        "row_key": data[i]['row_key'],
+                        "column_family": data[i]['column_family'],
+                        "column": data[i]['column'],
+                        "value": data[i]['value']
+                    })
+                self._apply(table_name, store, mutations)
             res = {
                 "time_taken": str(datetime.datetime.now() - start_time),
                 "number_of_rows_updated": len(data),
@@ -610,6 +1476,108 @@ class EBase:
         except Exception as e:
             return {'success': False, 'message': str(e), "data": {}}
 
+    def batch(self, table_name: str, batch: Batch, wait: bool = True) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Apply the puts and deletes of many rows with a single write
+        Every row is applied all or nothing, a row whose mutations do not fit its content
+        is skipped while the other rows are still written
+        @param table_name: str
+        @param batch: Batch
+        @param wait: bool (optional) - with group commit, wait until the write is done, True as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}, data has the status of every mutation
+        """
+        try:
+            start_time = datetime.datetime.now()
+            if not self.table_exists(table_name)['data']['exists']:
+                return {'success': False, 'message': 'Table does not exist', "data": {}}
+
+            if not self.is_enabled(table_name)['data']['is_enabled']:
+                return {'success': False, 'message': 'Table is disabled, please enable it first', "data": {}}
+
+            table_name = table_name.replace(' ', '_')
+            store = self._store(table_name)
+            column_families = store.metadata['column_families']
+            timestamp = new_timestamp()
+            mutations = []
+            results = []
+            rows = []
+            with store.lock.write():
+                for row_mutations in batch:
+                    row_key = row_mutations.row_key
+                    row = None if row_key is None else self._get_row_for_write(table_name, store, row_key)
+                    error = check_row(row_mutations, row, column_families)
+                    new_row = row_key is None
+                    if new_row and error is None:
+                        row_key = str(uuid.uuid4())
+                    rows.append({"row_key": row_key, "status": "failed" if error else "applied", "message": error or 'Row mutated successfully'})
+                    for mutation in row_mutations.mutations:
+                        results.append({
+                            "row_key": row_key,
+                            "op": mutation['op'],
+                            "column_family": mutation.get('family'),
+                            "column": mutation.get('column'),
+                            "status": "failed" if error else "applied"
+                        })
+                        if error:
+                            continue
+                        if mutation['op'] == DELETE_ROW:
+                            mutations.append({"op": DELETE_ROW, "row": row_key})
+                        elif mutation['op'] == PUT:
+                            mutations.append({
+                                "op": PUT,
+                                "row": row_key,
+                                "family": mutation['family'],
+                                "column": mutation['column'],
+                                "ts": timestamp,
+                                "value": mutation['value'],
+                                "new_row": new_row
+                            })
+                            new_row = False
+                        else:
+                            mutations.append({"op": mutation['op'], "row": row_key, "family": mutation['family'], "column": mutation['column']})
+                future = self._write(table_name, store, mutations) if mutations else None
+
+            failed = sum(1 for row in rows if row['status'] == 'failed')
+            res = {
+                "rows": rows,
+                "mutations": results,
+                "rows_applied": len(rows) - failed,
+                "rows_failed": failed,
+                "time_taken": str(datetime.datetime.now() - start_time)
+            }
+            if future is not None:
+                if not wait:
+                    res["future"] = future
+                else:
+                    future.result()
+            if failed:
+                return {'success': False, 'message': 'Some rows could not be mutated', "data": res}
+            return {'success': True, 'message': 'Batch applied successfully', "data": res}
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def mutate_row(self, table_name: str, row_mutations: RowMutations, wait: bool = True) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Apply the puts and deletes of one row all or nothing with a single write
+        @param table_name: str
+        @param row_mutations: RowMutations - without a row key a new row is created
+        @param wait: bool (optional) - with group commit, wait until the write is done, True as default
+        @return: dict - {'success': bool, 'message': str, 'data': dict}, data has the row key and the status of every mutation
+        """
+        batch = Batch().add(row_mutations)
+        output = self.batch(table_name, batch, wait)
+        if not output['data'].get('rows'):
+            return output
+        row = output['data']['rows'][0]
+        res = {
+            "row_key": row['row_key'],
+            "mutations": output['data']['mutations'],
+            "time_taken": output['data']['time_taken']
+        }
+        if 'future' in output['data']:
+            res["future"] = output['data']['future']
+        return {'success': output['success'], 'message': row['message'], "data": res}
+
 db = EBase()
 
 #prettyPrint(db.list_tables())
@@ -624,7 +1592,7 @@ db = EBase()
 #prettyPrint(db.is_enabled('userss'))
 #prettyPrint(db.put('userss', 'contact', 'phone', '213567123', None))
 #prettyPrint(db.get('users', '7939b322-5cee-4d55-83a4-77c59cdfbc78'))
-#prettyPrint(db.scan('users'))
+#prettyPrint(dict(db.scan('users')['data']['cursor']))
 #prettyPrint(db.delete('users', '96562231-90e3-4f7f-b472-44de8d81b737', 'personal', 'last_name'))
 #prettyPrint(db.delete_all('users', '860e68d0-3083-4740-ac5c-1a3d83280d17'))
 #prettyPrint(db.count('users'))
@@ -0,0 +1,152 @@
+"""
+Aggregations computed while a table is scanned, used by EBase.aggregate
+Rows are read in batches; the newest cell of the aggregated column and of the group column
+of every row of a batch are collected into arrays and reduced with NumPy, so only the running
+count, sum, min and max of every group are kept and the cells are never returned.
+"""
+from typing import Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from filters import Filter
+from scanner import ScanCursor
+from storage_engine import open_store
+
+AGGREGATE_OPS = ('count', 'sum', 'min', 'max', 'avg')
+DEFAULT_AGGREGATE_BATCH_SIZE = 10000
+
+
+def newest_value(row: dict, column_family: str, column: str) -> Union[str, None]:
+    """
+    @return: str - newest version of a cell of a row, None if the row does not have it
+    """
+    cells = row.get(column_family, {}).get(column)
+    if not cells:
+        return None
+    return next(iter(cells.values()))
+
+
+class ColumnAggregate:
+    """
+    Running count, sum, min and max of a column, per value of the group column when grouped
+    count is the number of rows with the cell, the other results only take numeric values
+    """
+    def __init__(self, column_family: str, column: str, group_by: Tuple[str, str] = None) -> None:
+        """
+        @param group_by: tuple (optional) - (family, column) whose value groups the rows
+        """
+        self.column_family = column_family
+        self.column = column
+        self.group_by = group_by
+        self.rows_matched = 0
+        # group -> [count, numeric values, sum, min, max]
+        self.groups: Dict[Union[str, None], list] = {}
+
+    def _add(self, group: Union[str, None], count: int, numeric: int, total: float, minimum: float, maximum: float) -> None:
+        state = self.groups.get(group)
+        if state is None:
+            self.groups[group] = [count, numeric, total, minimum, maximum]
+            return
+        state[0] += count
+        state[1] += numeric
+        state[2] += total
+        state[3] = min(state[3], minimum)
+        state[4] = max(state[4], maximum)
+
+    def add_rows(self, rows: List[Tuple[str, dict]]) -> None:
+        """
+        Aggregate a batch of rows, rows without the cell, or without the group cell when grouped, are skipped
+        """
+        self.rows_matched += len(rows)
+        values = []
+        groups = []
+        for _, row in rows:
+            value = newest_value(row, self.column_family, self.column)
+            if value is None:
+                continue
+            if self.group_by is not None:
+                group = newest_value(row, *self.group_by)
+                if group is None:
+                    continue
+                groups.append(group)
+            values.append(value)
+        if not values:
+            return
+
+        numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+        numeric = ~np.isnan(numbers)
+        if self.group_by is None:
+            found = numbers[numeric]
+            if found.size:
+                self._add(None, len(values), int(found.size), float(found.sum()), float(found.min()), float(found.max()))
+            else:
+                self._add(None, len(values), 0, 0.0, np.inf, -np.inf)
+            return
+
+        names, inverse = np.unique(np.array(groups, dtype=object), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(names))
+        numeric_counts = np.bincount(inverse[numeric], minlength=len(names))
+        sums = np.bincount(inverse[numeric], weights=numbers[numeric], minlength=len(names))
+        minimums = np.full(len(names), np.inf)
+        maximums = np.full(len(names), -np.inf)
+        np.minimum.at(minimums, inverse[numeric], numbers[numeric])
+        np.maximum.at(maximums, inverse[numeric], numbers[numeric])
+        for group, count, numeric_count, total, minimum, maximum in zip(
+            names.tolist(), counts.tolist(), numeric_counts.tolist(), sums.tolist(), minimums.tolist(), maximums.tolist()
+        ):
+            self._add(group, count, numeric_count, total, minimum, maximum)
+
+    def merge(self, other: 'ColumnAggregate') -> None:
+        """
+        Add the partial results of another part of the table, e.g. a shard read by another process
+        """
+        self.rows_matched += other.rows_matched
+        for group, state in other.groups.items():
+            self._add(group, *state)
+
+    @staticmethod
+    def _results(state: list, ops: List[str]) -> dict:
+        count, numeric, total, minimum, maximum = state if state is not None else (0, 0, 0.0, np.inf, -np.inf)
+        results = {
+            "count": count,
+            "sum": total if numeric else None,
+            "min": minimum if numeric else None,
+            "max": maximum if numeric else None,
+            "avg": total / numeric if numeric else None
+        }
+        return {op: results[op] for op in ops}
+
+    def results(self, ops: List[str]) -> dict:
+        """
+        @param ops: list[str] - some of AGGREGATE_OPS
+        @return: dict - {op: value}, or {group: {op: value}} in group order when grouped
+        """
+        if self.group_by is None:
+            return self._results(self.groups.get(None), ops)
+        return {group: self._results(self.groups[group], ops) for group in sorted(self.groups)}
+
+
+def aggregate_rows(rows: Iterator[Tuple[str, dict]], aggregate: ColumnAggregate, row_filter: Filter = None, batch_size: int = DEFAULT_AGGREGATE_BATCH_SIZE) -> ColumnAggregate:
+    """
+    Feed the rows of a scan to an aggregate batch by batch
+    @param rows: iterator of (row_key, row) from TableStore.scan_rows
+    @param row_filter: Filter (optional) - rows it drops are not aggregated
+    """
+    with ScanCursor(rows, batch_size=batch_size, row_filter=row_filter) as cursor:
+        for batch in cursor.batches():
+            aggregate.add_rows(batch)
+    return aggregate
+
+
+def aggregate_shard(base_path: str, table_name: str, store_options: dict, start_row: str, stop_row: str, aggregate: ColumnAggregate, row_filter: Filter = None) -> ColumnAggregate:
+    """
+    Aggregate one shard of a table in a worker process of a parallel aggregation
+    @param aggregate: ColumnAggregate - empty, it is filled and sent back
+    """
+    store = open_store(base_path, table_name, **store_options)
+    try:
+        key_filter = row_filter.filter_row_key if row_filter is not None else None
+        return aggregate_rows(store.scan_rows(start_row, stop_row, key_filter), aggregate, row_filter)
+    finally:
+        store.discard()
@@ -0,0 +1,174 @@
+"""
+asyncio front end of EBase, blocking calls run on a bounded thread pool so the event loop keeps serving
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Tuple, Union
+
+import pandas as pd
+
+from EBase import EBase
+from filters import Filter
+from mutations import Batch, RowMutations
+from scanner import ScanCursor
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class AsyncScanCursor:
+    """
+    Async iteration over a ScanCursor, every batch of rows is read on the executor
+    """
+    def __init__(self, cursor: ScanCursor, run) -> None:
+        self.cursor = cursor
+        self.run = run
+        self.batch = []
+        self.position = 0
+        self.exhausted = False
+
+    def __aiter__(self) -> 'AsyncScanCursor':
+        return self
+
+    async def __anext__(self) -> Tuple[str, dict]:
+        if self.position >= len(self.batch):
+            if self.exhausted:
+                raise StopAsyncIteration
+            self.batch = await self.run(self.cursor.next_batch)
+            self.position = 0
+            if not self.batch:
+                self.exhausted = True
+                raise StopAsyncIteration
+        item = self.batch[self.position]
+        self.position += 1
+        return item
+
+    async def next_batch(self) -> List[Tuple[str, dict]]:
+        """
+        @return: list - next rows of the scan, empty once it is over
+        """
+        if self.position < len(self.batch):
+            rows = self.batch[self.position:]
+            self.batch = []
+            self.position = 0
+            return rows
+        if self.exhausted:
+            return []
+        return await self.run(self.cursor.next_batch)
+
+    @property
+    def rows_returned(self) -> int:
+        return self.cursor.rows_returned
+
+    async def close(self) -> None:
+        self.exhausted = True
+        await self.run(self.cursor.close)
+
+    async def __aenter__(self) -> 'AsyncScanCursor':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+
+class AsyncEBase:
+    """
+    Awaitable EBase, the calls return the same {'success', 'message', 'data'} dicts
+    At most max_workers calls touch the tables at once, the others wait without blocking
+    the loop. Concurrent gets of the same row share one read and receive the same dict.
+    """
+    def __init__(self, db: str = 'root', max_workers: int = DEFAULT_MAX_WORKERS, ebase: EBase = None, **options) -> None:
+        """
+        @param db: str - database name, ignored when ebase is given
+        @param max_workers: int - threads running the blocking calls, 4 as default
+        @param ebase: EBase (optional) - instance to wrap, a new one is opened with the options if not provided
+        @param options: keyword arguments of EBase
+        """
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.ebase = ebase if ebase is not None else EBase(db, **options)
+        self.owns_ebase = ebase is None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ebase-async')
+        self.inflight_gets: Dict[tuple, asyncio.Future] = {}
+        self.merged_gets = 0
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Run a blocking callable on the executor
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    async def get(self, table_name: str, row_key: str, versions: int = None, time_range: tuple = None, columns: List[str] = None) -> Dict[str, Union[bool, str, dict]]:
+        time_range = tuple(time_range) if time_range is not None else None
+        key = (table_name, row_key, versions, time_range, tuple(columns) if columns is not None else None)
+        future = self.inflight_gets.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.run(self.ebase.get, table_name, row_key, versions, time_range, columns))
+            self.inflight_gets[key] = future
+            future.add_done_callback(lambda done: self.inflight_gets.pop(key, None) if self.inflight_gets.get(key) is done else None)
+        else:
+            self.merged_gets += 1
+        # a cancelled caller must not cancel the read the others are waiting for
+        return await asyncio.shield(future)
+
+    async def put(self, table_name: str, column_family: str, column: str, value: str, row_key: str = None) -> Dict[str, Union[bool, str, dict]]:
+        return await self.run(self.ebase.put, table_name, column_family, column, value, row_key)
+
+    async def delete(self, table_name: str, row_key: str, column_family: str, column: str) -> Dict[str, Union[bool, str, dict]]:
+        return await self.run(self.ebase.delete, table_name, row_key, column_family, column)
+
+    async def delete_all(self, table_name: str, row_key: str) -> Dict[str, Union[bool, str, dict]]:
+        return await self.run(self.ebase.delete_all, table_name, row_key)
+
+    async def batch(self, table_name: str, batch: Batch) -> Dict[str, Union[bool, str, dict]]:
+        return await self.run(self.ebase.batch, table_name, batch)
+
+    async def mutate_row(self, table_name: str, row_mutations: RowMutations) -> Dict[str, Union[bool, str, dict]]:
+        return await self.run(self.ebase.mutate_row, table_name, row_mutations)
+
+    async def insert_many(self, table_name: str, column_family: str, data_frame: pd.DataFrame, return_rows: bool = True) -> Dict[str, Union[bool, str, dict]]:
+        return await self.run(self.ebase.insert_many, table_name, column_family, data_frame, return_rows)
+
+    async def count(self, table_name: str, exact: bool = False) -> Dict[str, Union[bool, str, dict]]:
+        return await self.run(self.ebase.count, table_name, exact)
+
+    async def scan(self, table_name: str, start_row: str = None, stop_row: str = None, prefix: str = None, columns: List[str] = None, limit: int = None, batch_size: int = 100, versions: int = None, filter: Filter = None, parallel: bool = False) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Scan the rows of a table, data['cursor'] is an AsyncScanCursor reading batch_size rows per executor call
+        """
+        output = await self.run(
+            self.ebase.scan, table_name, start_row=start_row, stop_row=stop_row, prefix=prefix, columns=columns,
+            limit=limit, batch_size=batch_size, versions=versions, filter=filter, parallel=parallel
+        )
+        if output['success']:
+            output['data']['cursor'] = AsyncScanCursor(output['data']['cursor'], self.run)
+        return output
+
+    def __getattr__(self, name: str):
+        """
+        Every other EBase operation as a coroutine, e.g. await db.create('users', ['personal'])
+        """
+        method = getattr(self.ebase, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return call
+
+    async def close(self) -> None:
+        """
+        Wait for the running calls and close the wrapped EBase if it was opened here
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        if self.owns_ebase:
+            await loop.run_in_executor(None, self.ebase.close)
+
+    async def __aenter__(self) -> 'AsyncEBase':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
@@ -0,0 +1,91 @@
+"""
+Latency of small requests on an event loop while a large scan runs, with EBase called directly and through AsyncEBase
+
+    python benchmarks/async_latency.py
+    python benchmarks/async_latency.py --rows 200000 --storage-engine json
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EBase import EBase
+from async_ebase import AsyncEBase
+
+DATABASE = 'benchmark_async_latency'
+TABLE = 'large'
+TICK = 0.001
+
+
+async def ticker(stop: asyncio.Event, latencies: list) -> None:
+    """
+    Stand-in for the other requests of the service, every tick measures how late the loop ran it
+    """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        latencies.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def blocking_scan(db: EBase) -> int:
+    return sum(1 for _ in db.scan(TABLE)['data']['cursor'])
+
+
+async def async_scan(db: AsyncEBase) -> int:
+    rows = 0
+    async for _ in (await db.scan(TABLE, batch_size=500))['data']['cursor']:
+        rows += 1
+    return rows
+
+
+async def measure(scan) -> tuple:
+    stop = asyncio.Event()
+    latencies = []
+    task = asyncio.create_task(ticker(stop, latencies))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    rows = await scan
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await task
+    return rows, elapsed, np.percentile(latencies, [50, 99]), max(latencies)
+
+
+async def run(db: EBase) -> None:
+    print("{:>10} {:>8} {:>10} {:>12} {:>12} {:>12}".format("mode", "rows", "scan s", "p50 ms", "p99 ms", "max ms"))
+    rows, elapsed, (p50, p99), worst = await measure(blocking_scan(db))
+    print("{:>10} {:>8} {:>10.2f} {:>12.2f} {:>12.2f} {:>12.2f}".format("blocking", rows, elapsed, p50, p99, worst))
+    async_db = AsyncEBase(ebase=db)
+    rows, elapsed, (p50, p99), worst = await measure(async_scan(async_db))
+    print("{:>10} {:>8} {:>10.2f} {:>12.2f} {:>12.2f} {:>12.2f}".format("async", rows, elapsed, p50, p99, worst))
+    await async_db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--storage-engine', default='lsm', choices=['lsm', 'json'])
+    args = parser.parse_args()
+
+    db = EBase(DATABASE, storage_engine=args.storage_engine, background_compaction=False)
+    try:
+        db.create(TABLE, ['cf'])
+        rng = np.random.default_rng(0)
+        frame = pd.DataFrame({f'col{i}': rng.integers(0, 1000, args.rows) for i in range(5)})
+        db.insert_many(TABLE, 'cf', frame, return_rows=False)
+        db.flush(TABLE)
+        asyncio.run(run(db))
+    finally:
+        db.close()
+        shutil.rmtree(db.relative_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
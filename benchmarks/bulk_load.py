@@ -0,0 +1,67 @@
+"""
+Rows per second of EBase.insert_many for data frames of growing size
+
+    python benchmarks/bulk_load.py
+    python benchmarks/bulk_load.py --rows 10000 100000 --columns 8 --storage-engine json
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EBase import EBase
+
+DATABASE = 'benchmark_bulk_load'
+
+
+def make_frame(rows: int, columns: int, empty_ratio: float) -> pd.DataFrame:
+    """
+    Build a frame mixing int and str columns with a share of empty cells
+    """
+    rng = np.random.default_rng(0)
+    frame = {}
+    for i in range(columns):
+        if i % 2:
+            frame[f'col{i}'] = rng.integers(0, 100, rows)
+        else:
+            frame[f'col{i}'] = np.char.add('value', rng.integers(0, 1000, rows).astype(str)).astype(object)
+            frame[f'col{i}'][rng.random(rows) < empty_ratio] = "''"
+    return pd.DataFrame(frame)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--columns', type=int, default=5)
+    parser.add_argument('--empty-ratio', type=float, default=0.1)
+    parser.add_argument('--storage-engine', default='lsm', choices=['lsm', 'json'])
+    args = parser.parse_args()
+
+    db = EBase(DATABASE, storage_engine=args.storage_engine, background_compaction=False)
+    try:
+        print("{:>10} {:>12} {:>14}".format("rows", "seconds", "rows/sec"))
+        for rows in args.rows:
+            frame = make_frame(rows, args.columns, args.empty_ratio)
+            table_name = f'bulk_{rows}'
+            db.create(table_name, ['cf'])
+            start = time.perf_counter()
+            output = db.insert_many(table_name, 'cf', frame, return_rows=False)
+            elapsed = time.perf_counter() - start
+            if not output['success']:
+                raise RuntimeError(output['message'])
+            print("{:>10} {:>12.3f} {:>14,.0f}".format(rows, elapsed, rows / elapsed))
+            db.disable(table_name)
+            db.drop(table_name)
+    finally:
+        db.close()
+        shutil.rmtree(db.relative_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Writers in several threads and processes hammer the same table, then every update is checked to be there
+
+Each writer puts its own columns into one shared row and adds new rows, readers scan and
+get the shared row meanwhile. A lost update shows up as a missing column or a wrong row count.
+
+    python benchmarks/concurrency_stress.py
+    python benchmarks/concurrency_stress.py --threads 16 --processes 4 --operations 200 --storage-engine json
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EBase import EBase
+
+DATABASE = 'benchmark_concurrency'
+TABLE = 'stress'
+
+
+def write(db: EBase, row_key: str, writer: str, operations: int, errors: list) -> None:
+    for i in range(operations):
+        output = db.put(TABLE, 'cf', f'{writer}_{i}', str(i), row_key)
+        if output['success']:
+            output = db.put(TABLE, 'cf', 'writer', writer)
+        if not output['success']:
+            errors.append(output['message'])
+
+
+def read(db: EBase, row_key: str, stop: threading.Event, errors: list, reads: list) -> None:
+    while not stop.is_set():
+        output = db.get(TABLE, row_key)
+        if output['success']:
+            output = db.scan(TABLE, limit=50)
+        if not output['success']:
+            errors.append(output['message'])
+        reads.append(1)
+
+
+def run_process(process: int, row_key: str, threads: int, readers: int, operations: int, options: dict, results=None) -> tuple:
+    """
+    Run the writer and reader threads of one process
+    @return: tuple - (errors, reads)
+    """
+    db = EBase(DATABASE, **options)
+    errors, reads = [], []
+    stop = threading.Event()
+    writers = [
+        threading.Thread(target=write, args=(db, row_key, f'p{process}t{thread}', operations, errors))
+        for thread in range(threads)
+    ]
+    reader_threads = [threading.Thread(target=read, args=(db, row_key, stop, errors, reads)) for _ in range(readers)]
+    for thread in writers + reader_threads:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+    db.close()
+    if results is not None:
+        results.put((errors, len(reads)))
+    return errors, len(reads)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='writer threads per process')
+    parser.add_argument('--readers', type=int, default=2, help='reader threads per process')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--operations', type=int, default=100, help='puts per writer thread')
+    parser.add_argument('--storage-engine', default='lsm', choices=['lsm', 'json'])
+    parser.add_argument('--memstore-flush-size', type=int, default=64 * 1024, help='small to flush and compact while writing')
+    parser.add_argument('--no-compaction', action='store_true', help='disable the background compaction')
+    args = parser.parse_args()
+
+    options = {"memstore_flush_size": args.memstore_flush_size, "background_compaction": not args.no_compaction}
+    db = EBase(DATABASE, storage_engine=args.storage_engine, **options)
+    try:
+        db.create(TABLE, ['cf'])
+        row_key = db.put(TABLE, 'cf', 'shared', 'yes')['data']['row_key']
+        # the other processes open the table themselves
+        db.close()
+
+        start = time.perf_counter()
+        results = multiprocessing.get_context('spawn').Queue()
+        processes = [
+            multiprocessing.get_context('spawn').Process(
+                target=run_process, args=(process, row_key, args.threads, args.readers, args.operations, options, results)
+            )
+            for process in range(1, args.processes)
+        ]
+        for process in processes:
+            process.start()
+        errors, reads = run_process(0, row_key, args.threads, args.readers, args.operations, options)
+        for _ in processes:
+            process_errors, process_reads = results.get()
+            errors += process_errors
+            reads += process_reads
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        db = EBase(DATABASE, **options)
+        writers = args.processes * args.threads
+        expected_columns = writers * args.operations + 1
+        expected_rows = writers * args.operations + 1
+        columns = len(db.get(TABLE, row_key)['data']['data']['cf'])
+        rows = db.count(TABLE)['data']['rows']
+        scanned = sum(1 for _ in db.scan(TABLE)['data']['cursor'])
+        lost = (expected_columns - columns) + (expected_rows - rows) + (expected_rows - scanned)
+
+        print(f"{writers} writers, {args.processes * args.readers} readers, {2 * writers * args.operations} puts, {reads} reads in {elapsed:.2f}s")
+        print(f"columns of the shared row: {columns}/{expected_columns}")
+        print(f"rows counted: {rows}/{expected_rows}, rows scanned: {scanned}/{expected_rows}")
+        print(f"errors: {len(errors)}{' (' + errors[0] + ')' if errors else ''}")
+        print("no lost updates" if not lost and not errors else "LOST UPDATES")
+        if lost or errors:
+            sys.exit(1)
+    finally:
+        db.close()
+        shutil.rmtree(db.relative_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
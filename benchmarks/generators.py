@@ -0,0 +1,114 @@
+"""
+Synthetic tables for the benchmarks, rows x families x columns x versions
+
+Cells of the first family are written with EBase.insert_many, the other families and every
+extra version with EBase.batch, so a table is built in a few large writes. Values come from a
+seeded generator: the same arguments always build the same cells.
+"""
+import os
+import sys
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EBase import EBase
+from mutations import Batch, RowMutations
+
+BATCH_ROWS = 5000
+
+
+class TableSpec:
+    """
+    Shape of a synthetic table
+    """
+    def __init__(self, rows: int, families: int = 1, columns: int = 4, versions: int = 1, seed: int = 0) -> None:
+        """
+        @param rows: int - rows of the table
+        @param families: int - column families, named cf0, cf1...
+        @param columns: int - columns of every family, named col0, col1...
+        @param versions: int - versions of every cell
+        @param seed: int - seed of the values
+        """
+        if rows < 0 or families < 1 or columns < 1 or versions < 1:
+            raise ValueError('rows must be positive, families, columns and versions at least 1')
+        self.rows = rows
+        self.families = families
+        self.columns = columns
+        self.versions = versions
+        self.seed = seed
+
+    @property
+    def family_names(self) -> List[str]:
+        return [f'cf{i}' for i in range(self.families)]
+
+    @property
+    def column_names(self) -> List[str]:
+        return [f'col{i}' for i in range(self.columns)]
+
+    @property
+    def cells(self) -> int:
+        return self.rows * self.families * self.columns * self.versions
+
+    def to_dict(self) -> dict:
+        return {"rows": self.rows, "families": self.families, "columns": self.columns, "versions": self.versions, "seed": self.seed}
+
+
+def make_frame(rows: int, columns: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a frame of str values with about 1000 distinct values per column
+    """
+    rng = np.random.default_rng(seed)
+    frame = {}
+    for i in range(columns):
+        frame[f'col{i}'] = np.char.add('value', rng.integers(0, 1000, rows).astype(str)).astype(object)
+    return pd.DataFrame(frame)
+
+
+def _check(output: dict) -> dict:
+    if not output['success']:
+        raise RuntimeError(output['message'])
+    return output
+
+
+def fill_table(db: EBase, table_name: str, spec: TableSpec) -> List[str]:
+    """
+    Write the rows of a spec into an existing table with its families
+    @return: list[str] - keys of the new rows, in insertion order
+    """
+    if spec.rows == 0:
+        return []
+    families = spec.family_names
+    frame = make_frame(spec.rows, spec.columns, spec.seed)
+    output = _check(db.insert_many(table_name, families[0], frame))
+    row_keys = [row['row_key'] for row in output['data']['inserted_rows']]
+
+    # (family, version) pairs left to write, the first version of the first family is already there
+    writes = [(family, version) for version in range(spec.versions) for family in families if (family, version) != (families[0], 0)]
+    for family, version in writes:
+        frame = make_frame(spec.rows, spec.columns, spec.seed + 1 + version * spec.families + families.index(family))
+        values = frame.to_numpy()
+        for start in range(0, spec.rows, BATCH_ROWS):
+            batch = Batch()
+            for i in range(start, min(start + BATCH_ROWS, spec.rows)):
+                row = RowMutations(row_keys[i])
+                for j, column in enumerate(spec.column_names):
+                    row.put(family, column, values[i][j])
+                batch.add(row)
+            _check(db.batch(table_name, batch))
+    return row_keys
+
+
+def build_table(db: EBase, table_name: str, spec: TableSpec, **create_options) -> List[str]:
+    """
+    Create a table, dropping it first if it exists, and fill it with the rows of a spec
+    @param create_options: options forwarded to EBase.create
+    @return: list[str] - keys of the rows
+    """
+    if db.table_exists(table_name)['data']['exists']:
+        db.disable(table_name)
+        _check(db.drop(table_name))
+    _check(db.create(table_name, spec.family_names, max_timestamp=spec.versions, **create_options))
+    return fill_table(db, table_name, spec)
@@ -0,0 +1,86 @@
+"""
+Speedup of parallel scans and exact counts with 1, 2, 4 and 8 worker processes
+
+    python benchmarks/parallel_scan.py
+    python benchmarks/parallel_scan.py --rows 500000 --workers 1 2 4 --storage-engine json
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EBase import EBase
+from filters import SingleColumnValueFilter
+
+DATABASE = 'benchmark_parallel_scan'
+TABLE = 'events'
+
+
+def make_frame(rows: int, columns: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    frame = {}
+    for i in range(columns):
+        frame[f'col{i}'] = np.char.add('value', rng.integers(0, 1000, rows).astype(str)).astype(object)
+    return pd.DataFrame(frame)
+
+
+def timed(function) -> tuple:
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def scan_rows(db: EBase, parallel: bool, row_filter=None) -> int:
+    output = db.scan(TABLE, batch_size=10000, filter=row_filter, parallel=parallel)
+    if not output['success']:
+        raise RuntimeError(output['message'])
+    return sum(len(batch) for batch in output['data']['cursor'].batches())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--columns', type=int, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--storage-engine', default='lsm', choices=['lsm', 'json'])
+    parser.add_argument('--region-split-size', type=int, default=None, help='split the table into regions of this many bytes')
+    args = parser.parse_args()
+
+    db = EBase(DATABASE, storage_engine=args.storage_engine, background_compaction=False, scan_workers=1)
+    try:
+        db.create(TABLE, ['cf'], region_split_size=args.region_split_size)
+        output = db.insert_many(TABLE, 'cf', make_frame(args.rows, args.columns), return_rows=False)
+        if not output['success']:
+            raise RuntimeError(output['message'])
+        db.flush(TABLE)
+        row_filter = SingleColumnValueFilter('cf', 'col0', '=', 'value7')
+
+        rows, serial_scan = timed(lambda: scan_rows(db, False))
+        matches, serial_filter = timed(lambda: scan_rows(db, False, row_filter))
+        print(f"{rows} rows, single-threaded scan {serial_scan:.3f} s, filtered scan ({matches} rows) {serial_filter:.3f} s")
+        print("{:>8} {:>10} {:>9} {:>14} {:>9} {:>12} {:>9}".format(
+            "workers", "scan s", "speedup", "filtered s", "speedup", "count s", "rows"))
+        for workers in args.workers:
+            db.shard_pool.close()
+            db.shard_pool.workers = workers
+            db.count(TABLE, exact=True)  # start the worker processes
+            scanned, scan_time = timed(lambda: scan_rows(db, True))
+            filtered, filter_time = timed(lambda: scan_rows(db, True, row_filter))
+            output, count_time = timed(lambda: db.count(TABLE, exact=True))
+            if scanned != rows or filtered != matches or output['data']['rows'] != rows:
+                raise RuntimeError(f'{workers} workers returned {scanned}/{filtered}/{output["data"]["rows"]} rows')
+            print("{:>8} {:>10.3f} {:>8.2f}x {:>14.3f} {:>8.2f}x {:>12.3f} {:>9}".format(
+                workers, scan_time, serial_scan / scan_time, filter_time, serial_filter / filter_time, count_time, output['data']['rows']))
+    finally:
+        db.close()
+        shutil.rmtree(db.relative_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
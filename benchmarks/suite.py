@@ -0,0 +1,331 @@
+"""
+Benchmark suite of the EBase operations, with results saved as JSON to compare commits
+
+Every table size of --rows gets a synthetic table (benchmarks/generators.py) on which the scenarios run:
+
+    put          latency of single-cell puts to random existing rows
+    get          latency of gets of existing rows (hit) and of unknown keys (miss)
+    scan         duration and rows per second of full scans
+    insert_many  rows per second of bulk inserts into an empty table
+    update_many  rows per second of updates of existing cells
+    truncate     duration of truncating the table, refilled between samples
+    mixed        gets, puts and short scans from several threads at once, on the largest table
+
+Latencies are reported as p50/p95/p99 in milliseconds. Results are written to
+benchmarks/results/<date>-<commit>.json; --compare prints the change of every p50 and p99 against
+an earlier results file and exits with status 1 when some got slower than --threshold.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --rows 1000 10000 --families 3 --versions 3 --scenarios put get scan
+    python benchmarks/suite.py --storage-engine json --compare benchmarks/results/20260101-120000-abc1234.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import random
+import argparse
+import platform
+import datetime
+import threading
+import subprocess
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EBase import EBase
+from generators import TableSpec, build_table, fill_table, make_frame
+
+DATABASE = 'benchmark_suite'
+TABLE = 'bench'
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SCENARIOS = ['put', 'get', 'scan', 'insert_many', 'update_many', 'truncate', 'mixed']
+# share of gets, puts and scans of the mixed workload
+MIXED_WEIGHTS = {'get': 0.6, 'put': 0.3, 'scan': 0.1}
+MIXED_SCAN_LIMIT = 100
+
+
+def check(output: dict) -> dict:
+    if not output['success']:
+        raise RuntimeError(output['message'])
+    return output
+
+
+def timed(function: Callable) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def summarize(durations: List[float], rows: int = None) -> dict:
+    """
+    @param durations: list[float] - seconds taken by every sample
+    @param rows: int (optional) - rows handled by every sample, to report rows per second
+    @return: dict - samples, p50/p95/p99/mean in ms and operations (or rows) per second
+    """
+    milliseconds = np.array(durations) * 1000
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    summary = {
+        "samples": len(durations),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "mean_ms": round(float(milliseconds.mean()), 4),
+        "ops_per_s": round(len(durations) / sum(durations), 2) if sum(durations) else None
+    }
+    if rows is not None:
+        summary["rows_per_s"] = round(rows / (p50 / 1000), 2) if p50 else None
+    return summary
+
+
+def bench_put(db: EBase, spec: TableSpec, row_keys: List[str], args: argparse.Namespace) -> Dict[str, dict]:
+    rng = random.Random(spec.seed)
+    durations = []
+    for i in range(args.operations):
+        row_key = rng.choice(row_keys)
+        durations.append(timed(lambda: check(db.put(TABLE, 'cf0', 'col0', f'put{i}', row_key))))
+    return {"put": summarize(durations)}
+
+
+def bench_get(db: EBase, spec: TableSpec, row_keys: List[str], args: argparse.Namespace) -> Dict[str, dict]:
+    rng = random.Random(spec.seed)
+    hits = []
+    misses = []
+    for _ in range(args.operations):
+        row_key = rng.choice(row_keys)
+        hits.append(timed(lambda: check(db.get(TABLE, row_key))))
+        missing = str(uuid.UUID(int=rng.getrandbits(128)))
+        misses.append(timed(lambda: db.get(TABLE, missing)))
+    return {"get_hit": summarize(hits), "get_miss": summarize(misses)}
+
+
+def scan_all(db: EBase) -> int:
+    output = check(db.scan(TABLE, batch_size=10000))
+    return sum(len(batch) for batch in output['data']['cursor'].batches())
+
+
+def bench_scan(db: EBase, spec: TableSpec, row_keys: List[str], args: argparse.Namespace) -> Dict[str, dict]:
+    durations = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        rows = scan_all(db)
+        durations.append(time.perf_counter() - start)
+        if rows != spec.rows:
+            raise RuntimeError(f'scan returned {rows} rows out of {spec.rows}')
+    return {"scan": summarize(durations, spec.rows)}
+
+
+def bench_insert_many(db: EBase, spec: TableSpec, row_keys: List[str], args: argparse.Namespace) -> Dict[str, dict]:
+    table_name = f'{TABLE}_insert'
+    frame = make_frame(spec.rows, spec.columns, spec.seed)
+    durations = []
+    for _ in range(args.repeat):
+        build_table(db, table_name, TableSpec(0, spec.families, spec.columns, spec.versions, spec.seed), **args.create_options)
+        durations.append(timed(lambda: check(db.insert_many(table_name, 'cf0', frame, return_rows=False))))
+    db.disable(table_name)
+    check(db.drop(table_name))
+    return {"insert_many": summarize(durations, spec.rows)}
+
+
+def bench_update_many(db: EBase, spec: TableSpec, row_keys: List[str], args: argparse.Namespace) -> Dict[str, dict]:
+    durations = []
+    for repetition in range(args.repeat):
+        data = [
+            {'row_key': row_key, 'column_family': 'cf0', 'column': 'col0', 'value': f'update{repetition}'}
+            for row_key in row_keys
+        ]
+        durations.append(timed(lambda: check(db.update_many(TABLE, data))))
+    return {"update_many": summarize(durations, spec.rows)}
+
+
+def bench_truncate(db: EBase, spec: TableSpec, row_keys: List[str], args: argparse.Namespace) -> Dict[str, dict]:
+    durations = []
+    for repetition in range(args.repeat):
+        if repetition:
+            fill_table(db, TABLE, spec)
+            db.flush(TABLE)
+        durations.append(timed(lambda: check(db.truncate(TABLE))))
+    return {"truncate": summarize(durations, spec.rows)}
+
+
+def mixed_worker(db: EBase, row_keys: List[str], seed: int, deadline: float, latencies: Dict[str, list], errors: list) -> None:
+    rng = random.Random(seed)
+    operations = list(MIXED_WEIGHTS)
+    weights = list(MIXED_WEIGHTS.values())
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        row_key = rng.choice(row_keys)
+        start = time.perf_counter()
+        if operation == 'get':
+            output = db.get(TABLE, row_key)
+        elif operation == 'put':
+            output = db.put(TABLE, 'cf0', 'col1', str(seed), row_key)
+        else:
+            output = db.scan(TABLE, start_row=row_key, limit=MIXED_SCAN_LIMIT)
+            if output['success']:
+                sum(1 for _ in output['data']['cursor'])
+        latencies[operation].append(time.perf_counter() - start)
+        if not output['success']:
+            errors.append(output['message'])
+
+
+def bench_mixed(db: EBase, spec: TableSpec, row_keys: List[str], args: argparse.Namespace) -> Dict[str, dict]:
+    latencies = {operation: [] for operation in MIXED_WEIGHTS}
+    errors = []
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=mixed_worker, args=(db, row_keys, spec.seed + i, deadline, latencies, errors))
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise RuntimeError(f'{len(errors)} operations failed, first error: {errors[0]}')
+
+    results = {f"mixed_{operation}": summarize(durations) for operation, durations in latencies.items() if durations}
+    total = sum(len(durations) for durations in latencies.values())
+    results["mixed"] = {"threads": args.threads, "operations": total, "ops_per_s": round(total / args.duration, 2)}
+    return results
+
+
+BENCHMARKS = {
+    'put': bench_put,
+    'get': bench_get,
+    'scan': bench_scan,
+    'insert_many': bench_insert_many,
+    'update_many': bench_update_many,
+    'truncate': bench_truncate,
+    'mixed': bench_mixed
+}
+
+
+def git_commit() -> dict:
+    """
+    @return: dict - commit of the tree being measured and whether it had uncommitted changes, None outside a git checkout
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root, capture_output=True, text=True, check=True).stdout
+        return {"commit": commit, "dirty": bool(status.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def run(args: argparse.Namespace) -> dict:
+    db = EBase(DATABASE, storage_engine=args.storage_engine, background_compaction=False, row_cache_size=args.row_cache_size, scan_workers=1)
+    results = {}
+    try:
+        sizes = sorted(args.rows)
+        for rows in sizes:
+            spec = TableSpec(rows, args.families, args.columns, args.versions)
+            start = time.perf_counter()
+            row_keys = build_table(db, TABLE, spec, **args.create_options)
+            db.flush(TABLE)
+            print(f"table of {rows} rows x {spec.families} families x {spec.columns} columns x {spec.versions} versions built in {time.perf_counter() - start:.2f} s")
+            # truncate empties the table, so it runs last
+            scenarios = [scenario for scenario in SCENARIOS if scenario in args.scenarios and scenario != 'truncate']
+            if 'mixed' in scenarios and rows != sizes[-1]:
+                scenarios.remove('mixed')
+            if 'truncate' in args.scenarios:
+                scenarios.append('truncate')
+            for scenario in scenarios:
+                for name, summary in BENCHMARKS[scenario](db, spec, row_keys, args).items():
+                    results[f'{name}/rows={rows}'] = summary
+                    print_result(f'{name}/rows={rows}', summary)
+    finally:
+        db.close()
+        shutil.rmtree(db.relative_path, ignore_errors=True)
+    return results
+
+
+def print_result(name: str, summary: dict) -> None:
+    if "p50_ms" not in summary:
+        print("  {:<28} {:>10} ops/s with {} threads".format(name, summary["ops_per_s"], summary["threads"]))
+        return
+    rate = f'{summary["rows_per_s"]:>12} rows/s' if summary.get("rows_per_s") is not None else ''
+    print("  {:<28} p50 {:>10.3f} ms  p95 {:>10.3f} ms  p99 {:>10.3f} ms  {}".format(
+        name, summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], rate).rstrip())
+
+
+def compare(results: dict, results_config: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Print the change of the latencies of every result also in the baseline, and the options both runs differ in
+    @param threshold: float - relative slowdown, e.g. 0.1 for 10%, above which a latency is a regression
+    @return: list[str] - the regressions, as 'result p50_ms'
+    """
+    regressions = []
+    print(f"compared with {baseline['git']['commit']} ({baseline['created_at']})")
+    for key, value in baseline['config'].items():
+        if key != 'threshold' and results_config.get(key) != value:
+            print(f"  warning: {key} was {value}, now {results_config.get(key)}")
+    for name, summary in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None or "p50_ms" not in summary:
+            continue
+        changes = []
+        for metric in ("p50_ms", "p99_ms"):
+            if not previous[metric]:
+                continue
+            change = summary[metric] / previous[metric] - 1
+            if change > threshold:
+                regressions.append(f'{name} {metric}')
+            changes.append(f'{metric} {previous[metric]:.3f} -> {summary[metric]:.3f} ({change:+.1%})')
+        print("  {:<28} {}{}".format(name, '  '.join(changes), '  REGRESSION' if any(r.startswith(f'{name} ') for r in regressions) else ''))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 5000, 20000], help='table sizes')
+    parser.add_argument('--families', type=int, default=2)
+    parser.add_argument('--columns', type=int, default=4, help='columns per family')
+    parser.add_argument('--versions', type=int, default=2, help='versions per cell')
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument('--operations', type=int, default=1000, help='samples of the put and get latencies')
+    parser.add_argument('--repeat', type=int, default=5, help='samples of the scan, insert_many, update_many and truncate durations')
+    parser.add_argument('--threads', type=int, default=4, help='threads of the mixed workload')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds the mixed workload runs')
+    parser.add_argument('--storage-engine', default='lsm', choices=['lsm', 'json'])
+    parser.add_argument('--cell-format', default=None, choices=['json', 'binary'])
+    parser.add_argument('--region-split-size', type=int, default=None, help='split the tables into regions of this many bytes')
+    parser.add_argument('--row-cache-size', type=int, default=0, help='bytes of the row cache, off as default so gets read the store')
+    parser.add_argument('--output', default=None, help='results file, benchmarks/results/<date>-<commit>.json as default')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression by --compare')
+    args = parser.parse_args()
+    args.create_options = {"cell_format": args.cell_format, "region_split_size": args.region_split_size}
+
+    created_at = datetime.datetime.now()
+    results = run(args)
+    git = git_commit()
+    report = {
+        "created_at": str(created_at),
+        "git": git,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'create_options')},
+        "results": results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{created_at:%Y%m%d-%H%M%S}-{git['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, report['config'], json.load(file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
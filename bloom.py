@@ -0,0 +1,118 @@
+"""
+Bloom filters over the row keys of a segment file
+"""
+import math
+import hashlib
+from array import array
+from typing import Tuple, Union
+
+import numpy as np
+
+DEFAULT_BLOOM_FALSE_POSITIVE_RATE = 0.01
+HASH_MASK = (1 << 64) - 1
+
+
+def key_hashes(row_key: str) -> Tuple[int, int]:
+    """
+    Two independent 64 bit hashes of a row key, stable across processes
+    @param row_key: str
+    @return: tuple - (h1, h2), h2 is odd
+    """
+    digest = hashlib.blake2b(row_key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+def bloom_size(keys: int, false_positive_rate: float) -> Tuple[int, int]:
+    """
+    Number of bits and hash functions of a filter
+    @param keys: int - number of keys it will hold
+    @param false_positive_rate: float - target rate of false positives
+    @return: tuple - (num_bits, num_hashes)
+    """
+    num_bits = max(8, math.ceil(-keys * math.log(false_positive_rate) / math.log(2) ** 2))
+    num_hashes = max(1, round(num_bits / max(keys, 1) * math.log(2)))
+    return num_bits, num_hashes
+
+
+class BloomBuilder:
+    """
+    Collects the hashes of the keys written to a segment and builds the filter once they are all known
+    """
+    def __init__(self, false_positive_rate: float = DEFAULT_BLOOM_FALSE_POSITIVE_RATE) -> None:
+        self.false_positive_rate = false_positive_rate
+        self.h1 = array('Q')
+        self.h2 = array('Q')
+
+    def add(self, row_key: str) -> None:
+        h1, h2 = key_hashes(row_key)
+        self.h1.append(h1)
+        self.h2.append(h2)
+
+    def build(self) -> Tuple[bytes, dict]:
+        """
+        @return: tuple - (filter bits, {'num_bits', 'num_hashes', 'keys', 'false_positive_rate'})
+        """
+        keys = len(self.h1)
+        num_bits, num_hashes = bloom_size(keys, self.false_positive_rate)
+        bits = np.zeros(num_bits, dtype=bool)
+        h1 = np.frombuffer(self.h1, dtype=np.uint64)
+        h2 = np.frombuffer(self.h2, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for i in range(num_hashes):
+                bits[(h1 + np.uint64(i) * h2) % np.uint64(num_bits)] = True
+        info = {
+            "num_bits": num_bits,
+            "num_hashes": num_hashes,
+            "keys": keys,
+            "false_positive_rate": self.false_positive_rate
+        }
+        return np.packbits(bits, bitorder='little').tobytes(), info
+
+
+class BloomFilter:
+    """
+    Read side of a filter whose bits live in a buffer, usually the memory map of the segment
+    """
+    def __init__(self, data: Union[bytes, memoryview], offset: int, num_bits: int, num_hashes: int, keys: int, false_positive_rate: float) -> None:
+        self.data = data
+        self.offset = offset
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.keys = keys
+        self.false_positive_rate = false_positive_rate
+        self.checks = 0
+        self.negatives = 0
+        self.false_positives = 0
+
+    def might_contain(self, row_key: str) -> bool:
+        """
+        @return: bool - False if the key is certainly not in the segment
+        """
+        self.checks += 1
+        h1, h2 = key_hashes(row_key)
+        for i in range(self.num_hashes):
+            position = ((h1 + i * h2) & HASH_MASK) % self.num_bits
+            if not self.data[self.offset + (position >> 3)] & (1 << (position & 7)):
+                self.negatives += 1
+                return False
+        return True
+
+    def expected_false_positive_rate(self) -> float:
+        if not self.keys:
+            return 0.0
+        return (1 - math.exp(-self.num_hashes * self.keys / self.num_bits)) ** self.num_hashes
+
+    def stats(self) -> dict:
+        absent = self.negatives + self.false_positives
+        return {
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "keys": self.keys,
+            "size": (self.num_bits + 7) // 8,
+            "false_positive_rate": self.false_positive_rate,
+            "expected_false_positive_rate": self.expected_false_positive_rate(),
+            "checks": self.checks,
+            "negatives": self.negatives,
+            "false_positives": self.false_positives,
+            "observed_false_positive_rate": self.false_positives / absent if absent else 0.0
+        }
@@ -0,0 +1,81 @@
+"""
+Column-wise conversion of data frames into table rows, used by EBase.insert_many
+"""
+import os
+from typing import Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+UUID_HEX_POSITIONS = [position for position in range(36) if position not in (8, 13, 18, 23)]
+EMPTY_VALUES = ("''", '')
+
+
+def uuid4_keys(count: int) -> np.ndarray:
+    """
+    Generate random version 4 UUIDs at once, formatted like str(uuid.uuid4())
+    @param count: int
+    @return: np.ndarray - array of str
+    """
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0f) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3f) | 0x80
+    digits = np.empty((count, 32), dtype=np.uint8)
+    digits[:, 0::2] = HEX_DIGITS[raw >> 4]
+    digits[:, 1::2] = HEX_DIGITS[raw & 0x0f]
+    text = np.full((count, 36), ord('-'), dtype=np.uint8)
+    text[:, UUID_HEX_POSITIONS] = digits
+    return np.frombuffer(text.tobytes(), dtype='S36').astype('U36')
+
+
+def frame_cells(data_frame: pd.DataFrame) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Serialize the cells of a data frame column by column
+    @param data_frame: pd.DataFrame
+    @return: tuple - (column names, values as an array of str, mask of the non empty cells)
+    """
+    columns = [str(column) for column in data_frame.columns]
+    values = data_frame.astype(str).to_numpy(dtype=object)
+    mask = data_frame.notna().to_numpy() & ~np.isin(values, EMPTY_VALUES)
+    return columns, values, mask
+
+
+def frame_rows(data_frame: pd.DataFrame, column_family: str, timestamp: int, cells: Tuple[List[str], np.ndarray, np.ndarray] = None) -> Tuple[np.ndarray, Iterator[Tuple[str, dict]]]:
+    """
+    Turn every row of a data frame into a new table row with a generated row key
+    Every cell gets the same timestamp and empty cells are skipped, rows without a
+    cell are not stored. Rows come out sorted by row key, ready for TableStore.load_rows
+    @param data_frame: pd.DataFrame
+    @param column_family: str
+    @param timestamp: int - timestamp of every cell, from new_timestamp
+    @param cells: tuple (optional) - frame_cells of the data frame, when the caller already has them
+    @return: tuple - (row keys in the order of the data frame, iterator of (row_key, row) sorted by row key)
+    """
+    row_keys = uuid4_keys(len(data_frame))
+    columns, values, mask = cells if cells is not None else frame_cells(data_frame)
+    order = np.argsort(row_keys)
+
+    def rows() -> Iterator[Tuple[str, dict]]:
+        for row_key, row_values, row_mask in zip(row_keys[order].tolist(), values[order].tolist(), mask[order].tolist()):
+            cells = {column: {timestamp: value} for column, value, keep in zip(columns, row_values, row_mask) if keep}
+            if cells:
+                yield row_key, {column_family: cells}
+
+    return row_keys, rows()
+
+
+def stored_records(row_keys: np.ndarray, cells: Tuple[List[str], np.ndarray, np.ndarray]) -> List[dict]:
+    """
+    Rows of a data frame as frame_rows stores them, in the order of the data frame
+    @param row_keys: np.ndarray - row keys from frame_rows
+    @param cells: tuple - frame_cells of the data frame
+    @return: list[dict] - [{'row_key': str, 'data': {column: str}}], rows without a cell are left out
+    """
+    columns, values, mask = cells
+    records = []
+    for row_key, row_values, row_mask in zip(row_keys.tolist(), values.tolist(), mask.tolist()):
+        data = {column: value for column, value, keep in zip(columns, row_values, row_mask) if keep}
+        if data:
+            records.append({"row_key": row_key, "data": data})
+    return records
@@ -0,0 +1,127 @@
+"""
+LRU cache of table rows shared by every table of an EBase instance
+"""
+import threading
+from collections import OrderedDict
+from typing import Hashable, Tuple, Union
+
+DEFAULT_ROW_CACHE_SIZE = 64 * 1024 * 1024
+ENTRY_OVERHEAD = 64
+
+
+def row_size(row: dict) -> int:
+    """
+    Approximate the memory used by a row
+    @param row: dict - {family: {column: {timestamp: value}}}
+    @return: int - size in bytes
+    """
+    size = ENTRY_OVERHEAD
+    for family, columns in row.items():
+        size += ENTRY_OVERHEAD + len(family)
+        for column, versions in columns.items():
+            size += ENTRY_OVERHEAD + len(column)
+            for timestamp, value in versions.items():
+                size += ENTRY_OVERHEAD + len(str(timestamp)) + len(str(value))
+    return size
+
+
+class RowCache:
+    """
+    Rows keyed by (table, row_key), evicted least recently used first once the byte budget is exceeded
+    Every entry remembers the generation of its table when it was cached, an entry read
+    with another generation is a miss, so a table changed by someone else is never served stale
+    """
+    def __init__(self, capacity: int = DEFAULT_ROW_CACHE_SIZE) -> None:
+        """
+        @param capacity: int - byte budget, 0 disables the cache
+        """
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.tables = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, table_name: str, row_key: str, generation: Hashable = None) -> Tuple[bool, Union[dict, None]]:
+        """
+        Look a row up
+        @param table_name: str
+        @param row_key: str
+        @param generation: hashable (optional) - current generation of the table
+        @return: tuple - (True, row) on a hit, (False, None) on a miss
+        """
+        with self.lock:
+            entry = self.entries.get((table_name, row_key))
+            if entry is None or entry[2] != generation:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end((table_name, row_key))
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, table_name: str, row_key: str, row: dict, generation: Hashable = None) -> None:
+        """
+        Cache a row, evicting the least recently used rows if needed
+        @param table_name: str
+        @param row_key: str
+        @param row: dict
+        @param generation: hashable (optional) - generation of the table the row was read at
+        """
+        size = row_size(row)
+        if size > self.capacity:
+            return
+        with self.lock:
+            self._remove((table_name, row_key))
+            self.entries[(table_name, row_key)] = (row, size, generation)
+            self.tables.setdefault(table_name, set()).add(row_key)
+            self.size += size
+            while self.size > self.capacity:
+                key, _ = next(iter(self.entries.items()))
+                self._remove(key)
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str]) -> bool:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.size -= entry[1]
+        row_keys = self.tables[key[0]]
+        row_keys.discard(key[1])
+        if not row_keys:
+            del self.tables[key[0]]
+        return True
+
+    def invalidate(self, table_name: str, row_key: str) -> None:
+        with self.lock:
+            if self._remove((table_name, row_key)):
+                self.invalidations += 1
+
+    def invalidate_table(self, table_name: str) -> None:
+        with self.lock:
+            for row_key in list(self.tables.get(table_name, ())):
+                self._remove((table_name, row_key))
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.tables.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "capacity": self.capacity,
+                "size": self.size,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,111 @@
+"""
+In-process catalog of the tables of a database
+"""
+import os
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from storage_engine import TableStore, open_store, table_file_name
+
+
+class TableCatalog:
+    """
+    Keeps the table names of a database and the open storage engine of every table in memory
+    The names are listed again when the inode or mtime of the database directory changes or
+    when the generation counter is bumped by invalidate, so existence checks are dict lookups
+    """
+    def __init__(self, base_path: str, store_options: dict, on_open: Callable[[TableStore], None] = None) -> None:
+        """
+        @param base_path: str - database directory
+        @param store_options: dict - options forwarded to the lsm engine
+        @param on_open: callable (optional) - called with every store the catalog opens or adds
+        """
+        self.base_path = base_path
+        self.store_options = store_options
+        self.on_open = on_open
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.names = set()
+        self.stores: Dict[str, TableStore] = {}
+        self.signature = None
+        self.loaded_generation = -1
+
+    def _directory_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.base_path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh(self) -> None:
+        signature = self._directory_signature()
+        if signature == self.signature and self.loaded_generation == self.generation:
+            return
+        names = set()
+        for entry in os.listdir(self.base_path):
+            table_name = table_file_name(entry, self.base_path)
+            if table_name is not None:
+                names.add(table_name)
+        for table_name in list(self.stores):
+            if table_name not in names:
+                self.stores.pop(table_name).discard()
+        self.names = names
+        self.signature = signature
+        self.loaded_generation = self.generation
+
+    def exists(self, table_name: str) -> bool:
+        with self.lock:
+            self._refresh()
+            return table_name in self.names
+
+    def list(self) -> List[str]:
+        with self.lock:
+            self._refresh()
+            return sorted(self.names)
+
+    def store(self, table_name: str) -> TableStore:
+        """
+        Get the open storage engine of a table, opening it on first use
+        @param table_name: str
+        @return: TableStore
+        """
+        with self.lock:
+            store = self.stores.get(table_name)
+            if store is None:
+                store = open_store(self.base_path, table_name, **self.store_options)
+                self.add(table_name, store)
+            return store
+
+    def add(self, table_name: str, store: TableStore) -> None:
+        """
+        Register a store opened or created outside of the catalog
+        """
+        with self.lock:
+            self.stores[table_name] = store
+            self.names.add(table_name)
+            if self.on_open is not None:
+                self.on_open(store)
+
+    def remove(self, table_name: str) -> None:
+        """
+        Forget a table after it was renamed or dropped
+        """
+        with self.lock:
+            self.stores.pop(table_name, None)
+            self.names.discard(table_name)
+
+    def invalidate(self, table_name: str = None) -> int:
+        """
+        Drop cached table contents and list the tables again on next use
+        @param table_name: str (optional) - only this table, every table if not provided
+        @return: int - new generation
+        """
+        with self.lock:
+            for name, store in self.stores.items():
+                if table_name is None or name == table_name:
+                    store.invalidate()
+            self.generation += 1
+            return self.generation
+
+    def close(self) -> None:
+        with self.lock:
+            for table_name in list(self.stores):
+                self.stores.pop(table_name).close()
+            self.generation += 1
@@ -0,0 +1,262 @@
+"""
+Client of the EBase server with a pool of persistent connections, safe to share between threads
+"""
+import json
+import queue
+import socket
+import itertools
+import threading
+from typing import Dict, List, Tuple, Union
+
+import pandas as pd
+
+from mutations import Batch, RowMutations
+from protocol import DEFAULT_HOST, DEFAULT_PORT, recv_message, send_message
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 30.0
+
+
+class StaleConnectionError(ConnectionError):
+    """
+    The server closed a connection before it could have run the request sent on it, the request can be sent again
+    """
+
+
+class ConnectionPool:
+    """
+    Up to pool_size open connections, a thread waits for a free one once they are all in use
+    """
+    def __init__(self, host: str, port: int, pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT) -> None:
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1')
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.opened = 0
+        self.closed = False
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.opened += 1
+        return sock
+
+    def acquire(self) -> Tuple[socket.socket, bool]:
+        """
+        @return: tuple - (connection, True if it was reused from the pool)
+        """
+        if self.closed:
+            raise ConnectionError('The connection pool is closed')
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        try:
+            return self._connect(), False
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, sock: socket.socket, broken: bool = False) -> None:
+        if broken or self.closed:
+            sock.close()
+        else:
+            self.idle.put(sock)
+        self.slots.release()
+
+    def close(self) -> None:
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RemoteScanCursor:
+    """
+    Rows of a scan running on the server, fetched one page at a time over a connection held until the scan ends
+    """
+    def __init__(self, client: 'EBaseClient', sock: socket.socket, page: dict) -> None:
+        self.client = client
+        self.sock = sock
+        self.scanner_id = page['scanner_id']
+        self.rows = page['rows']
+        self.position = 0
+        self.done = page['done']
+        self.rows_returned = 0
+        self.closed = False
+        if self.done:
+            self._release()
+
+    def _release(self, broken: bool = False) -> None:
+        if self.sock is not None:
+            self.client.pool.release(self.sock, broken)
+            self.sock = None
+
+    def __iter__(self) -> 'RemoteScanCursor':
+        return self
+
+    def __next__(self) -> Tuple[str, dict]:
+        while self.position >= len(self.rows):
+            if self.done or self.closed:
+                self._release()
+                raise StopIteration
+            try:
+                output = self.client._request(self.sock, 'scan_next', scanner_id=self.scanner_id)
+            except BaseException:
+                self._release(broken=True)
+                raise
+            if not output['success']:
+                self._release()
+                raise RuntimeError(output['message'])
+            self.rows = output['data']['rows']
+            self.position = 0
+            self.done = output['data']['done']
+        row_key, row = self.rows[self.position]
+        self.position += 1
+        self.rows_returned += 1
+        return row_key, row
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self.sock is not None and not self.done:
+            try:
+                self.client._request(self.sock, 'scan_close', scanner_id=self.scanner_id)
+            except OSError:
+                self._release(broken=True)
+        self._release()
+
+    def __enter__(self) -> 'RemoteScanCursor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class EBaseClient:
+    """
+    Same operations and responses as EBase, served by a running `python main.py serve`
+
+        client = EBaseClient()
+        client.create('users', ['personal'])
+        row_key = client.put('users', 'personal', 'name', 'Ana')['data']['row_key']
+        for row_key, row in client.scan('users')['data']['cursor']:
+            ...
+    """
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        @param host: str - '127.0.0.1' as default
+        @param port: int - 9099 as default
+        @param pool_size: int - max open connections, 8 as default
+        @param timeout: float - seconds to wait for the server, 30 as default
+        """
+        self.pool = ConnectionPool(host, port, pool_size, timeout)
+        self.request_ids = itertools.count(1)
+
+    def _request(self, sock: socket.socket, op: str, *args, **kwargs) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Send a request and wait for its response
+        Raises StaleConnectionError only when the server closed the connection without reading a whole
+        request, i.e. sending failed or the connection ended before any byte of a response; any other
+        error, a timeout included, may come after the server ran the request
+        """
+        request_id = next(self.request_ids)
+        try:
+            send_message(sock, {"id": request_id, "op": op, "args": list(args), "kwargs": kwargs})
+        except (BrokenPipeError, ConnectionResetError) as e:
+            # the server drops a partial message without running it
+            raise StaleConnectionError('The server closed the connection before the request was sent') from e
+        try:
+            first_byte = sock.recv(1, socket.MSG_PEEK)
+        except ConnectionResetError as e:
+            raise StaleConnectionError('The server reset the connection before answering') from e
+        if not first_byte:
+            raise StaleConnectionError('The server closed the connection before answering')
+        response = recv_message(sock)
+        if response is None:
+            raise ConnectionError('The server closed the connection')
+        if response.pop('id', None) != request_id:
+            raise ConnectionError('Response does not match the request')
+        return response
+
+    def call(self, op: str, *args, **kwargs) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Run an operation on the server
+        A pooled connection the server closed while it was idle is replaced and the request sent again.
+        Other errors, timeouts included, are raised without retrying: the server may have run the
+        request already, and operations like insert_many or batch would run twice
+        """
+        while True:
+            sock, reused = self.pool.acquire()
+            try:
+                response = self._request(sock, op, *args, **kwargs)
+            except StaleConnectionError:
+                self.pool.release(sock, broken=True)
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                self.pool.release(sock, broken=True)
+                raise
+            self.pool.release(sock)
+            return response
+
+    def ping(self) -> Dict[str, Union[bool, str, dict]]:
+        return self.call('ping')
+
+    def scan(self, table_name: str, start_row: str = None, stop_row: str = None, prefix: str = None, columns: List[str] = None, limit: int = None, batch_size: int = 1000, versions: int = None, parallel: bool = False) -> Dict[str, Union[bool, str, dict]]:
+        """
+        Scan the rows of a table on the server, data['cursor'] fetches batch_size rows per round trip
+        """
+        sock, _ = self.pool.acquire()
+        try:
+            output = self._request(
+                sock, 'scan', table_name, start_row=start_row, stop_row=stop_row, prefix=prefix,
+                columns=columns, limit=limit, batch_size=batch_size, versions=versions, parallel=parallel
+            )
+        except BaseException:
+            self.pool.release(sock, broken=True)
+            raise
+        if not output['success']:
+            self.pool.release(sock)
+            return output
+        output['data'] = {"cursor": RemoteScanCursor(self, sock, output['data'])}
+        return output
+
+    def batch(self, table_name: str, batch: Batch) -> Dict[str, Union[bool, str, dict]]:
+        return self.call('batch', table_name, batch.to_list())
+
+    def mutate_row(self, table_name: str, row_mutations: RowMutations) -> Dict[str, Union[bool, str, dict]]:
+        return self.call('mutate_row', table_name, row_mutations.to_dict())
+
+    def insert_many(self, table_name: str, column_family: str, data_frame: pd.DataFrame, return_rows: bool = True) -> Dict[str, Union[bool, str, dict]]:
+        frame = json.loads(data_frame.to_json(orient='split', index=False))
+        return self.call('insert_many', table_name, column_family, frame, return_rows)
+
+    def __getattr__(self, name: str):
+        """
+        Every other EBase operation, e.g. client.get('users', row_key)
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+
+        return call
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def __enter__(self) -> 'EBaseClient':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
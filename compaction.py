@@ -0,0 +1,252 @@
+"""
+Compaction of the segment files of lsm tables
+
+minor: size-tiered, merges a run of adjacent segments of one column family and of
+       similar size into one. Tombstones and old versions are kept because segments
+       outside the run may still hold the data they hide
+major: merges every segment of a table into one per column family and drops deleted
+       rows, deleted cells and versions past the table's max_timestamp
+"""
+import time
+import datetime
+import threading
+from typing import List, Union
+
+from storage_engine import LSMTableStore, Segment, merge_sources, merge_fragments, new_fragment, newest_first, open_segment
+
+
+class CompactionPolicy:
+    """
+    When and how fast compactions run
+    @param min_files: int - smallest run of segments merged by a minor compaction
+    @param max_files: int - largest run of segments merged by a minor compaction
+    @param size_ratio: float - max size ratio between the largest and the smallest segment of a run
+    @param check_interval: float - seconds between two checks of the background thread
+    @param major_interval: float - seconds between two major compactions of a table, 0 disables them
+    @param throughput_limit: int - bytes per second written by background compactions, 0 for no limit
+    """
+    def __init__(self, min_files: int = 3, max_files: int = 10, size_ratio: float = 2.0, check_interval: float = 10.0, major_interval: float = 24 * 3600, throughput_limit: int = 16 * 1024 * 1024) -> None:
+        if min_files < 2:
+            raise ValueError('min_files should be greater than 1')
+        self.min_files = min_files
+        self.max_files = max(max_files, min_files)
+        self.size_ratio = size_ratio
+        self.check_interval = check_interval
+        self.major_interval = major_interval
+        self.throughput_limit = throughput_limit
+
+    def select_minor(self, segments: List[Segment]) -> Union[List[Segment], None]:
+        """
+        Pick the longest run of adjacent segments of similar size, the smallest one on ties
+        @param segments: list[Segment] - oldest first
+        @return: list[Segment] or None if no run is long enough
+        """
+        best = None
+        best_size = 0
+        for start in range(len(segments)):
+            smallest = largest = total = segments[start].size
+            for end in range(start + 1, min(len(segments), start + self.max_files)):
+                size = segments[end].size
+                smallest = min(smallest, size)
+                largest = max(largest, size)
+                if largest > self.size_ratio * max(smallest, 1):
+                    break
+                total += size
+                count = end - start + 1
+                if count < self.min_files:
+                    continue
+                if best is None or count > len(best) or (count == len(best) and total < best_size):
+                    best = segments[start:end + 1]
+                    best_size = total
+        return best
+
+    def needs_major(self, store: LSMTableStore, since: float) -> bool:
+        """
+        Check if the periodic major compaction of a table is due
+        @param store: LSMTableStore
+        @param since: float - time of the last major compaction or of the registration of the table
+        @return: bool
+        """
+        if not self.major_interval or time.time() - since < self.major_interval:
+            return False
+        families = [segment.family for segment in store.segments]
+        if len(set(families)) < len(families) or (None in families and len(families) > 1):
+            return True
+        return bool(families) and store.manifest['flushed_seq'] > store.compaction_stats['major_seq']
+
+
+class Throttle:
+    """
+    Sleeps as needed to keep a writer under a number of bytes per second
+    """
+    def __init__(self, bytes_per_second: int) -> None:
+        self.bytes_per_second = bytes_per_second
+        self.start = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, size: int) -> None:
+        if not self.bytes_per_second:
+            return
+        self.consumed += size
+        delay = self.consumed / self.bytes_per_second - (time.monotonic() - self.start)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def combine_fragments(fragments: List[dict]) -> dict:
+    """
+    Merge the fragments of a row into one fragment, keeping what hides older data
+    @param fragments: list[dict] - ordered from newest to oldest
+    @return: dict - fragment
+    """
+    combined = new_fragment()
+    masked = set()
+    for fragment in fragments:
+        for family, columns in fragment['cells'].items():
+            for column, versions in columns.items():
+                if (family, column) in masked:
+                    continue
+                combined_versions = combined['cells'].setdefault(family, {}).setdefault(column, {})
+                for timestamp, value in versions.items():
+                    combined_versions.setdefault(timestamp, value)
+        for family, columns in fragment['tombstones'].items():
+            for column in columns:
+                if (family, column) not in masked:
+                    masked.add((family, column))
+                    combined['tombstones'].setdefault(family, set()).add(column)
+        if fragment['deleted']:
+            combined['deleted'] = True
+            break
+    for columns in combined['cells'].values():
+        for column, versions in columns.items():
+            columns[column] = newest_first(versions)
+    return combined
+
+
+def compact(store: LSMTableStore, major: bool = False, policy: CompactionPolicy = None, throttle: Throttle = None) -> Union[dict, None]:
+    """
+    Run one compaction on a table
+    @param store: LSMTableStore
+    @param major: bool - merge every segment and drop deleted and expired data
+    @param policy: CompactionPolicy (optional) - selects the segments of a minor compaction
+    @param throttle: Throttle (optional) - limits the write rate
+    @return: dict - {'major': bool, 'files_merged': int, 'bytes_reclaimed': int, 'duration': float, 'finished_at': str} or None if nothing was compacted
+    """
+    policy = policy or CompactionPolicy()
+    with store.compaction_lock:
+        with store.lock.write():
+            if store.closed:
+                return None
+            store._sync()
+            if major:
+                segments = list(store.segments)
+            else:
+                runs = [policy.select_minor(run) for run in store.compaction_runs()]
+                segments = max((run for run in runs if run), key=lambda run: (len(run), -sum(segment.size for segment in run)), default=None)
+            if not segments:
+                return None
+            for segment in segments:
+                segment.acquire()
+            max_versions = store.metadata['max_timestamp']
+            path = None if major else store.new_segment_path()
+
+        start = time.monotonic()
+        try:
+            sources = [segment.scan() for segment in reversed(segments)]
+            if major:
+                new_segments = store.write_family_segments(_major_rows(merge_sources(sources), max_versions), throttle)
+            else:
+                rows = ((row_key, combine_fragments(fragments)) for row_key, fragments in merge_sources(sources))
+                store.write_segment(path, rows, throttle, segments[0].family)
+                new_segments = [open_segment(path)]
+            for new_segment in new_segments:
+                if not new_segment.rows:
+                    new_segment.retire()
+            new_segments = [new_segment for new_segment in new_segments if new_segment.rows]
+        finally:
+            for segment in segments:
+                segment.release()
+
+        stats = {
+            "major": major,
+            "files_merged": len(segments),
+            "bytes_reclaimed": sum(segment.size for segment in segments) - sum(segment.size for segment in new_segments),
+            "duration": time.monotonic() - start,
+            "finished_at": str(datetime.datetime.now())
+        }
+        if not store.replace_segments(segments, new_segments, stats):
+            return None
+        return stats
+
+
+def _major_rows(merged, max_versions: int):
+    for row_key, fragments in merged:
+        row = merge_fragments(iter(fragments), max_versions)
+        if row is not None:
+            fragment = new_fragment()
+            fragment['cells'] = row
+            yield row_key, fragment
+
+
+class Compactor:
+    """
+    Background thread compacting the registered lsm tables
+    """
+    def __init__(self, policy: CompactionPolicy = None) -> None:
+        self.policy = policy or CompactionPolicy()
+        self.stores = {}
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.thread = None
+        self.stopping = False
+
+    def register(self, store: LSMTableStore) -> None:
+        with self.lock:
+            store.compactor = self
+            self.stores[id(store)] = (store, time.time())
+            if self.thread is None:
+                self.stopping = False
+                self.thread = threading.Thread(target=self._run, name='ebase-compactor', daemon=True)
+                self.thread.start()
+        self.wake_up()
+
+    def unregister(self, store: LSMTableStore) -> None:
+        with self.lock:
+            self.stores.pop(id(store), None)
+
+    def wake_up(self) -> None:
+        self.event.set()
+
+    def _run(self) -> None:
+        while not self.stopping:
+            self.event.wait(self.policy.check_interval)
+            self.event.clear()
+            with self.lock:
+                stores = list(self.stores.values())
+            for store, registered_at in stores:
+                if self.stopping:
+                    break
+                self._compact(store, registered_at)
+
+    def _compact(self, store: LSMTableStore, registered_at: float) -> None:
+        try:
+            throttle = Throttle(self.policy.throughput_limit)
+            while compact(store, False, self.policy, throttle) is not None:
+                pass
+            last_major = store.compaction_stats.get('last_major_time') or registered_at
+            if self.policy.needs_major(store, last_major):
+                compact(store, True, self.policy, throttle)
+        except Exception as e:
+            store.compaction_stats['last_error'] = str(e)
+
+    def stop(self) -> None:
+        """
+        Stop the background thread, waiting for the running compaction
+        """
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+            self.stopping = True
+        self.event.set()
+        if thread is not None:
+            thread.join()
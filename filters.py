@@ -0,0 +1,196 @@
+"""
+Filters evaluated by EBase.scan while the rows of a table are read
+"""
+import operator
+from datetime import datetime
+from typing import Callable, Dict, List, Set, Union
+
+from storage_engine import cell_timestamp, newest_first, select_versions
+
+COMPARE_OPERATORS: Dict[str, Callable[[object, object], bool]] = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+
+def _comparable(left: str, right: str) -> tuple:
+    """
+    Compare as numbers when both values are numeric, as strings otherwise
+    """
+    try:
+        return float(left), float(right)
+    except (TypeError, ValueError):
+        return str(left), str(right)
+
+
+def _timestamp(value: Union[int, str, datetime, None]) -> Union[int, None]:
+    return None if value is None else cell_timestamp(value)
+
+
+class Filter:
+    """
+    Base class of the scan filters
+    filter_row_key is checked before the row is read from the table files, rows it
+    rejects are never decoded; filter_row gets the merged row and returns the part of
+    it to keep or None to drop the row. A scan projected to some column families also
+    reads the families the filter needs, listed by families
+    """
+    def filter_row_key(self, row_key: str) -> bool:
+        return True
+
+    def families(self) -> Set[str]:
+        return set()
+
+    def filter_row(self, row_key: str, row: dict) -> Union[dict, None]:
+        return row
+
+
+class PrefixFilter(Filter):
+    """
+    Keep the rows whose key starts with a prefix
+    """
+    def __init__(self, prefix: str) -> None:
+        self.prefix = prefix
+
+    def filter_row_key(self, row_key: str) -> bool:
+        return row_key.startswith(self.prefix)
+
+
+class SingleColumnValueFilter(Filter):
+    """
+    Keep the rows whose newest value of a column compares true against a value
+    Values that are numeric on both sides are compared as numbers, so '>' 30 keeps '31' but not '4'
+    """
+    def __init__(self, column_family: str, column: str, compare_operator: str, value: str, filter_if_missing: bool = True) -> None:
+        """
+        @param column_family: str
+        @param column: str
+        @param compare_operator: str - one of =, !=, <, <=, >, >=
+        @param value: str
+        @param filter_if_missing: bool - drop the rows without the column, True as default
+        """
+        if compare_operator not in COMPARE_OPERATORS:
+            raise ValueError(f'Unknown compare operator {compare_operator}')
+        self.column_family = column_family
+        self.column = column
+        self.compare = COMPARE_OPERATORS[compare_operator]
+        self.value = value
+        self.filter_if_missing = filter_if_missing
+
+    def families(self) -> Set[str]:
+        return {self.column_family}
+
+    def filter_row(self, row_key: str, row: dict) -> Union[dict, None]:
+        versions = row.get(self.column_family, {}).get(self.column)
+        if not versions:
+            return None if self.filter_if_missing else row
+        newest = next(iter(versions.values()))
+        return row if self.compare(*_comparable(newest, self.value)) else None
+
+
+class ColumnPrefixFilter(Filter):
+    """
+    Keep only the columns whose name starts with a prefix, rows without such a column are dropped
+    """
+    def __init__(self, prefix: str) -> None:
+        self.prefix = prefix
+
+    def filter_row(self, row_key: str, row: dict) -> Union[dict, None]:
+        result = {}
+        for family, columns in row.items():
+            kept = {column: versions for column, versions in columns.items() if column.startswith(self.prefix)}
+            if kept:
+                result[family] = kept
+        return result or None
+
+
+class TimestampRangeFilter(Filter):
+    """
+    Keep only the versions written in [min_timestamp, max_timestamp), rows without such a version are dropped
+    """
+    def __init__(self, min_timestamp: Union[int, str, datetime] = None, max_timestamp: Union[int, str, datetime] = None) -> None:
+        """
+        @param min_timestamp: int microseconds, str or datetime (optional) - inclusive
+        @param max_timestamp: int microseconds, str or datetime (optional) - exclusive
+        """
+        self.min_timestamp = _timestamp(min_timestamp)
+        self.max_timestamp = _timestamp(max_timestamp)
+
+    def filter_row(self, row_key: str, row: dict) -> Union[dict, None]:
+        result = {}
+        for family, columns in row.items():
+            kept_columns = {}
+            for column, versions in columns.items():
+                kept = select_versions(versions, min_timestamp=self.min_timestamp, max_timestamp=self.max_timestamp)
+                if kept:
+                    kept_columns[column] = kept
+            if kept_columns:
+                result[family] = kept_columns
+        return result or None
+
+
+def _union(rows: List[dict]) -> dict:
+    """
+    Cells kept by any of the rows, the versions of every column newest first
+    """
+    result = {}
+    for row in rows:
+        for family, columns in row.items():
+            result_columns = result.setdefault(family, {})
+            for column, versions in columns.items():
+                result_columns.setdefault(column, {}).update(versions)
+    for columns in result.values():
+        for column, versions in columns.items():
+            columns[column] = newest_first(versions)
+    return result
+
+
+class FilterList(Filter):
+    """
+    Combine filters, with AND a row has to pass every filter and keeps what all of them keep,
+    with OR a row has to pass one filter and keeps what any of them keeps
+    """
+    AND = 'AND'
+    OR = 'OR'
+
+    def __init__(self, filters: List[Filter], operator: str = AND) -> None:
+        """
+        @param filters: list[Filter]
+        @param operator: str - 'AND' or 'OR', 'AND' as default
+        """
+        operator = operator.upper()
+        if operator not in (self.AND, self.OR):
+            raise ValueError(f'Unknown filter list operator {operator}')
+        self.filters = filters
+        self.operator = operator
+
+    def filter_row_key(self, row_key: str) -> bool:
+        if self.operator == self.AND:
+            return all(row_filter.filter_row_key(row_key) for row_filter in self.filters)
+        return not self.filters or any(row_filter.filter_row_key(row_key) for row_filter in self.filters)
+
+    def families(self) -> Set[str]:
+        return set().union(*(row_filter.families() for row_filter in self.filters))
+
+    def filter_row(self, row_key: str, row: dict) -> Union[dict, None]:
+        if self.operator == self.AND:
+            for row_filter in self.filters:
+                row = row_filter.filter_row(row_key, row)
+                if row is None:
+                    return None
+            return row
+        if not self.filters:
+            return row
+        kept = [
+            result for result in (
+                row_filter.filter_row(row_key, row) for row_filter in self.filters
+                if row_filter.filter_row_key(row_key)
+            )
+            if result is not None
+        ]
+        return _union(kept) if kept else None
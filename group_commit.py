@@ -0,0 +1,183 @@
+"""
+Group commit of the writes of a table, many small writes share one durable write
+"""
+import time
+import threading
+from concurrent.futures import Future
+from contextlib import AbstractContextManager
+from typing import Callable, List
+
+DEFAULT_MAX_BATCH_MUTATIONS = 1000
+DEFAULT_MAX_BATCH_DELAY_MS = 5
+
+
+class CommitPipeline:
+    """
+    Queue of mutations committed by a background thread in batches
+    A batch is committed once it holds max_batch_mutations mutations or its oldest write
+    waited max_batch_delay_ms, whatever comes first. The mutations of a submit are never split,
+    so only a submit larger than max_batch_mutations makes a larger batch. The thread takes the
+    table lock before it takes the queue, so a caller holding the lock can commit the queue
+    itself with flush and no batch is ever half way between the queue and the table.
+    A batch is written at once: when the commit fails, every submit of that batch gets the error.
+    """
+    def __init__(self, commit: Callable[[List[dict]], None], lock: Callable[[], AbstractContextManager], max_batch_mutations: int = DEFAULT_MAX_BATCH_MUTATIONS, max_batch_delay_ms: float = DEFAULT_MAX_BATCH_DELAY_MS, name: str = 'ebase-commit') -> None:
+        """
+        @param commit: callable - writes a list of mutations durably, called with the lock held
+        @param lock: callable - returns the context manager of the table write lock
+        @param max_batch_mutations: int - mutations per batch
+        @param max_batch_delay_ms: float - max time a write waits for its batch
+        @param name: str - name of the committing thread
+        """
+        if max_batch_mutations < 1:
+            raise ValueError('max_batch_mutations must be at least 1')
+        if max_batch_delay_ms < 0:
+            raise ValueError('max_batch_delay_ms cannot be negative')
+        self.commit = commit
+        self.lock = lock
+        self.max_batch_mutations = max_batch_mutations
+        self.max_batch_delay_ms = max_batch_delay_ms
+        self.name = name
+        self.condition = threading.Condition()
+        self.queue = []
+        self.queued_mutations = 0
+        self.pending_rows = set()
+        self.pending_existence = set()
+        self.oldest = None
+        self.thread = None
+        self.closed = False
+        self.batches = 0
+        self.mutations = 0
+        self.largest_batch = 0
+
+    def submit(self, mutations: List[dict]) -> Future:
+        """
+        Queue mutations written together in the same batch
+        @param mutations: list[dict]
+        @return: Future - resolves to None once the mutations are durable, or to the error of the commit
+                 of their batch, which may have been caused by the mutations of another submit
+        """
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('The commit pipeline is closed')
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.queue.append((mutations, future))
+            self.queued_mutations += len(mutations)
+            for mutation in mutations:
+                self.pending_rows.add(mutation['row'])
+                if mutation['op'] == 'delete_row' or mutation.get('new_row'):
+                    self.pending_existence.add(mutation['row'])
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+        return future
+
+    def is_pending(self, row_key: str, existence_only: bool = False) -> bool:
+        """
+        @param row_key: str
+        @param existence_only: bool (optional) - only count the mutations creating or deleting the row
+        @return: bool - True if mutations of the row are queued but not committed
+        """
+        with self.condition:
+            return row_key in (self.pending_existence if existence_only else self.pending_rows)
+
+    def flush(self) -> None:
+        """
+        Commit the queued mutations now in the calling thread
+        """
+        with self.lock():
+            self._drain()
+
+    def _drain(self) -> None:
+        """
+        Commit everything queued in batches of at most max_batch_mutations mutations, the lock has to be held
+        """
+        with self.condition:
+            queued = self.queue
+            self.queue = []
+            self.queued_mutations = 0
+            self.pending_rows = set()
+            self.pending_existence = set()
+            self.oldest = None
+            self.condition.notify_all()
+        batch = []
+        size = 0
+        for mutations, future in queued:
+            if batch and size + len(mutations) > self.max_batch_mutations:
+                self._commit(batch)
+                batch = []
+                size = 0
+            batch.append((mutations, future))
+            size += len(mutations)
+        if batch:
+            self._commit(batch)
+
+    def _commit(self, batch: List[tuple]) -> None:
+        """
+        Write the mutations of some submits at once and resolve their futures
+        @param batch: list of (mutations, future)
+        """
+        mutations = [mutation for queued, _ in batch for mutation in queued]
+        try:
+            self.commit(mutations)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.mutations += len(mutations)
+        self.largest_batch = max(self.largest_batch, len(mutations))
+        for _, future in batch:
+            future.set_result(None)
+
+    def _ready(self) -> bool:
+        if not self.queue:
+            return False
+        if self.closed or self.queued_mutations >= self.max_batch_mutations:
+            return True
+        return (time.monotonic() - self.oldest) * 1000 >= self.max_batch_delay_ms
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self._ready():
+                    if self.closed and not self.queue:
+                        return
+                    timeout = None
+                    if self.queue:
+                        timeout = self.max_batch_delay_ms / 1000 - (time.monotonic() - self.oldest)
+                    self.condition.wait(timeout)
+            with self.lock():
+                self._drain()
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Commit what is queued and stop the thread
+        @param wait: bool (optional) - False returns at once and the thread commits the queue on its own,
+                     for callers holding the table lock the thread needs; True as default
+        """
+        with self.condition:
+            self.closed = True
+            thread = self.thread
+            self.condition.notify_all()
+        if not wait:
+            return
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self.condition:
+            queued = self.queued_mutations
+        return {
+            "max_batch_mutations": self.max_batch_mutations,
+            "max_batch_delay_ms": self.max_batch_delay_ms,
+            "queued_mutations": queued,
+            "batches": self.batches,
+            "mutations": self.mutations,
+            "largest_batch": self.largest_batch,
+            "average_batch": self.mutations / self.batches if self.batches else 0.0
+        }
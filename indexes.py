@@ -0,0 +1,247 @@
+"""
+Secondary indexes from the newest value of a column to the keys of the rows holding it
+Every index is an lsm table under <db>/.indexes/<table>/<family>__<column> whose row key is
+the indexed value and whose columns, in the 'rows' family, are the keys of the table rows with
+that value. A lookup is a single row read: a Bloom filter check and a binary search of the sparse
+index of every segment, instead of a scan of the table.
+EBase updates the indexes of a table in the same write lock as the table, a crash between both
+writes leaves an index stale until EBase.rebuild_index is run.
+"""
+import os
+import shutil
+import datetime
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from aggregation import newest_value
+from storage_engine import TableStore, LSMTableStore, new_timestamp
+
+INDEX_DIR = '.indexes'
+INDEX_FAMILY = 'rows'
+
+
+def index_name(column_family: str, column: str) -> str:
+    """
+    @return: str - 'family:column', how the table metadata lists an index
+    """
+    return f'{column_family}:{column}'
+
+
+class SecondaryIndex:
+    """
+    Index of one column of a table, stored in its own lsm table
+    """
+    def __init__(self, store: LSMTableStore, column_family: str, column: str) -> None:
+        self.store = store
+        self.column_family = column_family
+        self.column = column
+
+    @property
+    def name(self) -> str:
+        return index_name(self.column_family, self.column)
+
+    def lookup(self, value: str) -> List[str]:
+        """
+        @return: list[str] - sorted keys of the rows whose newest cell of the column is value
+        """
+        row = self.store.get_row(str(value))
+        if row is None:
+            return []
+        return sorted(row_key for row_key, versions in row.get(INDEX_FAMILY, {}).items() if versions)
+
+    def apply(self, entries: List[Tuple[str, Union[str, None], Union[str, None]]]) -> None:
+        """
+        Move rows between values
+        @param entries: list of (row_key, old value, new value) - None when the row did not have, or no longer has, the cell
+        """
+        timestamp = new_timestamp()
+        mutations = []
+        for row_key, old_value, new_value in entries:
+            old_value = None if old_value is None else str(old_value)
+            new_value = None if new_value is None else str(new_value)
+            if old_value == new_value:
+                continue
+            if old_value is not None:
+                mutations.append({"op": "delete_column", "row": old_value, "family": INDEX_FAMILY, "column": row_key})
+            if new_value is not None:
+                mutations.append({"op": "put", "row": new_value, "family": INDEX_FAMILY, "column": row_key, "ts": timestamp, "value": ""})
+        if mutations:
+            self.store.apply(mutations)
+
+    def load(self, entries: List[Tuple[str, str]]) -> int:
+        """
+        Add the rows of a bulk load at once, written straight to a segment
+        @param entries: list of (row_key, value)
+        @return: int - number of rows indexed
+        """
+        if not entries:
+            return 0
+        timestamp = new_timestamp()
+        values = {}
+        for row_key, value in entries:
+            values.setdefault(str(value), {})[row_key] = {timestamp: ""}
+        self.store.load_rows((value, {INDEX_FAMILY: values[value]}) for value in sorted(values))
+        return len(entries)
+
+    def entries(self, rows: Iterator[Tuple[str, dict]]) -> List[Tuple[str, str]]:
+        """
+        @param rows: iterator of (row_key, row)
+        @return: list of (row_key, value) - the rows having the indexed cell
+        """
+        found = []
+        for row_key, row in rows:
+            value = newest_value(row, self.column_family, self.column)
+            if value is not None:
+                found.append((row_key, value))
+        return found
+
+    def rebuild(self, rows: Iterator[Tuple[str, dict]]) -> int:
+        """
+        Replace the content of the index with the rows of the table
+        @return: int - number of rows indexed
+        """
+        self.store.truncate()
+        return self.load(self.entries(rows))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "segments": len(self.store.segments),
+            "size": sum(segment.size for segment in self.store.segments)
+        }
+
+
+def index_changes(store: TableStore, indexes: List[SecondaryIndex], mutations: List[dict]) -> List[Tuple[SecondaryIndex, list]]:
+    """
+    Work out how a write moves the rows of a table between indexed values, before it is applied
+    Only rows whose indexed cells the mutations touch are read. The write lock of the table has to be held
+    @return: list of (index, entries for SecondaryIndex.apply)
+    """
+    by_column = {(index.column_family, index.column): index for index in indexes}
+    touched: Dict[str, dict] = {}
+    for mutation in mutations:
+        if mutation['op'] == 'delete_row':
+            touched[mutation['row']] = {column: None for column in by_column}
+        elif (mutation['family'], mutation['column']) in by_column:
+            value = mutation['value'] if mutation['op'] == 'put' else None
+            touched.setdefault(mutation['row'], {})[(mutation['family'], mutation['column'])] = value
+
+    entries = {column: [] for column in by_column}
+    families = sorted({column_family for column_family, _ in by_column})
+    for row_key, new_values in touched.items():
+        row = store.get_row(row_key, families) or {}
+        for column, new_value in new_values.items():
+            entries[column].append((row_key, newest_value(row, *column), new_value))
+    return [(by_column[column], entries[column]) for column in by_column if entries[column]]
+
+
+def collect_entries(rows: Iterator[Tuple[str, dict]], indexes: List[SecondaryIndex], entries: Dict[str, list]) -> Iterator[Tuple[str, dict]]:
+    """
+    Pass the rows of a bulk load through, keeping the entries of every index for SecondaryIndex.load
+    @param entries: dict - {index name: list of (row_key, value)}, filled while the rows are consumed
+    """
+    for row_key, row in rows:
+        for index in indexes:
+            value = newest_value(row, index.column_family, index.column)
+            if value is not None:
+                entries.setdefault(index.name, []).append((row_key, value))
+        yield row_key, row
+
+
+class IndexCatalog:
+    """
+    Open secondary indexes of a database, opened on first use
+    """
+    def __init__(self, base_path: str, store_options: dict, on_open: Callable[[TableStore], None] = None) -> None:
+        """
+        @param base_path: str - database directory
+        @param store_options: dict - options forwarded to the lsm engine
+        @param on_open: callable (optional) - called with the store of every index opened or created
+        """
+        self.base_path = os.path.join(base_path, INDEX_DIR)
+        self.store_options = store_options
+        self.on_open = on_open
+        self.indexes: Dict[Tuple[str, str], SecondaryIndex] = {}
+        self.lock = threading.Lock()
+
+    def _table_path(self, table_name: str) -> str:
+        return os.path.join(self.base_path, table_name)
+
+    @staticmethod
+    def _file_name(column_family: str, column: str) -> str:
+        return f'{column_family}__{column}'
+
+    def _add(self, table_name: str, store: LSMTableStore, column_family: str, column: str) -> SecondaryIndex:
+        index = SecondaryIndex(store, column_family, column)
+        self.indexes[(table_name, index.name)] = index
+        if self.on_open is not None:
+            self.on_open(store)
+        return index
+
+    def index(self, table_name: str, name: str) -> SecondaryIndex:
+        """
+        @param name: str - 'family:column'
+        @return: SecondaryIndex - the index, created empty if its files are missing
+        """
+        with self.lock:
+            index = self.indexes.get((table_name, name))
+            if index is not None:
+                return index
+            column_family, _, column = name.partition(':')
+            path = self._table_path(table_name)
+            file_name = self._file_name(column_family, column)
+            if os.path.isdir(os.path.join(path, file_name)):
+                store = LSMTableStore(path, file_name, **self.store_options)
+            else:
+                os.makedirs(path, exist_ok=True)
+                store = LSMTableStore.create(path, file_name, {
+                    "table_name": file_name,
+                    "column_families": [INDEX_FAMILY],
+                    "disabled": False,
+                    "created_at": str(datetime.datetime.now()),
+                    "updated_at": str(datetime.datetime.now()),
+                    "rows": 0,
+                    "max_timestamp": 1
+                }, **self.store_options)
+            return self._add(table_name, store, column_family, column)
+
+    def table_indexes(self, table_name: str, names: List[str]) -> List[SecondaryIndex]:
+        """
+        @param names: list[str] - 'family:column' of the indexes listed in the table metadata
+        """
+        return [self.index(table_name, name) for name in names]
+
+    def drop(self, table_name: str, name: str) -> None:
+        index = self.index(table_name, name)
+        with self.lock:
+            self.indexes.pop((table_name, name), None)
+        index.store.drop()
+
+    def _forget_table(self, table_name: str) -> List[SecondaryIndex]:
+        with self.lock:
+            keys = [key for key in self.indexes if key[0] == table_name]
+            return [self.indexes.pop(key) for key in keys]
+
+    def drop_table(self, table_name: str) -> None:
+        """
+        Drop every index of a table
+        """
+        for index in self._forget_table(table_name):
+            index.store.discard()
+        shutil.rmtree(self._table_path(table_name), ignore_errors=True)
+
+    def rename_table(self, table_name: str, new_name: str) -> None:
+        """
+        Move the indexes of a renamed table
+        """
+        for index in self._forget_table(table_name):
+            index.store.close()
+        if os.path.isdir(self._table_path(table_name)):
+            os.rename(self._table_path(table_name), self._table_path(new_name))
+
+    def close(self) -> None:
+        with self.lock:
+            indexes = list(self.indexes.values())
+            self.indexes.clear()
+        for index in indexes:
+            index.store.close()
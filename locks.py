@@ -0,0 +1,136 @@
+"""
+Reader/writer locks of the tables, shared by the threads of a process and by processes through advisory file locks
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class ReadWriteLock:
+    """
+    Reentrant lock letting many readers or a single writer in, writers waiting keep new readers out
+    A thread holding the write lock can also take the read lock. With a lock file, the first
+    reader of the process takes a shared flock and the writer an exclusive one, so processes
+    opening the same table exclude each other the same way threads do. Without fcntl
+    (Windows) only the threads of a process are synchronized.
+    """
+    def __init__(self, lock_path: str = None) -> None:
+        """
+        @param lock_path: str (optional) - file locked across processes
+        """
+        self.lock_path = lock_path
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = {}
+        self.writer = None
+        self.writer_depth = 0
+        self.writers_waiting = 0
+        self.fd = None
+
+    def _file_lock(self, operation: int) -> None:
+        if self.lock_path is None or fcntl is None:
+            return
+        if self.fd is None:
+            self.fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, operation)
+
+    def _file_unlock(self) -> None:
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def acquire_read(self) -> None:
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer == me or me in self.readers:
+                self.readers[me] = self.readers.get(me, 0) + 1
+                return
+            while self.writer is not None or self.writers_waiting:
+                self.condition.wait()
+            if not self.readers and fcntl is not None:
+                self._file_lock(fcntl.LOCK_SH)
+            self.readers[me] = 1
+
+    def release_read(self) -> None:
+        me = threading.get_ident()
+        with self.condition:
+            count = self.readers[me] - 1
+            if count:
+                self.readers[me] = count
+                return
+            del self.readers[me]
+            if not self.readers and self.writer is None:
+                self._file_unlock()
+                self.condition.notify_all()
+
+    def acquire_write(self) -> None:
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer == me:
+                self.writer_depth += 1
+                return
+            if me in self.readers:
+                raise RuntimeError('A read lock cannot be upgraded to a write lock')
+            self.writers_waiting += 1
+            try:
+                while self.writer is not None or self.readers:
+                    self.condition.wait()
+            finally:
+                self.writers_waiting -= 1
+            self.writer = me
+            self.writer_depth = 1
+            try:
+                if fcntl is not None:
+                    self._file_lock(fcntl.LOCK_EX)
+            except BaseException:
+                self.writer = None
+                self.writer_depth = 0
+                self.condition.notify_all()
+                raise
+
+    def release_write(self) -> None:
+        with self.condition:
+            self.writer_depth -= 1
+            if self.writer_depth:
+                return
+            self.writer = None
+            if self.readers:
+                # the writer also held read locks, keep the file shared for them
+                if fcntl is not None:
+                    self._file_lock(fcntl.LOCK_SH)
+            else:
+                self._file_unlock()
+            self.condition.notify_all()
+
+    def reading(self) -> bool:
+        """
+        @return: bool - True if the current thread holds a read lock but not the write lock
+        """
+        me = threading.get_ident()
+        return me in self.readers and self.writer != me
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def close(self) -> None:
+        with self.condition:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
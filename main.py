@@ -1,5 +1,7 @@
 import sys
+import argparse
 from EBase import EBase, prettyPrint
+from filters import SingleColumnValueFilter
 import pandas as pd
 
 def show_menu():
@@ -143,10 +145,38 @@ def main():
                     print(f"Actualizada en: {metadata['table_metadata']['updated_at']}")
                     print(f"Total de filas: {metadata['table_metadata']['rows']}")
                     print(f"Timestamp máximo: {metadata['table_metadata']['max_timestamp']}")
+                    print(f"Motor de almacenamiento: {metadata['storage']['storage_engine']}")
+                    group_commit = metadata['table_metadata'].get('group_commit')
+                    if group_commit:
+                        print(f"Escritura agrupada: hasta {group_commit['max_batch_mutations']} mutaciones o {group_commit['max_batch_delay_ms']} ms por lote")
+                    if metadata.get('indexes'):
+                        print(f"Índices secundarios: {', '.join(index['name'] for index in metadata['indexes'])}")
+                    if 'regions' in metadata['storage']:
+                        print(f"Regiones: {len(metadata['storage']['regions'])} (división a los {metadata['storage']['region_split_size']} bytes, {metadata['storage']['splits']} divisiones)")
+                        for region in metadata['storage']['regions']:
+                            start_row = region['start_row'] or '-inf'
+                            end_row = region['end_row'] or '+inf'
+                            print(f"  {region['name']}: [{start_row}, {end_row}) {region['rows']} filas, {region['size']} bytes")
+                    if 'compaction' in metadata['storage']:
+                        compaction = metadata['storage']['compaction']
+                        print(f"Archivos de segmento: {metadata['storage']['segments']}")
+                        print(f"Compactaciones menores / mayores: {compaction['minor_compactions']} / {compaction['major_compactions']}")
+                        print(f"Archivos fusionados: {compaction['files_merged']}")
+                        print(f"Bytes recuperados: {compaction['bytes_reclaimed']}")
+                        print(f"Duración total de compactación: {compaction['total_duration']:.3f} s")
+                        for segment in metadata['storage']['segment_files']:
+                            bloom = segment['bloom_filter']
+                            if bloom is None:
+                                print(f"  {segment['name']}: {segment['rows']} filas, sin filtro Bloom")
+                            else:
+                                print(f"  {segment['name']}: {segment['rows']} filas, filtro Bloom de {bloom['size']} bytes, "
+                                      f"{bloom['negatives']}/{bloom['checks']} busquedas descartadas, "
+                                      f"falsos positivos {bloom['observed_false_positive_rate']:.4f} (esperado {bloom['expected_false_positive_rate']:.4f})")
                     print("-"*100+"\n")
                 
             elif option == '9':
                 print("Saliendo del programa...")
+                db.close()
                 break
             
             elif option =='10':
@@ -181,23 +211,45 @@ def main():
             
             elif option == '12':
                 table_name = validate_input("Ingrese el nombre de la tabla a escanear: ")
-                output = db.scan(table_name.strip())
+                start_row = validate_input("Fila inicial (presione enter para empezar desde el inicio): ", required=False)
+                stop_row = validate_input("Fila final, exclusiva (presione enter para llegar al final): ", required=False)
+                prefix = validate_input("Prefijo de las filas (presione enter para no filtrar): ", required=False)
+                columns = validate_input("Columnas familia:columna separadas por coma (presione enter para todas): ", required=False)
+                limit = validate_input("Cantidad maxima de filas (presione enter para no limitar): ", required=False, type_=int)
+                value_filter = validate_input("Filtro por valor 'familia:columna operador valor', ej. 'info:edad > 30' (presione enter para no filtrar): ", required=False)
+                row_filter = None
+                if value_filter:
+                    try:
+                        column_name, compare_operator, value = value_filter.split(maxsplit=2)
+                        family, column = column_name.split(':', 1)
+                        row_filter = SingleColumnValueFilter(family, column, compare_operator, value)
+                    except ValueError:
+                        print("Filtro invalido")
+                        continue
+                output = db.open_scanner(
+                    table_name.strip(),
+                    start_row=start_row,
+                    stop_row=stop_row,
+                    prefix=prefix,
+                    columns=[column.strip() for column in columns.split(',')] if columns else None,
+                    limit=limit,
+                    filter=row_filter
+                )
                 
                 if validate_output(output):
-                    data = output['data']['data']
                     print("\n" + "-"*100)
                     print("{:^100}".format("Contenido de la tabla: " + table_name))
                     print("-"*100)
                     print("{:<40} {:<60}".format("Row", "Column+Cell"))
                     print("-"*100)
 
-                    for row_key, families in data.items():
-                        for family, columns in families.items():
-                            for column, timestamps in columns.items():
-                                for timestamp, value in timestamps.items():
-                                    cell_info = f'column={family}:{column}, ts={timestamp}, value={value}'
-                                    print("{:<40} {:<60}".format(row_key, cell_info))
+                    with output['data']['scanner'] as scanner:
+                        for row_key, family, column, timestamp, value in scanner:
+                            cell_info = f'column={family}:{column}, ts={timestamp}, value={value}'
+                            print("{:<40} {:<60}".format(row_key, cell_info), flush=True)
 
+                    print("-"*100)
+                    print(f"{scanner.rows_returned} fila(s), {scanner.cells_returned} celda(s)")
                     print("-"*100+"\n")
                     
             elif option == '13':
@@ -261,25 +313,25 @@ def main():
             
             elif option == '18':
                 path = validate_input("Ingrese el nombre de su csv con los datos a ingresar: ")
-                df = pd.read_csv(path + '.csv')
                 table_name = validate_input("Ingrese el nombre de la tabla a insertar los datos: ")
                 column_family = validate_input("Ingrese la familia de columna: ")
-                result = db.insert_many(table_name, column_family, df)
+                chunksize = validate_input("Filas por bloque (presione enter para usar 50000): ", required=False, type_=int)
+
+                def show_progress(counts):
+                    print(f"\r{counts['rows_read']} filas leidas, {counts['rows_inserted']} insertadas, {counts['rows_per_second']:.0f} filas/s", end='', flush=True)
+
+                result = db.import_csv(table_name.strip(), column_family.strip(), path + '.csv', chunksize=chunksize or 50000, progress=show_progress)
+                print()
                 if validate_output(result):
-                    data = result['data']['inserted_rows']
+                    data = result['data']
                     print("\n" + "-"*100)
-                    print("{:^100}".format("Contenido insertado en la tabla: " + table_name))
+                    print("{:^100}".format("Datos insertados en la tabla: " + table_name))
                     print("-"*100)
-                    print("{:<40} {:<60}".format("Row", "Column+Cell"))
-                    print("-"*100)
-                # Iterar directamente sobre la lista de diccionarios
-                    for row in data:
-                        row_key = row['row_key']
-                        row_data = row['data']
-                        for column, value in row_data.items():
-                            cell_info = f'column={column_family}:{column}, value={value}'
-                            print("{:<40} {:<60}".format(row_key, cell_info))
-
+                    print("{:<40} {:<60}".format("Filas leidas", data['rows_read']))
+                    print("{:<40} {:<60}".format("Filas insertadas", data['rows_inserted']))
+                    print("{:<40} {:<60}".format("Bloques", data['chunks']))
+                    print("{:<40} {:<60}".format("Tiempo", data['time_taken']))
+                    print("{:<40} {:<60}".format("Filas por segundo", f"{data['rows_per_second']:.0f}"))
                     print("-"*100+"\n")
             
             else:
@@ -288,5 +340,34 @@ def main():
         except Exception as e:
             print(f"Error: {str(e)}")
 
+def rebuild_index(argv):
+    """
+    python main.py rebuild-index <tabla> [familia:columna] [--db root]
+    """
+    parser = argparse.ArgumentParser(prog='main.py rebuild-index', description='Reconstruye los índices secundarios de una tabla')
+    parser.add_argument('table')
+    parser.add_argument('column', nargs='?', help="'familia:columna', todos los índices de la tabla si no se indica")
+    parser.add_argument('--db', default='root')
+    args = parser.parse_args(argv)
+
+    column_family, column = None, None
+    if args.column:
+        column_family, _, column = args.column.partition(':')
+    db = EBase(args.db)
+    try:
+        output = db.rebuild_index(args.table, column_family, column)
+        if validate_output(output):
+            for name, rows in output['data']['rows_indexed'].items():
+                print(f"Índice {name}: {rows} filas indexadas")
+            print(f"Tiempo: {output['data']['time_taken']}")
+    finally:
+        db.close()
+
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        import server
+        server.main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'rebuild-index':
+        rebuild_index(sys.argv[2:])
+    else:
+        main()
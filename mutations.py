@@ -0,0 +1,155 @@
+"""
+Puts and deletes collected by the caller and written at once by EBase.mutate_row and EBase.batch
+"""
+from typing import Dict, Iterator, List, Union
+
+PUT = 'put'
+DELETE_COLUMN = 'delete_column'
+DELETE_ROW = 'delete_row'
+
+
+class RowMutations:
+    """
+    Mutations of a single row, applied all or nothing
+    Without a row key a new row is created and its key generated when the mutations are applied
+    """
+    def __init__(self, row_key: str = None) -> None:
+        """
+        @param row_key: str (optional) - existing row, a new row if not provided
+        """
+        self.row_key = row_key
+        self.mutations = []
+
+    def put(self, column_family: str, column: str, value: str) -> 'RowMutations':
+        self.mutations.append({"op": PUT, "family": column_family, "column": column, "value": value})
+        return self
+
+    def delete(self, column_family: str, column: str) -> 'RowMutations':
+        self.mutations.append({"op": DELETE_COLUMN, "family": column_family, "column": column})
+        return self
+
+    def delete_row(self) -> 'RowMutations':
+        self.mutations.append({"op": DELETE_ROW})
+        return self
+
+    def __len__(self) -> int:
+        return len(self.mutations)
+
+    def to_dict(self) -> dict:
+        """
+        @return: dict - {'row_key': str or None, 'mutations': list[dict]}, plain data for the network protocol
+        """
+        return {"row_key": self.row_key, "mutations": self.mutations}
+
+    @classmethod
+    def from_dict(cls, item: dict) -> 'RowMutations':
+        """
+        Build the mutations of a row back from RowMutations.to_dict
+        """
+        row = cls(item.get('row_key'))
+        for mutation in item['mutations']:
+            if mutation.get('op') not in (PUT, DELETE_COLUMN, DELETE_ROW):
+                raise ValueError(f"Unknown mutation {mutation.get('op')}")
+            row.mutations.append(dict(mutation))
+        return row
+
+
+class Batch:
+    """
+    Mutations of many rows, every row is applied all or nothing and the whole batch in one write
+    """
+    def __init__(self) -> None:
+        self.rows: Dict[str, RowMutations] = {}
+        self.new_rows: List[RowMutations] = []
+
+    def row(self, row_key: str = None) -> RowMutations:
+        """
+        Get the mutations of a row to add more of them
+        @param row_key: str (optional) - a new row if not provided
+        @return: RowMutations
+        """
+        if row_key is None:
+            row = RowMutations()
+            self.new_rows.append(row)
+            return row
+        return self.rows.setdefault(row_key, RowMutations(row_key))
+
+    def add(self, row_mutations: RowMutations) -> 'Batch':
+        """
+        Add the mutations of a row, appended to those already in the batch for the same row
+        """
+        if row_mutations.row_key is None:
+            self.new_rows.append(row_mutations)
+        else:
+            self.row(row_mutations.row_key).mutations.extend(row_mutations.mutations)
+        return self
+
+    def put(self, row_key: Union[str, None], column_family: str, column: str, value: str) -> 'Batch':
+        self.row(row_key).put(column_family, column, value)
+        return self
+
+    def delete(self, row_key: str, column_family: str, column: str) -> 'Batch':
+        self.row(row_key).delete(column_family, column)
+        return self
+
+    def delete_row(self, row_key: str) -> 'Batch':
+        self.row(row_key).delete_row()
+        return self
+
+    def __iter__(self) -> Iterator[RowMutations]:
+        yield from self.rows.values()
+        yield from self.new_rows
+
+    def __len__(self) -> int:
+        return sum(len(row) for row in self)
+
+    def to_list(self) -> List[dict]:
+        """
+        @return: list - [{'row_key': str or None, 'mutations': list[dict]}], plain data for the network protocol
+        """
+        return [row.to_dict() for row in self]
+
+    @classmethod
+    def from_list(cls, rows: List[dict]) -> 'Batch':
+        """
+        Build a batch back from Batch.to_list
+        """
+        batch = cls()
+        for item in rows:
+            batch.add(RowMutations.from_dict(item))
+        return batch
+
+
+def check_row(row_mutations: RowMutations, row: Union[dict, None], column_families: List[str]) -> Union[str, None]:
+    """
+    Check the mutations of a row against its current content
+    @param row_mutations: RowMutations
+    @param row: dict - {family: {column: {timestamp: value}}} or None for a new or missing row
+    @param column_families: list[str] - families of the table
+    @return: str - why the row cannot be mutated, None if it can
+    """
+    if not row_mutations.mutations:
+        return 'No mutations for the row'
+    if row_mutations.row_key is not None and row is None:
+        return 'Row key does not exist'
+    columns = set()
+    for family, family_columns in (row or {}).items():
+        columns.update((family, column) for column in family_columns)
+    exists = True
+    for mutation in row_mutations.mutations:
+        if not exists:
+            return 'Row is deleted earlier in the batch'
+        if mutation['op'] == DELETE_ROW:
+            if row_mutations.row_key is None:
+                return 'A new row cannot be deleted'
+            exists = False
+            continue
+        if mutation['family'] not in column_families:
+            return f"Column family {mutation['family']} does not exist"
+        if mutation['op'] == PUT:
+            columns.add((mutation['family'], mutation['column']))
+        elif (mutation['family'], mutation['column']) not in columns:
+            return f"Column {mutation['family']}:{mutation['column']} does not exist"
+        else:
+            columns.discard((mutation['family'], mutation['column']))
+    return None
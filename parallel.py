@@ -0,0 +1,152 @@
+"""
+Parallel scans and counts over a process pool
+The key range of a scan is cut into shards at the split keys of the table (segment blocks,
+regions), every worker opens the table on its own and reads one shard, and the shards are
+returned in key order, so rows come out exactly as a single-threaded scan returns them.
+Workers are started with the spawn method: scripts using parallel scans need the usual
+`if __name__ == '__main__':` guard.
+"""
+import os
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterator, List, Tuple, Union
+
+from filters import Filter
+from scanner import ScanCursor, parse_columns, read_families
+from storage_engine import TableStore, open_store
+
+DEFAULT_SCAN_WORKERS = os.cpu_count() or 1
+# shards per worker, more shards balance uneven ranges at the cost of opening the table more often
+SHARDS_PER_WORKER = 2
+
+
+def key_ranges(split_keys: List[str], start_row: str = None, stop_row: str = None, shards: int = 1) -> List[Tuple[Union[str, None], Union[str, None]]]:
+    """
+    Cut [start_row, stop_row) into at most shards ranges holding about as many split keys each
+    @param split_keys: list[str] - sorted row keys from TableStore.split_keys
+    @return: list of (start_row, stop_row) - contiguous and in key order
+    """
+    row_keys = [
+        row_key for row_key in split_keys
+        if (start_row is None or row_key > start_row) and (stop_row is None or row_key < stop_row)
+    ]
+    bounds = []
+    if row_keys:
+        for shard in range(1, shards):
+            row_key = row_keys[len(row_keys) * shard // shards]
+            if not bounds or row_key > bounds[-1]:
+                bounds.append(row_key)
+    edges = [start_row] + bounds + [stop_row]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def scan_shard(base_path: str, table_name: str, store_options: dict, start_row: str, stop_row: str, prefix: str = None, columns: List[str] = None, limit: int = None, versions: int = None, row_filter: Filter = None) -> List[Tuple[str, dict]]:
+    """
+    Read the rows of one shard in a worker, filtered and projected like ScanCursor does
+    @return: list of (row_key, row) in key order
+    """
+    store = open_store(base_path, table_name, **store_options)
+    try:
+        key_filter = row_filter.filter_row_key if row_filter is not None else None
+        rows = store.scan_rows(start_row, stop_row, key_filter, read_families(parse_columns(columns), row_filter))
+        return list(ScanCursor(rows, prefix, columns, limit, versions=versions, row_filter=row_filter))
+    finally:
+        store.discard()
+
+
+def count_shard(base_path: str, table_name: str, store_options: dict, start_row: str, stop_row: str) -> int:
+    """
+    Count the live rows of one shard in a worker
+    """
+    store = open_store(base_path, table_name, **store_options)
+    try:
+        return sum(1 for _ in store.scan_rows(start_row, stop_row))
+    finally:
+        store.discard()
+
+
+class ShardPool:
+    """
+    Process pool shared by the parallel scans of a database, started on first use
+    """
+    def __init__(self, workers: int = DEFAULT_SCAN_WORKERS) -> None:
+        """
+        @param workers: int - worker processes, the number of cores as default
+        """
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _executor(self) -> Executor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def shards(self, store: TableStore, start_row: str = None, stop_row: str = None) -> List[Tuple[Union[str, None], Union[str, None]]]:
+        """
+        @param store: TableStore
+        @return: list of (start_row, stop_row) - the shards of a scan over the table
+        """
+        return key_ranges(store.split_keys(start_row, stop_row), start_row, stop_row, self.workers * SHARDS_PER_WORKER)
+
+    def map(self, function: Callable, tasks: Iterator[tuple]) -> Iterator:
+        """
+        Run function(*task) for every task in the pool
+        At most two rounds of tasks are in flight, so results are held in memory only until they are consumed
+        @return: iterator - the results in the order of the tasks
+        """
+        executor = self._executor()
+        tasks = iter(tasks)
+        pending = deque(executor.submit(function, *task) for task in itertools.islice(tasks, 2 * self.workers))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for task in itertools.islice(tasks, 1):
+                    pending.append(executor.submit(function, *task))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def scan_rows(self, store: TableStore, store_options: dict, start_row: str = None, stop_row: str = None, prefix: str = None, columns: List[str] = None, limit: int = None, versions: int = None, row_filter: Filter = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Scan a table shard by shard in the pool, arguments as for ScanCursor
+        @param store: TableStore
+        @param store_options: dict - options the workers open the table with
+        @return: iterator of (row_key, row) in key order, filtered and projected
+        """
+        tasks = (
+            (store.base_path, store.table_name, store_options, shard_start, shard_stop, prefix, columns, limit, versions, row_filter)
+            for shard_start, shard_stop in self.shards(store, start_row, stop_row)
+        )
+        shards = self.map(scan_shard, tasks)
+        try:
+            for rows in shards:
+                yield from rows
+        finally:
+            shards.close()
+
+    def count_rows(self, store: TableStore, store_options: dict) -> int:
+        """
+        Count the live rows of a table shard by shard in the pool
+        @param store: TableStore
+        @param store_options: dict - options the workers open the table with
+        @return: int
+        """
+        tasks = (
+            (store.base_path, store.table_name, store_options, shard_start, shard_stop)
+            for shard_start, shard_stop in self.shards(store)
+        )
+        return sum(self.map(count_shard, tasks))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
@@ -0,0 +1,72 @@
+"""
+Wire format shared by server.py and client.py
+Every message is a 4 byte big-endian length followed by that many bytes of UTF-8 JSON.
+A request is {'id': int, 'op': str, 'args': list, 'kwargs': dict} and its response
+{'id': int, 'success': bool, 'message': str, 'data': dict}, sent back on the same connection.
+JSON object keys are strings, so dicts with int keys, the {timestamp: value} versions of a cell,
+travel as {'__ebase_versions__': [[key, value], ...]} and are rebuilt with their int keys and order.
+"""
+import json
+import socket
+import struct
+from typing import Union
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9099
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+HEADER = struct.Struct('>I')
+VERSIONS_KEY = '__ebase_versions__'
+
+
+def _encode(value):
+    """
+    Replace the dicts with int keys of a message by tagged lists of [key, value] pairs
+    """
+    if isinstance(value, dict):
+        if value and all(type(key) is int for key in value):
+            return {VERSIONS_KEY: [[key, _encode(item)] for key, item in value.items()]}
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(item: dict) -> dict:
+    if len(item) == 1 and VERSIONS_KEY in item:
+        return {key: value for key, value in item[VERSIONS_KEY]}
+    return item
+
+
+def send_message(sock: socket.socket, message: dict) -> None:
+    payload = json.dumps(_encode(message), separators=(',', ':'), default=str).encode('utf-8')
+    if len(payload) > MAX_MESSAGE_SIZE:
+        raise ValueError(f'Message of {len(payload)} bytes is larger than {MAX_MESSAGE_SIZE}')
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Union[bytes, None]:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1024 * 1024))
+        if not chunk:
+            if buffer:
+                raise ConnectionError('Connection closed in the middle of a message')
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+
+def recv_message(sock: socket.socket) -> Union[dict, None]:
+    """
+    @return: dict - next message, None if the peer closed the connection
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    size, = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f'Message of {size} bytes is larger than {MAX_MESSAGE_SIZE}')
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        raise ConnectionError('Connection closed in the middle of a message')
+    return json.loads(payload, object_hook=_decode)
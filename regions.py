@@ -0,0 +1,477 @@
+"""
+Tables sharded by row key range into regions, every region is a table of the json or lsm engine
+
+storage/<db>/<table>/regions.json holds the table metadata and the region map, every region
+lives next to it as region-<id>.json or region-<id>/ depending on the engine. A region
+covers [start_row, end_row) and is split at its middle row key once its files grow past
+the split size of the table.
+"""
+import os
+import json
+import bisect
+import shutil
+import itertools
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from locks import ReadWriteLock
+from storage_engine import STORAGE_ENGINES, REGION_MAP, TableStore, LSMTableStore, mutation_size
+
+REGION_LOCK = 'regions.lock'
+REGION_PREFIX = 'region-'
+DEFAULT_REGION_SPLIT_SIZE = 64 * 1024 * 1024
+
+
+def disk_size(path: str) -> int:
+    """
+    Bytes used by a file or by every file under a directory
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class Region:
+    """
+    One row key range of a table and the store holding its rows
+    """
+    def __init__(self, name: str, start_row: Union[str, None], end_row: Union[str, None], store: TableStore) -> None:
+        """
+        @param name: str
+        @param start_row: str - first row key, inclusive, None for the first region
+        @param end_row: str - last row key, exclusive, None for the last region
+        @param store: TableStore
+        """
+        self.name = name
+        self.start_row = start_row
+        self.end_row = end_row
+        self.store = store
+        self.size = disk_size(store.path)
+        self.written = 0
+        self.readers = 0
+        self.retired = False
+        self.delete = True
+
+    def overlaps(self, start_row: Union[str, None], stop_row: Union[str, None]) -> bool:
+        return (stop_row is None or self.start_row is None or self.start_row < stop_row) and \
+            (start_row is None or self.end_row is None or start_row < self.end_row)
+
+    def clip(self, start_row: Union[str, None], stop_row: Union[str, None]) -> Tuple[Union[str, None], Union[str, None]]:
+        """
+        @return: tuple - (start_row, stop_row) of a scan limited to the region
+        """
+        if self.start_row is not None and (start_row is None or start_row < self.start_row):
+            start_row = self.start_row
+        if self.end_row is not None and (stop_row is None or stop_row > self.end_row):
+            stop_row = self.end_row
+        return start_row, stop_row
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "start_row": self.start_row, "end_row": self.end_row}
+
+
+class RegionedTableStore(TableStore):
+    """
+    Table split by row key range into regions stored by one of the other engines
+    Reads and writes go to the region owning the row key only, scans walk the regions in
+    key order. Readers share and writers hold exclusively the table lock, which spans
+    processes through <table>/regions.lock; every region also keeps its own lock. A region
+    is split while the write that made it too large still holds the lock, scans already
+    reading it keep the old files until they are done.
+    """
+    def __init__(self, base_path: str, table_name: str, **options) -> None:
+        """
+        @param options: options forwarded to the lsm engine of the regions
+        """
+        super().__init__(base_path, table_name)
+        self.path = os.path.join(base_path, table_name)
+        self.options = options
+        self.lock = ReadWriteLock(os.path.join(self.path, REGION_LOCK))
+        self.regions_lock = threading.Lock()
+        self.regions: List[Region] = []
+        self.on_region_open = None
+        self.reloads = 0
+        self.splits = 0
+        self.closed = False
+        with self.lock.write():
+            self._load()
+
+    @classmethod
+    def create(cls, base_path: str, table_name: str, metadata: dict, storage_engine: str = LSMTableStore.engine_name, region_split_size: int = DEFAULT_REGION_SPLIT_SIZE, **options) -> 'RegionedTableStore':
+        """
+        Create a table with a single region covering every row key
+        @param storage_engine: str - engine of the regions, 'lsm' as default
+        @param region_split_size: int - bytes of a region before it is split
+        """
+        if storage_engine not in STORAGE_ENGINES:
+            raise ValueError(f'Unknown storage engine {storage_engine}')
+        if region_split_size < 1:
+            raise ValueError('region_split_size must be greater than 0')
+        path = os.path.join(base_path, table_name)
+        os.makedirs(path)
+        metadata['storage_engine'] = storage_engine
+        metadata['region_split_size'] = region_split_size
+        name = f'{REGION_PREFIX}{1:06d}'
+        STORAGE_ENGINES[storage_engine].create(path, name, cls._region_metadata(metadata, name), **options).close()
+        _write_region_map(path, {
+            "table_metadata": metadata,
+            "regions": [{"name": name, "start_row": None, "end_row": None}],
+            "next_region_id": 2
+        })
+        return cls(base_path, table_name, **options)
+
+    @staticmethod
+    def _region_metadata(metadata: dict, name: str) -> dict:
+        region_metadata = dict(metadata)
+        region_metadata.pop('region_split_size', None)
+        region_metadata.pop('group_commit', None)
+        region_metadata['table_name'] = name
+        region_metadata['rows'] = 0
+        return region_metadata
+
+    def _signature(self) -> Tuple[int, int]:
+        stat = os.stat(os.path.join(self.path, REGION_MAP))
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self) -> None:
+        """
+        Read the region map and open the regions not open yet, the write lock has to be held
+        """
+        with open(os.path.join(self.path, REGION_MAP), 'r') as f:
+            region_map = json.load(f)
+        self._metadata = region_map['table_metadata']
+        self.next_region_id = region_map['next_region_id']
+        self.engine_name = self._metadata['storage_engine']
+        self.split_size = self._metadata['region_split_size']
+        opened = {region.name: region for region in self.regions}
+        regions = []
+        for entry in region_map['regions']:
+            region = opened.pop(entry['name'], None)
+            if region is None:
+                region = Region(entry['name'], entry['start_row'], entry['end_row'], self._open_region(entry['name']))
+            regions.append(region)
+        self.regions = regions
+        # regions split by another process, their files are gone or about to be
+        for region in opened.values():
+            self._retire(region, drop=False)
+        self.signature = self._signature()
+
+    def _open_region(self, name: str, create: bool = False) -> TableStore:
+        store_class = STORAGE_ENGINES[self.engine_name]
+        if create:
+            store = store_class.create(self.path, name, self._region_metadata(self._metadata, name), **self.options)
+        elif store_class is LSMTableStore:
+            store = store_class(self.path, name, **self.options)
+        else:
+            store = store_class(self.path, name)
+        if self.on_region_open is not None:
+            self.on_region_open(store)
+        return store
+
+    def _save_map(self) -> None:
+        _write_region_map(self.path, {
+            "table_metadata": self._metadata,
+            "regions": [region.to_dict() for region in self.regions],
+            "next_region_id": self.next_region_id
+        })
+        self.signature = self._signature()
+
+    def _sync(self) -> None:
+        """
+        Reload the region map if another process changed it, the write lock has to be held
+        """
+        if not self.closed and self._signature() != self.signature:
+            self._load()
+            self.reloads += 1
+
+    def _refresh(self) -> None:
+        if not self.closed and not self.lock.reading() and self._signature() != self.signature:
+            with self.lock.write():
+                self._sync()
+
+    def watch_regions(self, on_region_open: Callable[[TableStore], None]) -> None:
+        """
+        Call on_region_open with the store of every region, the open ones now and the new ones when they are created
+        """
+        self.on_region_open = on_region_open
+        for region in list(self.regions):
+            on_region_open(region.store)
+
+    def region_stores(self) -> List[TableStore]:
+        self._refresh()
+        with self.lock.read():
+            return [region.store for region in self.regions]
+
+    def _region_index(self, row_key: str) -> int:
+        starts = [region.start_row or '' for region in self.regions]
+        return bisect.bisect_right(starts, row_key) - 1
+
+    def region_of(self, row_key: str) -> Region:
+        """
+        @return: Region - the region owning a row key
+        """
+        self._refresh()
+        with self.lock.read():
+            return self.regions[self._region_index(row_key)]
+
+    @property
+    def generation(self) -> tuple:
+        self._refresh()
+        with self.lock.read():
+            return tuple((region.name, region.store.generation) for region in self.regions)
+
+    @property
+    def metadata(self) -> dict:
+        self._refresh()
+        with self.lock.read():
+            metadata = dict(self._metadata)
+            metadata['rows'] = sum(region.store.metadata['rows'] for region in self.regions)
+            return metadata
+
+    def update_metadata(self, changes: dict) -> None:
+        with self.lock.write():
+            self._sync()
+            changes = dict(changes)
+            changes.pop('rows', None)
+            self._metadata.update(changes)
+            self._save_map()
+
+    def get_row(self, row_key: str, families: List[str] = None) -> Union[dict, None]:
+        self._refresh()
+        with self.lock.read():
+            store = self.regions[self._region_index(row_key)].store
+            return store.get_row(row_key, families)
+
+    def get_rows(self, row_keys: List[str], families: List[str] = None) -> Dict[str, dict]:
+        self._refresh()
+        with self.lock.read():
+            groups: Dict[int, List[str]] = {}
+            for row_key in sorted(set(row_keys)):
+                groups.setdefault(self._region_index(row_key), []).append(row_key)
+            rows = {}
+            for index, region_keys in groups.items():
+                rows.update(self.regions[index].store.get_rows(region_keys, families))
+            return rows
+
+    def scan_rows(self, start_row: str = None, stop_row: str = None, key_filter: Callable[[str], bool] = None, families: List[str] = None) -> Iterator[Tuple[str, dict]]:
+        self._refresh()
+        with self.lock.read():
+            regions = [region for region in self.regions if region.overlaps(start_row, stop_row)]
+            with self.regions_lock:
+                for region in regions:
+                    region.readers += 1
+        try:
+            for region in regions:
+                region_start, region_stop = region.clip(start_row, stop_row)
+                yield from region.store.scan_rows(region_start, region_stop, key_filter, families)
+        finally:
+            for region in regions:
+                self._release(region)
+
+    def split_keys(self, start_row: str = None, stop_row: str = None) -> List[str]:
+        """
+        The start row of every region inside the range and the split keys of each region
+        """
+        self._refresh()
+        with self.lock.read():
+            regions = [region for region in self.regions if region.overlaps(start_row, stop_row)]
+            with self.regions_lock:
+                for region in regions:
+                    region.readers += 1
+        try:
+            row_keys = []
+            for region in regions:
+                region_start, region_stop = region.clip(start_row, stop_row)
+                if region_start is not None and region_start != start_row:
+                    row_keys.append(region_start)
+                row_keys.extend(region.store.split_keys(region_start, region_stop))
+            return row_keys
+        finally:
+            for region in regions:
+                self._release(region)
+
+    def _release(self, region: Region) -> None:
+        with self.regions_lock:
+            region.readers -= 1
+            unused = region.retired and region.readers == 0
+        if unused:
+            self._remove(region)
+
+    def _retire(self, region: Region, drop: bool = True) -> None:
+        """
+        Forget a region replaced by a split, its files are closed once no scan is reading them
+        @param drop: bool - also delete the files, False when another process split the region
+        """
+        with self.regions_lock:
+            region.retired = True
+            region.delete = drop
+            unused = region.readers == 0
+        if unused:
+            self._remove(region)
+
+    def _remove(self, region: Region) -> None:
+        if region.delete:
+            region.store.drop()
+        else:
+            region.store.discard()
+
+    def apply(self, mutations: List[dict]) -> None:
+        with self.lock.write():
+            self._sync()
+            groups = {}
+            for mutation in mutations:
+                groups.setdefault(self._region_index(mutation['row']), []).append(mutation)
+            regions = [self.regions[index] for index in sorted(groups)]
+            for region, index in zip(regions, sorted(groups)):
+                region.store.apply(groups[index])
+                region.written += sum(mutation_size(mutation) for mutation in groups[index])
+            self._split_large(regions)
+
+    def load_rows(self, rows: Iterator[Tuple[str, dict]], new_rows: bool = False) -> int:
+        with self.lock.write():
+            self._sync()
+            count = 0
+            touched = []
+            for index, region_rows in itertools.groupby(rows, key=lambda item: self._region_index(item[0])):
+                region = self.regions[index]
+                count += region.store.load_rows(region_rows, new_rows)
+                region.size = disk_size(region.store.path)
+                region.written = 0
+                touched.append(region)
+            self._split_large(touched)
+            return count
+
+    def _split_large(self, regions: List[Region]) -> None:
+        """
+        Split the regions that grew past the split size, the halves are checked again
+        Written bytes are only an estimate, the files are measured before a region is split
+        """
+        pending = list(regions)
+        while pending:
+            region = pending.pop()
+            if region.retired or region.size + region.written < self.split_size:
+                continue
+            region.store.flush()
+            region.size = disk_size(region.store.path)
+            region.written = 0
+            if region.size < self.split_size:
+                continue
+            halves = self._split(region)
+            if halves is not None:
+                pending.extend(halves)
+
+    def _new_region_name(self) -> str:
+        name = f'{REGION_PREFIX}{self.next_region_id:06d}'
+        self.next_region_id += 1
+        return name
+
+    def _split(self, region: Region) -> Union[Tuple[Region, Region], None]:
+        """
+        Split a region at its middle row key, the write lock has to be held
+        @return: tuple - (left, right) regions or None if the region has a single row
+        """
+        row_keys = [row_key for row_key, _ in region.store.scan_rows()]
+        if len(row_keys) < 2:
+            return None
+        middle = row_keys[len(row_keys) // 2]
+        halves = []
+        for start_row, end_row in ((region.start_row, middle), (middle, region.end_row)):
+            name = self._new_region_name()
+            store = self._open_region(name, create=True)
+            store.load_rows(region.store.scan_rows(start_row, end_row), new_rows=True)
+            halves.append(Region(name, start_row, end_row, store))
+        index = self.regions.index(region)
+        self.regions[index:index+1] = halves
+        self._save_map()
+        self.splits += 1
+        self._retire(region)
+        return halves[0], halves[1]
+
+    def truncate(self) -> None:
+        with self.lock.write():
+            self._sync()
+            for region in self.regions:
+                region.store.truncate()
+                region.size = disk_size(region.store.path)
+                region.written = 0
+
+    def flush(self) -> None:
+        with self.lock.write():
+            for region in self.regions:
+                region.store.flush()
+
+    def invalidate(self) -> None:
+        with self.lock.write():
+            for region in self.regions:
+                region.store.invalidate()
+            self.signature = None
+
+    def _close_regions(self, close: bool) -> None:
+        self.closed = True
+        for region in self.regions:
+            if close:
+                region.store.close()
+            else:
+                region.store.discard()
+
+    def close(self) -> None:
+        with self.lock.write():
+            if not self.closed:
+                self._close_regions(True)
+        self.lock.close()
+
+    def discard(self) -> None:
+        with self.lock.write():
+            if not self.closed:
+                self._close_regions(False)
+        self.lock.close()
+
+    def drop(self) -> None:
+        with self.lock.write():
+            if not self.closed:
+                self._close_regions(False)
+            shutil.rmtree(self.path)
+        self.lock.close()
+
+    def rename(self, new_name: str) -> None:
+        self.close()
+        os.rename(self.path, os.path.join(self.base_path, new_name))
+
+    def stats(self) -> dict:
+        self._refresh()
+        with self.lock.read():
+            regions = []
+            for region in self.regions:
+                regions.append({
+                    "name": region.name,
+                    "start_row": region.start_row,
+                    "end_row": region.end_row,
+                    "rows": region.store.metadata['rows'],
+                    "size": disk_size(region.store.path)
+                })
+            return {
+                "storage_engine": self.engine_name,
+                "region_split_size": self.split_size,
+                "splits": self.splits,
+                "regions": regions
+            }
+
+
+def _write_region_map(path: str, region_map: dict) -> None:
+    """
+    Atomically replace the region map of a table
+    """
+    map_path = os.path.join(path, REGION_MAP)
+    tmp_path = map_path+'.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(region_map, indent=4))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, map_path)
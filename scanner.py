@@ -0,0 +1,233 @@
+"""
+Cursors over the rows of a table, returned by EBase.scan, and cell scanners returned by EBase.open_scanner
+"""
+import itertools
+from typing import Dict, Iterator, List, Set, Tuple, Union
+
+from filters import Filter
+
+MAX_CHAR = chr(0x10ffff)
+
+
+def prefix_stop_row(prefix: str) -> Union[str, None]:
+    """
+    Get the smallest row key greater than every row key starting with a prefix
+    @param prefix: str
+    @return: str or None if no such key exists
+    """
+    prefix = prefix.rstrip(MAX_CHAR)
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def parse_columns(columns: List[str]) -> Union[Dict[str, Union[Set[str], None]], None]:
+    """
+    Parse a column projection
+    @param columns: list[str] - 'family' for a whole family or 'family:column' for one column
+    @return: dict - {family: set(columns) or None for the whole family}, None for no projection
+    """
+    if columns is None:
+        return None
+    projection = {}
+    for name in columns:
+        family, _, column = name.partition(':')
+        if not column:
+            projection[family] = None
+        elif projection.get(family, set()) is not None:
+            projection.setdefault(family, set()).add(column)
+    return projection
+
+
+def read_families(projection: Union[dict, None], row_filter: Filter = None) -> Union[List[str], None]:
+    """
+    Column families a projected read has to load: the projected ones and the ones the filter reads
+    @param projection: dict - parsed by parse_columns
+    @param row_filter: Filter (optional)
+    @return: list[str] - sorted, None to read every family
+    """
+    if projection is None:
+        return None
+    families = set(projection)
+    if row_filter is not None:
+        families |= row_filter.families()
+    return sorted(families)
+
+
+def project_row(row: dict, projection: Union[dict, None], versions: Union[int, None]) -> Union[dict, None]:
+    """
+    Keep the requested columns and number of versions of a row
+    @param row: dict - {family: {column: {timestamp: value}}}
+    @param projection: dict - parsed by parse_columns, None keeps every column
+    @param versions: int - newest versions kept per column, None keeps every version
+    @return: dict or None if nothing of the row was requested
+    """
+    if projection is None and versions is None:
+        return row
+    result = {}
+    for family, columns in row.items():
+        if projection is not None and family not in projection:
+            continue
+        wanted = projection[family] if projection is not None else None
+        result_family = {}
+        for column, cells in columns.items():
+            if wanted is not None and column not in wanted:
+                continue
+            if versions is not None and len(cells) > versions:
+                cells = dict(itertools.islice(cells.items(), versions))
+            result_family[column] = cells
+        if result_family or wanted is None:
+            result[family] = result_family
+    return result or None
+
+
+class ScanCursor:
+    """
+    Lazy cursor over the rows of a scan, in row key order
+    Rows are read from the table only when they are requested, so a scan holds at
+    most one batch of rows in memory. Iterate it for (row_key, row) pairs or call
+    next_batch for lists of up to batch_size pairs; close it to release the table files.
+    """
+    def __init__(self, rows: Iterator[Tuple[str, dict]], prefix: str = None, columns: List[str] = None, limit: int = None, batch_size: int = 100, versions: int = None, row_filter: Filter = None) -> None:
+        """
+        @param rows: iterator of (row_key, row) in row key order
+        @param prefix: str (optional) - only rows whose key starts with it
+        @param columns: list[str] (optional) - 'family' or 'family:column' to return
+        @param limit: int (optional) - max number of rows
+        @param batch_size: int - rows returned by next_batch
+        @param versions: int (optional) - newest versions returned per column
+        @param row_filter: Filter (optional) - evaluated on every row before the projection
+        """
+        self.rows = rows
+        self.prefix = prefix
+        self.projection = parse_columns(columns)
+        self.limit = limit
+        self.batch_size = batch_size
+        self.versions = versions
+        self.row_filter = row_filter
+        self.rows_returned = 0
+        self.closed = False
+
+    def __iter__(self) -> Iterator[Tuple[str, dict]]:
+        return self
+
+    def __next__(self) -> Tuple[str, dict]:
+        if self.closed or (self.limit is not None and self.rows_returned >= self.limit):
+            self.close()
+            raise StopIteration
+        for row_key, row in self.rows:
+            if self.prefix is not None and not row_key.startswith(self.prefix):
+                continue
+            if self.row_filter is not None:
+                row = self.row_filter.filter_row(row_key, row)
+                if row is None:
+                    continue
+            row = project_row(row, self.projection, self.versions)
+            if row is None:
+                continue
+            self.rows_returned += 1
+            return row_key, row
+        self.close()
+        raise StopIteration
+
+    def next_batch(self) -> List[Tuple[str, dict]]:
+        """
+        Get the next rows of the scan
+        @return: list of (row_key, row) - at most batch_size pairs, empty once the scan is over
+        """
+        batch = []
+        for row_key, row in self:
+            batch.append((row_key, row))
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+    def batches(self) -> Iterator[List[Tuple[str, dict]]]:
+        """
+        Iterate the scan one batch at a time
+        """
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                return
+            yield batch
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            if hasattr(self.rows, 'close'):
+                self.rows.close()
+
+    def __enter__(self) -> 'ScanCursor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class Scanner:
+    """
+    Streams the cells of a scan one at a time as (row_key, family, column, timestamp, value)
+    Cells come in row key order, then family and column order, newest version first.
+    Rows are pulled from the table only when their first cell is requested, so the first
+    cells are available before the table has been read and memory does not grow with the table.
+    """
+    def __init__(self, cursor: ScanCursor) -> None:
+        """
+        @param cursor: ScanCursor - rows to stream
+        """
+        self.cursor = cursor
+        self.cells = None
+        self.cells_returned = 0
+
+    def open(self) -> 'Scanner':
+        """
+        Start the scan, calling it again has no effect
+        """
+        if self.cells is None:
+            self.cells = self._cells()
+        return self
+
+    def _cells(self) -> Iterator[Tuple[str, str, str, int, str]]:
+        for row_key, row in self.cursor:
+            for family in sorted(row):
+                columns = row[family]
+                for column in sorted(columns):
+                    versions = columns[column]
+                    for timestamp, value in versions.items():
+                        yield row_key, family, column, timestamp, value
+
+    def next(self) -> Union[Tuple[str, str, str, int, str], None]:
+        """
+        Get the next cell
+        @return: tuple - (row_key, family, column, timestamp, value) or None once the scan is over
+        """
+        self.open()
+        cell = next(self.cells, None)
+        if cell is None:
+            self.close()
+        else:
+            self.cells_returned += 1
+        return cell
+
+    def __iter__(self) -> Iterator[Tuple[str, str, str, int, str]]:
+        while True:
+            cell = self.next()
+            if cell is None:
+                return
+            yield cell
+
+    @property
+    def rows_returned(self) -> int:
+        return self.cursor.rows_returned
+
+    def close(self) -> None:
+        if self.cells is not None:
+            self.cells.close()
+        self.cursor.close()
+
+    def __enter__(self) -> 'Scanner':
+        return self.open()
+
+    def __exit__(self, *args) -> None:
+        self.close()
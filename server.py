@@ -0,0 +1,190 @@
+"""
+Long-running EBase server, clients share one open database over TCP
+
+    python main.py serve
+    python main.py serve --host 0.0.0.0 --port 9099 --db root
+"""
+import argparse
+import itertools
+import signal
+import socket
+import socketserver
+import threading
+from typing import Dict
+
+import pandas as pd
+
+from EBase import EBase
+from mutations import Batch, RowMutations
+from protocol import DEFAULT_HOST, DEFAULT_PORT, recv_message, send_message
+from scanner import ScanCursor
+
+# EBase operations callable as they are, their responses are plain data
+PASSTHROUGH_OPS = {
+    'table_exists', 'create', 'list_tables', 'disable', 'is_enabled', 'enable', 'alter', 'drop', 'describe',
+    'put', 'get', 'delete', 'delete_all', 'count', 'truncate', 'update_many', 'flush', 'compact',
+    'set_group_commit', 'cache_stats', 'aggregate',
+    'create_index', 'drop_index', 'rebuild_index', 'get_by', 'get_many'
+}
+DEFAULT_SCAN_BATCH_SIZE = 1000
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serves the requests of one connection in order, the scans it opened are closed when it goes away
+    """
+    def setup(self) -> None:
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.cursors: Dict[int, ScanCursor] = {}
+        self.cursor_ids = itertools.count(1)
+
+    def handle(self) -> None:
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if request is None:
+                return
+            response = self.dispatch(request)
+            response['id'] = request.get('id')
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+    def finish(self) -> None:
+        for cursor in self.cursors.values():
+            cursor.close()
+        self.cursors.clear()
+
+    def dispatch(self, request: dict) -> dict:
+        op = request.get('op')
+        args = request.get('args', [])
+        kwargs = request.get('kwargs', {})
+        try:
+            if op in PASSTHROUGH_OPS:
+                kwargs.pop('wait', None)
+                output = getattr(self.server.db, op)(*args, **kwargs)
+                output['data'].pop('future', None)
+                return output
+            handler = getattr(self, 'op_'+str(op), None)
+            if handler is None:
+                return {'success': False, 'message': f'Unknown operation {op}', "data": {}}
+            return handler(*args, **kwargs)
+        except Exception as e:
+            return {'success': False, 'message': str(e), "data": {}}
+
+    def _scan_page(self, scanner_id: int) -> dict:
+        cursor = self.cursors[scanner_id]
+        rows = cursor.next_batch()
+        done = len(rows) < cursor.batch_size
+        if done:
+            self.cursors.pop(scanner_id).close()
+        res = {
+            "scanner_id": scanner_id,
+            "rows": rows,
+            "done": done
+        }
+        return {'success': True, 'message': 'Rows scanned successfully', "data": res}
+
+    def op_scan(self, table_name: str, batch_size: int = DEFAULT_SCAN_BATCH_SIZE, **kwargs) -> dict:
+        """
+        Open a scan and return its first page of rows, the next pages come from scan_next
+        """
+        if 'filter' in kwargs:
+            return {'success': False, 'message': 'Filters are not supported over the network', "data": {}}
+        output = self.server.db.scan(table_name, batch_size=batch_size, **kwargs)
+        if not output['success']:
+            return output
+        scanner_id = next(self.cursor_ids)
+        self.cursors[scanner_id] = output['data']['cursor']
+        return self._scan_page(scanner_id)
+
+    def op_scan_next(self, scanner_id: int) -> dict:
+        if scanner_id not in self.cursors:
+            return {'success': False, 'message': 'Scanner does not exist', "data": {}}
+        return self._scan_page(scanner_id)
+
+    def op_scan_close(self, scanner_id: int) -> dict:
+        cursor = self.cursors.pop(scanner_id, None)
+        if cursor is not None:
+            cursor.close()
+        return {'success': True, 'message': 'Scanner closed successfully', "data": {}}
+
+    def op_batch(self, table_name: str, rows: list) -> dict:
+        return self.server.db.batch(table_name, Batch.from_list(rows))
+
+    def op_mutate_row(self, table_name: str, row: dict) -> dict:
+        return self.server.db.mutate_row(table_name, RowMutations.from_dict(row))
+
+    def op_insert_many(self, table_name: str, column_family: str, frame: dict, return_rows: bool = True) -> dict:
+        """
+        @param frame: dict - the data frame as DataFrame.to_json(orient='split')
+        """
+        data_frame = pd.DataFrame(frame['data'], columns=frame['columns'])
+        return self.server.db.insert_many(table_name, column_family, data_frame, return_rows)
+
+    def op_ping(self) -> dict:
+        return {'success': True, 'message': 'pong', "data": {}}
+
+
+class EBaseServer(socketserver.ThreadingTCPServer):
+    """
+    TCP server sharing one EBase between every connection, one thread per connection
+    Tables stay open and cached between requests, clients never parse table files
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, db: EBase, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        """
+        @param db: EBase
+        @param host: str - '127.0.0.1' as default
+        @param port: int - 9099 as default, 0 picks a free port
+        """
+        self.db = db
+        super().__init__((host, port), RequestHandler)
+
+    @property
+    def address(self) -> tuple:
+        return self.server_address[:2]
+
+    def start(self) -> threading.Thread:
+        """
+        Serve in a background thread, e.g. for tests on localhost
+        """
+        thread = threading.Thread(target=self.serve_forever, name='ebase-server', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.db.close()
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(prog='main.py serve', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--db', default='root', help='database name, tables live in storage/<db>')
+    parser.add_argument('--storage-engine', default='lsm', choices=['lsm', 'json'])
+    args = parser.parse_args(argv)
+
+    server = EBaseServer(EBase(args.db, storage_engine=args.storage_engine), args.host, args.port)
+    host, port = server.address
+    print(f"EBase sirviendo la base de datos '{args.db}' en {host}:{port} (Ctrl+C para detener)", flush=True)
+    signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.db.close()
+        print("Servidor detenido.")
+
+
+if __name__ == '__main__':
+    main()
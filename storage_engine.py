@@ -0,0 +1,1693 @@
+"""
+Storage engines used by EBase to persist tables
+
+json: legacy engine, the whole table lives in storage/<db>/<table>.json and
+      every mutation rewrites the file
+lsm:  log-structured engine, storage/<db>/<table>/ holds the table descriptor,
+      a write-ahead log and immutable sorted segment files. Mutations are
+      appended to the log and buffered in a memstore that is flushed to a new
+      segment once it grows past its size limit. Like the stores of an HBase region,
+      flushes and compactions write one segment per column family, so a read of some
+      families only opens their segments
+
+Tables sharded by row key range (regions.py) keep storage/<db>/<table>/regions.json
+and one table of either engine per region next to it
+
+Segments of lsm tables use one of two cell formats chosen when the table is created:
+json:   one line per row with the JSON encoded row key and fragment
+binary: length-prefixed records with int64 microsecond timestamps and family and
+        column names replaced by ids of a dictionary kept in the segment footer
+
+Cell timestamps are int microseconds and the versions of a cell are kept newest first in
+every memstore, segment and json table; str(datetime) timestamps of older tables are
+converted when they are read
+"""
+import os
+import json
+import mmap
+import struct
+import datetime
+import heapq
+import itertools
+import bisect
+import shutil
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from bloom import BloomBuilder, BloomFilter, DEFAULT_BLOOM_FALSE_POSITIVE_RATE
+from locks import ReadWriteLock
+
+TABLE_DESCRIPTOR = 'table.json'
+REGION_MAP = 'regions.json'
+WAL_FILE = 'wal.log'
+LOCK_FILE = 'table.lock'
+LOCK_SUFFIX = '.lock'
+# lock files of the json tables, kept apart so the database directory only holds table files
+LOCK_DIR = '.locks'
+SEGMENT_SUFFIX = '.seg'
+CELL_FORMATS = ('json', 'binary')
+DEFAULT_MEMSTORE_FLUSH_SIZE = 4 * 1024 * 1024
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+_last_timestamp = 0
+_timestamp_lock = threading.Lock()
+
+
+def new_timestamp() -> int:
+    """
+    Timestamp of a new cell: microseconds since the epoch of the local clock, like the
+    str(datetime.now()) timestamps of older tables, and increasing within the process
+    @return: int
+    """
+    global _last_timestamp
+    micros = (datetime.datetime.now() - EPOCH) // ONE_MICROSECOND
+    with _timestamp_lock:
+        _last_timestamp = max(micros, _last_timestamp + 1)
+        return _last_timestamp
+
+
+def cell_timestamp(timestamp: Union[int, str, datetime.datetime]) -> int:
+    """
+    Convert a timestamp to the int microseconds cells are stored with
+    @param timestamp: int, datetime, str of digits (a JSON object key) or str(datetime) written by older tables
+    @return: int
+    """
+    if isinstance(timestamp, int):
+        return timestamp
+    if isinstance(timestamp, datetime.datetime):
+        return (timestamp.replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+    if timestamp.isdigit():
+        return int(timestamp)
+    try:
+        return (datetime.datetime.fromisoformat(timestamp).replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+    except ValueError:
+        raise ValueError(f'Invalid cell timestamp {timestamp!r}')
+
+
+def newest_first(versions: dict) -> dict:
+    """
+    Versions of a cell ordered from newest to oldest, sorted only if they are not already
+    """
+    timestamps = iter(versions)
+    previous = next(timestamps, None)
+    for timestamp in timestamps:
+        if timestamp > previous:
+            return {timestamp: versions[timestamp] for timestamp in sorted(versions, reverse=True)}
+        previous = timestamp
+    return versions
+
+
+def add_version(versions: dict, timestamp: int, value, max_versions: int = None) -> dict:
+    """
+    Add a version to the newest-first versions of a cell
+    A new timestamp goes in front without comparing the others and the oldest versions past
+    max_versions fall off the end, an older one (a clock going back) is put in its place
+    @return: dict - new versions, newest first
+    """
+    if versions and timestamp <= next(iter(versions)):
+        versions = newest_first({**versions, timestamp: value})
+    else:
+        versions = {timestamp: value, **versions}
+    if max_versions is not None and len(versions) > max_versions:
+        versions = dict(itertools.islice(versions.items(), max_versions))
+    return versions
+
+
+def select_versions(versions: dict, limit: int = None, min_timestamp: int = None, max_timestamp: int = None) -> dict:
+    """
+    Newest versions of a cell written in [min_timestamp, max_timestamp)
+    The versions are walked from the newest and the walk stops at the first one older than min_timestamp
+    @param versions: dict - {timestamp: value} newest first
+    @param limit: int (optional) - most versions returned, every one in the range as default
+    @return: dict - {timestamp: value} newest first
+    """
+    selected = {}
+    for timestamp, value in versions.items():
+        if limit is not None and len(selected) >= limit:
+            break
+        if max_timestamp is not None and timestamp >= max_timestamp:
+            continue
+        if min_timestamp is not None and timestamp < min_timestamp:
+            break
+        selected[timestamp] = value
+    return selected
+
+
+def decode_cells(cells: dict) -> dict:
+    """
+    Convert the cells of a row read from JSON to int timestamps, newest first
+    @param cells: dict - {family: {column: {timestamp: value}}} with str timestamps
+    """
+    return {
+        family: {
+            column: newest_first({cell_timestamp(timestamp): value for timestamp, value in versions.items()})
+            for column, versions in columns.items()
+        }
+        for family, columns in cells.items()
+    }
+
+
+def new_fragment() -> dict:
+    """
+    Create an empty row fragment
+    A fragment is the part of a row stored in one memstore or segment:
+    cells - {family: {column: {timestamp: value}}}
+    tombstones - {family: set(columns)} columns cleared by a delete
+    deleted - True when the whole row was deleted
+    @return: dict
+    """
+    return {"cells": {}, "tombstones": {}, "deleted": False}
+
+
+def merge_fragments(fragments: Iterator[dict], max_versions: int, families: List[str] = None) -> Union[dict, None]:
+    """
+    Merge the fragments of a row into the row seen by readers
+    Versions are kept newest first in every fragment and newer fragments hold newer versions,
+    so the versions of a column are concatenated and cut at max_versions; they are only sorted
+    when a fragment breaks the order (tables written before timestamps were ordered, clock skew)
+    A fragment read from the segment of one column family has a 'family' key, its deleted
+    marker only hides the older cells of that family
+    @param fragments: iterator of fragments ordered from newest to oldest
+    @param max_versions: int - number of versions kept per column
+    @param families: list[str] (optional) - only merge these column families, every family if not provided
+    @return: dict - {family: {column: {timestamp: value}}} or None if the row does not exist
+    """
+    row = {}
+    masked = set()
+    deleted_families = set()
+    unordered = set()
+    exists = False
+    for fragment in fragments:
+        for family, columns in fragment['cells'].items():
+            if family in deleted_families or (families is not None and family not in families):
+                continue
+            row_family = row.setdefault(family, {})
+            for column, versions in columns.items():
+                if (family, column) in masked:
+                    continue
+                exists = True
+                row_column = row_family.get(column)
+                if row_column is None:
+                    row_column = row_family[column] = {}
+                elif len(row_column) >= max_versions and (family, column) not in unordered:
+                    if versions and next(iter(versions)) < next(reversed(row_column)):
+                        continue
+                for timestamp, value in versions.items():
+                    if timestamp in row_column:
+                        continue
+                    if row_column and timestamp > next(reversed(row_column)):
+                        unordered.add((family, column))
+                    elif len(row_column) >= max_versions and (family, column) not in unordered:
+                        break
+                    row_column[timestamp] = value
+        for family, columns in fragment['tombstones'].items():
+            if family in deleted_families or (families is not None and family not in families):
+                continue
+            for column in columns:
+                if (family, column) not in masked:
+                    row.setdefault(family, {}).setdefault(column, {})
+                    masked.add((family, column))
+                    exists = True
+        if fragment['deleted']:
+            if fragment.get('family') is None:
+                break
+            deleted_families.add(fragment['family'])
+    if not exists:
+        return None
+
+    for family, column in unordered:
+        versions = newest_first(row[family][column])
+        row[family][column] = dict(itertools.islice(versions.items(), max_versions))
+    return row
+
+
+def select_families(row: Union[dict, None], families: List[str] = None) -> Union[dict, None]:
+    """
+    Keep the column families of a row read as a whole
+    @return: dict or None if the row has none of the families
+    """
+    if row is None or families is None:
+        return row
+    return {family: columns for family, columns in row.items() if family in families} or None
+
+
+def split_fragment(fragment: dict, marker_families: List[str] = ()) -> List[Tuple[str, dict]]:
+    """
+    Cut a fragment into one fragment per column family, for the segments of every family
+    @param marker_families: list[str] (optional) - families that get the marker of a deleted row even without its cells
+    @return: list of (family, fragment) in family order
+    """
+    families = set(fragment['cells']) | set(fragment['tombstones'])
+    if fragment['deleted']:
+        families.update(marker_families)
+    parts = []
+    for family in sorted(families):
+        part = new_fragment()
+        if family in fragment['cells']:
+            part['cells'][family] = fragment['cells'][family]
+        if family in fragment['tombstones']:
+            part['tombstones'][family] = fragment['tombstones'][family]
+        part['deleted'] = fragment['deleted']
+        parts.append((family, part))
+    return parts
+
+
+def mutation_size(mutation: dict) -> int:
+    """
+    Approximate the memory used by a mutation once buffered
+    @param mutation: dict
+    @return: int - size in bytes
+    """
+    size = 64 + len(mutation['row'])
+    for key in ('family', 'column'):
+        if key in mutation:
+            size += len(mutation[key])
+    if 'ts' in mutation:
+        size += 8
+    if 'value' in mutation:
+        size += len(str(mutation['value']))
+    return size
+
+
+class TableStore:
+    """
+    Interface shared by the storage engines
+    Mutations are dicts with an 'op' key:
+    {'op': 'put', 'row': str, 'family': str, 'column': str, 'ts': int, 'value': str, 'new_row': bool}
+    {'op': 'delete_column', 'row': str, 'family': str, 'column': str}
+    {'op': 'delete_row', 'row': str}
+    """
+    engine_name = None
+
+    def __init__(self, base_path: str, table_name: str) -> None:
+        self.base_path = base_path
+        self.table_name = table_name
+        self.lock = ReadWriteLock()
+
+    @classmethod
+    def create(cls, base_path: str, table_name: str, metadata: dict, **options) -> 'TableStore':
+        raise NotImplementedError
+
+    @property
+    def metadata(self) -> dict:
+        raise NotImplementedError
+
+    @property
+    def generation(self):
+        """
+        Changes when the table files may have been changed behind the back of this store
+        """
+        return 0
+
+    def update_metadata(self, changes: dict) -> None:
+        raise NotImplementedError
+
+    def get_row(self, row_key: str, families: List[str] = None) -> Union[dict, None]:
+        """
+        @param families: list[str] (optional) - only read these column families, every family if not provided
+        @return: dict - {family: {column: {timestamp: value}}} or None if the row has none of the families
+        """
+        raise NotImplementedError
+
+    def get_rows(self, row_keys: List[str], families: List[str] = None) -> Dict[str, dict]:
+        """
+        Read many rows in one pass
+        @param row_keys: list[str]
+        @param families: list[str] (optional) - only read these column families, every family if not provided
+        @return: dict - {row_key: row} of the rows that exist
+        """
+        rows = {}
+        for row_key in sorted(set(row_keys)):
+            row = self.get_row(row_key, families)
+            if row is not None:
+                rows[row_key] = row
+        return rows
+
+    def row_exists(self, row_key: str) -> bool:
+        return self.get_row(row_key) is not None
+
+    def scan_rows(self, start_row: str = None, stop_row: str = None, key_filter: Callable[[str], bool] = None, families: List[str] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Iterate the rows inside [start_row, stop_row) in row key order
+        @param key_filter: callable (optional) - rows whose key it rejects are skipped without being decoded
+        @param families: list[str] (optional) - only read these column families, rows without any of them are skipped
+        """
+        raise NotImplementedError
+
+    def split_keys(self, start_row: str = None, stop_row: str = None) -> List[str]:
+        """
+        Row keys spread over [start_row, stop_row) where it can be cut into parts of similar size,
+        read from what is already in memory
+        @return: list[str] - sorted, empty if the range cannot be cut
+        """
+        return []
+
+    def apply(self, mutations: List[dict]) -> None:
+        raise NotImplementedError
+
+    def load_rows(self, rows: Iterator[Tuple[str, dict]], new_rows: bool = False) -> int:
+        """
+        Store complete rows as they are, without going through mutations
+        @param rows: iterator of (row_key, {family: {column: {timestamp: value}}}) sorted by row key
+        @param new_rows: bool - add the stored rows to the row count of the metadata, for keys not in the table yet
+        @return: int - number of rows stored
+        """
+        raise NotImplementedError
+
+    def truncate(self) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def invalidate(self) -> None:
+        """
+        Drop anything cached from the table files
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def discard(self) -> None:
+        """
+        Release the table files without writing anything, used once the table is gone
+        """
+        pass
+
+    def drop(self) -> None:
+        raise NotImplementedError
+
+    def rename(self, new_name: str) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"storage_engine": self.engine_name}
+
+
+class JsonTableStore(TableStore):
+    """
+    Legacy engine: one pretty-printed JSON document per table
+    The parsed document is kept until the inode, mtime or size of the file changes.
+    Writers hold the table lock, exclusive across processes through .locks/<table>.lock, while
+    they read, change and atomically replace the file, so concurrent updates are not lost
+    """
+    engine_name = 'json'
+
+    def __init__(self, base_path: str, table_name: str) -> None:
+        super().__init__(base_path, table_name)
+        self.path = os.path.join(base_path, table_name+'.json')
+        os.makedirs(os.path.join(base_path, LOCK_DIR), exist_ok=True)
+        self.lock = ReadWriteLock(os.path.join(base_path, LOCK_DIR, table_name+LOCK_SUFFIX))
+        self.document = None
+        self.signature = None
+
+    @classmethod
+    def create(cls, base_path: str, table_name: str, metadata: dict, **options) -> 'JsonTableStore':
+        store = cls(base_path, table_name)
+        with store.lock.write():
+            store._save({"table_metadata": metadata, "data": {}})
+        return store
+
+    def _signature(self) -> Tuple[int, int, int]:
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> dict:
+        signature = self._signature()
+        if self.document is None or signature != self.signature:
+            with open(self.path, 'r') as f:
+                document = json.load(f)
+            document['data'] = {row_key: decode_cells(row) for row_key, row in document['data'].items()}
+            self.document = document
+            self.signature = signature
+        return self.document
+
+    def _save(self, data: dict) -> None:
+        tmp_path = self.path+'.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps(data, indent=4))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            self.document = None
+            raise
+        self.document = data
+        self.signature = self._signature()
+
+    def invalidate(self) -> None:
+        self.document = None
+
+    @property
+    def generation(self) -> Tuple[int, int, int]:
+        return self._signature()
+
+    @property
+    def metadata(self) -> dict:
+        with self.lock.read():
+            return dict(self._load()['table_metadata'])
+
+    def update_metadata(self, changes: dict) -> None:
+        with self.lock.write():
+            data = self._load()
+            data['table_metadata'].update(changes)
+            self._save(data)
+
+    def get_row(self, row_key: str, families: List[str] = None) -> Union[dict, None]:
+        with self.lock.read():
+            return select_families(self._load()['data'].get(row_key), families)
+
+    def get_rows(self, row_keys: List[str], families: List[str] = None) -> Dict[str, dict]:
+        with self.lock.read():
+            rows = self._load()['data']
+        found = {}
+        for row_key in row_keys:
+            row = select_families(rows.get(row_key), families)
+            if row is not None:
+                found[row_key] = row
+        return found
+
+    def scan_rows(self, start_row: str = None, stop_row: str = None, key_filter: Callable[[str], bool] = None, families: List[str] = None) -> Iterator[Tuple[str, dict]]:
+        with self.lock.read():
+            rows = self._load()['data']
+            row_keys = sorted(rows)
+        for row_key in row_keys:
+            if start_row is not None and row_key < start_row:
+                continue
+            if stop_row is not None and row_key >= stop_row:
+                break
+            if key_filter is not None and not key_filter(row_key):
+                continue
+            row = select_families(rows.get(row_key), families)
+            if row is not None:
+                yield row_key, row
+
+    def split_keys(self, start_row: str = None, stop_row: str = None) -> List[str]:
+        with self.lock.read():
+            row_keys = sorted(self._load()['data'])
+        return [
+            row_key for row_key in row_keys
+            if (start_row is None or row_key >= start_row) and (stop_row is None or row_key < stop_row)
+        ]
+
+    def apply(self, mutations: List[dict]) -> None:
+        with self.lock.write():
+            try:
+                self._apply(mutations)
+            except Exception:
+                self.document = None
+                raise
+
+    def _apply(self, mutations: List[dict]) -> None:
+        data = self._load()
+        rows = data['data']
+        max_timestamp = data['table_metadata']['max_timestamp']
+        # rows handed out by get_row and scan_rows are never changed in place, a changed row is copied first
+        copied = set()
+        for mutation in mutations:
+            row_key = mutation['row']
+            if mutation['op'] != 'delete_row' and row_key not in copied and row_key in rows:
+                # versions are replaced by add_version rather than changed, copying the columns is enough
+                rows[row_key] = {family: dict(columns) for family, columns in rows[row_key].items()}
+                copied.add(row_key)
+            if mutation['op'] == 'put':
+                if mutation.get('new_row'):
+                    rows[row_key] = {}
+                    copied.add(row_key)
+                    data['table_metadata']['rows'] = data['table_metadata']['rows'] + 1
+                columns = rows[row_key].setdefault(mutation['family'], {})
+                columns[mutation['column']] = add_version(
+                    columns.get(mutation['column'], {}), cell_timestamp(mutation['ts']), mutation['value'], max_timestamp
+                )
+            elif mutation['op'] == 'delete_column':
+                rows[row_key][mutation['family']][mutation['column']] = {}
+            elif mutation['op'] == 'delete_row':
+                del rows[row_key]
+                data['table_metadata']['rows'] = data['table_metadata']['rows'] - 1
+        self._save(data)
+
+    def load_rows(self, rows: Iterator[Tuple[str, dict]], new_rows: bool = False) -> int:
+        with self.lock.write():
+            data = self._load()
+            count = 0
+            for row_key, row in rows:
+                data['data'][row_key] = row
+                count += 1
+            if new_rows:
+                data['table_metadata']['rows'] = data['table_metadata']['rows'] + count
+            self._save(data)
+            return count
+
+    def truncate(self) -> None:
+        with self.lock.write():
+            data = self._load()
+            data['data'] = {}
+            data['table_metadata']['rows'] = 0
+            self._save(data)
+
+    def close(self) -> None:
+        self.lock.close()
+
+    def discard(self) -> None:
+        self.lock.close()
+
+    def drop(self) -> None:
+        with self.lock.write():
+            os.remove(self.path)
+            if os.path.exists(self.lock.lock_path):
+                os.remove(self.lock.lock_path)
+        self.lock.close()
+
+    def rename(self, new_name: str) -> None:
+        with self.lock.write():
+            os.rename(self.path, os.path.join(self.base_path, new_name+'.json'))
+            if os.path.exists(self.lock.lock_path):
+                os.remove(self.lock.lock_path)
+        self.lock.close()
+
+    def stats(self) -> dict:
+        return {
+            "storage_engine": self.engine_name,
+            "file_size": os.path.getsize(self.path)
+        }
+
+
+class WriteAheadLog:
+    """
+    Append-only log of mutations, one JSON record per line
+    """
+    def __init__(self, path: str, sync: bool = True) -> None:
+        self.path = path
+        self.sync = sync
+        self.file = open(path, 'a')
+
+    def append(self, records: List[dict]) -> None:
+        """
+        Append records to the log with a single write
+        @param records: list[dict]
+        """
+        self.file.write(''.join(json.dumps(record)+'\n' for record in records))
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def replay(self) -> Iterator[dict]:
+        """
+        Read back every complete record of the log, a torn last line is ignored
+        @return: iterator of dict
+        """
+        with open(self.path, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                yield json.loads(line)
+
+    def size(self) -> int:
+        return os.fstat(self.file.fileno()).st_size
+
+    def reset(self) -> None:
+        self.file.close()
+        open(self.path, 'w').close()
+        # always append, other processes share the log
+        self.file = open(self.path, 'a')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class MemStore:
+    """
+    In-memory buffer of the mutations not yet flushed to a segment
+    """
+    def __init__(self) -> None:
+        self.rows = {}
+        self.size = 0
+
+    def apply(self, mutation: dict, max_versions: int = None) -> None:
+        """
+        @param max_versions: int (optional) - versions kept per column, older ones are dropped right away
+        """
+        row_key = mutation['row']
+        if mutation['op'] == 'delete_row':
+            fragment = new_fragment()
+            fragment['deleted'] = True
+            self.rows[row_key] = fragment
+        else:
+            fragment = self.rows.setdefault(row_key, new_fragment())
+            family = mutation['family']
+            column = mutation['column']
+            if mutation['op'] == 'put':
+                columns = fragment['cells'].setdefault(family, {})
+                columns[column] = add_version(columns.get(column, {}), cell_timestamp(mutation['ts']), mutation['value'], max_versions)
+            elif mutation['op'] == 'delete_column':
+                fragment['cells'].get(family, {}).pop(column, None)
+                fragment['tombstones'].setdefault(family, set()).add(column)
+        self.size += mutation_size(mutation)
+
+    def get(self, row_key: str) -> Union[dict, None]:
+        return self.rows.get(row_key)
+
+    def scan(self, start_row: str = None, stop_row: str = None, key_filter: Callable[[str], bool] = None) -> List[Tuple[str, dict]]:
+        """
+        Snapshot of the buffered fragments inside [start_row, stop_row) in key order
+        @return: list of (row_key, fragment)
+        """
+        keys = sorted(
+            row_key for row_key in self.rows
+            if (start_row is None or row_key >= start_row) and (stop_row is None or row_key < stop_row)
+            and (key_filter is None or key_filter(row_key))
+        )
+        return [(row_key, self.rows[row_key]) for row_key in keys]
+
+
+def encode_fragment(fragment: dict) -> dict:
+    """
+    Convert a fragment to its JSON form
+    """
+    record = {"cells": fragment['cells']}
+    if fragment['tombstones']:
+        record['tombstones'] = {family: sorted(columns) for family, columns in fragment['tombstones'].items()}
+    if fragment['deleted']:
+        record['deleted'] = True
+    return record
+
+
+def decode_fragment(record: dict) -> dict:
+    """
+    Convert the JSON form of a fragment back to a fragment
+    """
+    return {
+        "cells": decode_cells(record['cells']),
+        "tombstones": {family: set(columns) for family, columns in record.get('tombstones', {}).items()},
+        "deleted": record.get('deleted', False)
+    }
+
+
+SEGMENT_BLOCK_SIZE = 4 * 1024
+INDEX_MAGIC = b'EBIDX1\n'
+BINARY_SEGMENT_MAGIC = b'EBSEG1\n'
+TRAILER = struct.Struct('<Q')
+RECORD_HEADER = struct.Struct('<IH')
+COUNT = struct.Struct('<H')
+NAME_ID = struct.Struct('<I')
+MICROS = struct.Struct('<q')
+LENGTH = struct.Struct('<I')
+TIMESTAMP_MICROS = 0
+TIMESTAMP_TEXT = 1
+VALUE_TEXT = 0
+VALUE_JSON = 1
+
+
+class Segment:
+    """
+    Immutable sorted file of row fragments, read through a memory map
+    records | bloom filter bits | footer | uint64 footer offset | index magic
+    The footer is a JSON object with the number of rows, the name dictionary of the binary
+    cell format, the layout of the Bloom filter of the row keys, the column family of the
+    cells when the segment holds a single one, and a sparse index with the first row key and
+    offset of every block of about SEGMENT_BLOCK_SIZE bytes, so opening a segment only reads
+    the footer and a lookup checks the filter and parses a single block.
+    In the json cell format each record is a line with the JSON encoded row key, a tab and
+    the JSON encoded fragment
+    """
+    cell_format = 'json'
+    magic = b''
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.name = os.path.basename(path)
+        self.lock = threading.Lock()
+        self.refs = 0
+        self.retired = False
+        self.delete = True
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.names = []
+        self.bloom = None
+        self.family = None
+        trailer_offset = self.size - len(INDEX_MAGIC) - TRAILER.size
+        if trailer_offset >= 0 and self.data[trailer_offset + TRAILER.size:] == INDEX_MAGIC:
+            footer_offset, = TRAILER.unpack_from(self.data, trailer_offset)
+            footer = json.loads(self.data[footer_offset:trailer_offset])
+            self.data_end = footer.get('data_end', footer_offset)
+            self.rows = footer['rows']
+            self.names = footer['names']
+            self.family = footer.get('family')
+            if footer.get('bloom'):
+                self.bloom = BloomFilter(self.data, **footer['bloom'])
+            self.block_keys = [row_key for row_key, _ in footer['index']]
+            self.block_offsets = [offset for _, offset in footer['index']]
+        else:
+            self._load_legacy_index()
+
+    def _load_legacy_index(self) -> None:
+        """
+        Build the sparse index of a segment written without footer by reading every record
+        """
+        self.data_end = self.size
+        self._index_records()
+
+    def _index_records(self) -> None:
+        self.rows = 0
+        self.block_keys = []
+        self.block_offsets = []
+        for row_key, position, _ in self._records(len(self.magic), self.data_end):
+            if not self.block_offsets or position - self.block_offsets[-1] >= SEGMENT_BLOCK_SIZE:
+                self.block_keys.append(row_key)
+                self.block_offsets.append(position)
+            self.rows += 1
+
+    @staticmethod
+    def _encode(row_key: str, fragment: dict, names: dict) -> bytes:
+        return (json.dumps(row_key)+'\t'+json.dumps(encode_fragment(fragment))+'\n').encode('utf-8')
+
+    def _records(self, position: int, end: int) -> Iterator[Tuple[str, int, int]]:
+        """
+        Iterate the records stored in [position, end)
+        @return: iterator of (row_key, record start, record end)
+        """
+        data = self.data
+        while position < end:
+            tab = data.find(b'\t', position, end)
+            record_end = data.find(b'\n', tab, end) + 1
+            yield json.loads(data[position:tab]), position, record_end
+            position = record_end
+
+    def _decode(self, position: int, end: int) -> dict:
+        tab = self.data.find(b'\t', position, end)
+        return decode_fragment(json.loads(self.data[tab+1:end]))
+
+    def _fragment(self, position: int, end: int) -> dict:
+        """
+        Decode a record, tagged with the family of the segment when it holds a single one
+        """
+        fragment = self._decode(position, end)
+        if self.family is not None:
+            fragment['family'] = self.family
+        return fragment
+
+    def _find(self, row_key: str, position: int, end: int) -> Union[Tuple[int, int], None]:
+        """
+        Locate the record of a row inside [position, end), the block is searched for the
+        encoded key instead of parsing every record
+        @return: tuple - (record start, record end) or None
+        """
+        key = json.dumps(row_key).encode('utf-8') + b'\t'
+        if self.data[position:position + len(key)] != key:
+            position = self.data.find(b'\n' + key, position, end)
+            if position < 0:
+                return None
+            position += 1
+        return position, self.data.find(b'\n', position, end) + 1
+
+    @classmethod
+    def write(cls, path: str, rows: Iterator[Tuple[str, dict]], throttle=None, block_size: int = SEGMENT_BLOCK_SIZE, false_positive_rate: float = DEFAULT_BLOOM_FALSE_POSITIVE_RATE, family: str = None) -> int:
+        """
+        Write sorted fragments to a new segment file, the file only appears once complete
+        @param path: str
+        @param rows: iterator of (row_key, fragment) sorted by row key
+        @param throttle: Throttle (optional) - limits the write rate
+        @param block_size: int (optional) - bytes covered by each entry of the sparse index
+        @param false_positive_rate: float (optional) - of the Bloom filter of the row keys, None for no filter
+        @param family: str (optional) - column family of every cell, None when the segment holds every family
+        @return: int - size of the segment in bytes
+        """
+        writer = SegmentWriter(cls, path, throttle, block_size, false_positive_rate, family)
+        try:
+            for row_key, fragment in rows:
+                writer.add(row_key, fragment)
+            return writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def _block_end(self, block: int) -> int:
+        return self.block_offsets[block + 1] if block + 1 < len(self.block_offsets) else self.data_end
+
+    def _lookup(self, row_key: str, first_block: int = 0) -> Tuple[int, Union[dict, None]]:
+        """
+        @param first_block: int (optional) - block the index search starts from, for keys looked up in order
+        @return: tuple - (block the next key in order can start from, fragment or None)
+        """
+        if self.bloom is not None and not self.bloom.might_contain(row_key):
+            return first_block, None
+        block = bisect.bisect_right(self.block_keys, row_key, first_block) - 1
+        location = None
+        if block >= 0:
+            location = self._find(row_key, self.block_offsets[block], self._block_end(block))
+        if location is None:
+            if self.bloom is not None:
+                self.bloom.false_positives += 1
+            return max(block, first_block), None
+        return block, self._fragment(*location)
+
+    def get(self, row_key: str) -> Union[dict, None]:
+        return self._lookup(row_key)[1]
+
+    def get_many(self, row_keys: List[str]) -> Dict[str, dict]:
+        """
+        Look up many rows, the sparse index is searched forward from the block of the previous key
+        @param row_keys: list[str] - sorted
+        @return: dict - {row_key: fragment} of the rows the segment holds
+        """
+        fragments = {}
+        block = 0
+        for row_key in row_keys:
+            block, fragment = self._lookup(row_key, block)
+            if fragment is not None:
+                fragments[row_key] = fragment
+        return fragments
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "cell_format": self.cell_format,
+            "rows": self.rows,
+            "size": self.size,
+            "index_entries": len(self.block_offsets),
+            "family": self.family,
+            "bloom_filter": self.bloom.stats() if self.bloom is not None else None
+        }
+
+    def scan(self, start_row: str = None, stop_row: str = None, key_filter: Callable[[str], bool] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Read the fragments inside [start_row, stop_row) sequentially, starting at the block holding start_row
+        Fragments of the rows rejected by key_filter are not decoded
+        """
+        if not self.block_offsets:
+            return
+        block = 0 if start_row is None else max(bisect.bisect_right(self.block_keys, start_row) - 1, 0)
+        for row_key, position, record_end in self._records(self.block_offsets[block], self.data_end):
+            if start_row is not None and row_key < start_row:
+                continue
+            if stop_row is not None and row_key >= stop_row:
+                break
+            if key_filter is not None and not key_filter(row_key):
+                continue
+            yield row_key, self._fragment(position, record_end)
+
+    def acquire(self) -> None:
+        """
+        Keep the segment open while a scan or a compaction is reading it
+        """
+        with self.lock:
+            self.refs += 1
+
+    def release(self) -> None:
+        with self.lock:
+            self.refs -= 1
+            remove = self.retired and self.refs == 0
+        if remove:
+            self._remove()
+
+    def retire(self, delete: bool = True) -> None:
+        """
+        Close the segment once nobody is reading it anymore
+        @param delete: bool - also delete the file, False when another process retired it
+        """
+        with self.lock:
+            self.retired = True
+            self.delete = delete
+            remove = self.refs == 0
+        if remove:
+            self._remove()
+
+    def _remove(self) -> None:
+        self.close()
+        if self.delete and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+
+class BinarySegment(Segment):
+    """
+    Segment in the binary cell format, the file starts with BINARY_SEGMENT_MAGIC
+    Each record is uint32 length, uint16 key length, the row key and the fragment:
+    uint8 flags (1 = deleted), the cell families and the tombstone families. Family and
+    column names are uint32 ids into the name dictionary of the footer
+    """
+    cell_format = 'binary'
+    magic = BINARY_SEGMENT_MAGIC
+
+    def _load_legacy_index(self) -> None:
+        """
+        Segments written before the sparse index end with the name dictionary and its offset
+        """
+        self.data_end, = TRAILER.unpack_from(self.data, self.size - TRAILER.size)
+        self.names = json.loads(self.data[self.data_end:self.size - TRAILER.size])
+        self._index_records()
+
+    @staticmethod
+    def _encode(row_key: str, fragment: dict, names: dict) -> bytes:
+        key = row_key.encode('utf-8')
+        body = _encode_binary_fragment(fragment, names)
+        return RECORD_HEADER.pack(COUNT.size + len(key) + len(body), len(key)) + key + body
+
+    def _records(self, position: int, end: int) -> Iterator[Tuple[str, int, int]]:
+        data = self.data
+        while position < end:
+            length, key_length = RECORD_HEADER.unpack_from(data, position)
+            key_start = position + RECORD_HEADER.size
+            record_end = position + LENGTH.size + length
+            yield data[key_start:key_start + key_length].decode('utf-8'), position, record_end
+            position = record_end
+
+    def _find(self, row_key: str, position: int, end: int) -> Union[Tuple[int, int], None]:
+        """
+        Walk the record headers of the block comparing the raw keys, UTF-8 keeps the order of the row keys
+        """
+        key = row_key.encode('utf-8')
+        data = self.data
+        while position < end:
+            length, key_length = RECORD_HEADER.unpack_from(data, position)
+            key_start = position + RECORD_HEADER.size
+            candidate = data[key_start:key_start + key_length]
+            if candidate == key:
+                return position, position + LENGTH.size + length
+            if candidate > key:
+                break
+            position += LENGTH.size + length
+        return None
+
+    def _decode(self, position: int, end: int) -> dict:
+        key_length, = COUNT.unpack_from(self.data, position + LENGTH.size)
+        return _decode_binary_fragment(self.data, position + RECORD_HEADER.size + key_length, self.names)
+
+
+def _name_id(names: dict, name: str) -> bytes:
+    name_id = names.get(name)
+    if name_id is None:
+        name_id = names[name] = len(names)
+    return NAME_ID.pack(name_id)
+
+
+def _encode_text(text: str) -> bytes:
+    data = text.encode('utf-8')
+    return LENGTH.pack(len(data)) + data
+
+
+def _encode_binary_fragment(fragment: dict, names: dict) -> bytes:
+    parts = [b'\x01' if fragment['deleted'] else b'\x00', COUNT.pack(len(fragment['cells']))]
+    for family, columns in fragment['cells'].items():
+        parts.append(_name_id(names, family))
+        parts.append(COUNT.pack(len(columns)))
+        for column, versions in columns.items():
+            parts.append(_name_id(names, column))
+            parts.append(COUNT.pack(len(versions)))
+            for timestamp, value in versions.items():
+                if isinstance(timestamp, int):
+                    parts.append(bytes((TIMESTAMP_MICROS,)))
+                    parts.append(MICROS.pack(timestamp))
+                else:
+                    parts.append(bytes((TIMESTAMP_TEXT,)))
+                    parts.append(_encode_text(timestamp))
+                if isinstance(value, str):
+                    parts.append(bytes((VALUE_TEXT,)))
+                    parts.append(_encode_text(value))
+                else:
+                    parts.append(bytes((VALUE_JSON,)))
+                    parts.append(_encode_text(json.dumps(value)))
+    parts.append(COUNT.pack(len(fragment['tombstones'])))
+    for family, columns in fragment['tombstones'].items():
+        parts.append(_name_id(names, family))
+        parts.append(COUNT.pack(len(columns)))
+        for column in sorted(columns):
+            parts.append(_name_id(names, column))
+    return b''.join(parts)
+
+
+def _decode_text(data: bytes, position: int) -> Tuple[str, int]:
+    length, = LENGTH.unpack_from(data, position)
+    position += LENGTH.size
+    return data[position:position + length].decode('utf-8'), position + length
+
+
+def _decode_binary_fragment(data: bytes, position: int, names: List[str]) -> dict:
+    fragment = new_fragment()
+    fragment['deleted'] = data[position] == 1
+    position += 1
+    families, = COUNT.unpack_from(data, position)
+    position += COUNT.size
+    for _ in range(families):
+        family_id, = NAME_ID.unpack_from(data, position)
+        column_count, = COUNT.unpack_from(data, position + NAME_ID.size)
+        position += NAME_ID.size + COUNT.size
+        columns = fragment['cells'][names[family_id]] = {}
+        for _ in range(column_count):
+            column_id, = NAME_ID.unpack_from(data, position)
+            version_count, = COUNT.unpack_from(data, position + NAME_ID.size)
+            position += NAME_ID.size + COUNT.size
+            versions = columns[names[column_id]] = {}
+            for _ in range(version_count):
+                if data[position] == TIMESTAMP_MICROS:
+                    timestamp, = MICROS.unpack_from(data, position + 1)
+                    position += 1 + MICROS.size
+                else:
+                    timestamp, position = _decode_text(data, position + 1)
+                    timestamp = cell_timestamp(timestamp)
+                kind = data[position]
+                value, position = _decode_text(data, position + 1)
+                versions[timestamp] = value if kind == VALUE_TEXT else json.loads(value)
+    families, = COUNT.unpack_from(data, position)
+    position += COUNT.size
+    for _ in range(families):
+        family_id, = NAME_ID.unpack_from(data, position)
+        column_count, = COUNT.unpack_from(data, position + NAME_ID.size)
+        position += NAME_ID.size + COUNT.size
+        columns = fragment['tombstones'][names[family_id]] = set()
+        for _ in range(column_count):
+            columns.add(names[NAME_ID.unpack_from(data, position)[0]])
+            position += NAME_ID.size
+    return fragment
+
+
+SEGMENT_FORMATS = {
+    Segment.cell_format: Segment,
+    BinarySegment.cell_format: BinarySegment
+}
+
+
+class SegmentWriter:
+    """
+    Writes sorted fragments to a new segment file one row at a time, the file only appears once finished
+    """
+    def __init__(self, segment_class: type, path: str, throttle=None, block_size: int = SEGMENT_BLOCK_SIZE, false_positive_rate: float = DEFAULT_BLOOM_FALSE_POSITIVE_RATE, family: str = None) -> None:
+        """
+        @param segment_class: type - Segment or BinarySegment, the cell format
+        @param path: str
+        @param throttle: Throttle (optional) - limits the write rate
+        @param block_size: int (optional) - bytes covered by each entry of the sparse index
+        @param false_positive_rate: float (optional) - of the Bloom filter of the row keys, None for no filter
+        @param family: str (optional) - column family of every cell, None when the segment holds every family
+        """
+        self.segment_class = segment_class
+        self.path = path
+        self.tmp_path = path+'.tmp'
+        self.throttle = throttle
+        self.block_size = block_size
+        self.family = family
+        self.names = {}
+        self.index = []
+        self.count = 0
+        self.bloom = BloomBuilder(false_positive_rate) if false_positive_rate else None
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(segment_class.magic)
+        self.position = len(segment_class.magic)
+
+    def add(self, row_key: str, fragment: dict) -> None:
+        """
+        @param row_key: str - greater than the row key of the previous fragment
+        @param fragment: dict
+        """
+        record = self.segment_class._encode(row_key, fragment, self.names)
+        if not self.index or self.position - self.index[-1][1] >= self.block_size:
+            self.index.append([row_key, self.position])
+        if self.bloom is not None:
+            self.bloom.add(row_key)
+        self.file.write(record)
+        self.position += len(record)
+        self.count += 1
+        if self.throttle is not None:
+            self.throttle.consume(len(record))
+
+    def finish(self) -> int:
+        """
+        Write the footer and move the file in place
+        @return: int - size of the segment in bytes
+        """
+        position = self.position
+        footer = {"rows": self.count, "data_end": position, "names": list(self.names), "index": self.index, "bloom": None}
+        if self.family is not None:
+            footer['family'] = self.family
+        with self.file as f:
+            if self.bloom is not None:
+                bits, footer['bloom'] = self.bloom.build()
+                footer['bloom']['offset'] = position
+                f.write(bits)
+                position += len(bits)
+            f.write(json.dumps(footer).encode('utf-8'))
+            f.write(TRAILER.pack(position))
+            f.write(INDEX_MAGIC)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.tmp_path, self.path)
+        return os.path.getsize(self.path)
+
+    def abort(self) -> None:
+        """
+        Drop the unfinished file
+        """
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def open_segment(path: str) -> Segment:
+    """
+    Open a segment file with the class of its cell format
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(BINARY_SEGMENT_MAGIC))
+    if magic == BINARY_SEGMENT_MAGIC:
+        return BinarySegment(path)
+    return Segment(path)
+
+
+def merge_sources(sources: List[Iterator[Tuple[str, dict]]]) -> Iterator[Tuple[str, List[dict]]]:
+    """
+    Merge sorted sources of fragments into one stream grouped by row key
+    @param sources: list of iterators of (row_key, fragment) ordered from the newest source to the oldest
+    @return: iterator of (row_key, fragments ordered from newest to oldest)
+    """
+    merged = heapq.merge(*[_ranked(source, rank) for rank, source in enumerate(sources)])
+    current_key = None
+    fragments = []
+    for row_key, _, fragment in merged:
+        if row_key != current_key:
+            if fragments:
+                yield current_key, fragments
+            current_key = row_key
+            fragments = []
+        fragments.append(fragment)
+    if fragments:
+        yield current_key, fragments
+
+
+class LSMTableStore(TableStore):
+    """
+    Log-structured engine: write-ahead log + memstore + immutable sorted segments
+    Readers share and writers hold exclusively the table lock, which spans processes
+    through <table>/table.lock. The descriptor and log are fingerprinted after every write,
+    when another process changed them the store reloads its state before the next operation
+    """
+    engine_name = 'lsm'
+
+    def __init__(self, base_path: str, table_name: str, memstore_flush_size: int = DEFAULT_MEMSTORE_FLUSH_SIZE, wal_sync: bool = True) -> None:
+        super().__init__(base_path, table_name)
+        self.path = os.path.join(base_path, table_name)
+        self.memstore_flush_size = memstore_flush_size
+        self.lock = ReadWriteLock(os.path.join(self.path, LOCK_FILE))
+        self.compactor = None
+        self.compaction_lock = threading.Lock()
+        self.closed = False
+        self.reloads = 0
+        self.segments = []
+        self.manifest = {}
+        self.wal = WriteAheadLog(os.path.join(self.path, WAL_FILE), sync=wal_sync)
+        with self.lock.write():
+            self._load()
+
+    def _load(self) -> None:
+        """
+        Read the descriptor, open the segments and replay the write-ahead log, the write lock has to be held
+        """
+        with open(os.path.join(self.path, TABLE_DESCRIPTOR), 'r') as f:
+            descriptor = json.load(f)
+        next_segment_id = self.manifest.get('next_segment_id', 1)
+        self._metadata = descriptor['table_metadata']
+        self.manifest = descriptor['manifest']
+        self.manifest['next_segment_id'] = max(self.manifest.get('next_segment_id', 1), next_segment_id)
+        self.compaction_stats = descriptor.get('compaction', new_compaction_stats())
+        self.cell_format = self._metadata.get('cell_format', Segment.cell_format)
+        self.segment_class = SEGMENT_FORMATS[self.cell_format]
+        self.bloom_false_positive_rate = self._metadata.get('bloom_false_positive_rate', DEFAULT_BLOOM_FALSE_POSITIVE_RATE)
+        opened = {segment.name: segment for segment in self.segments}
+        self.segments = [
+            opened.pop(name) if name in opened else open_segment(os.path.join(self.path, name))
+            for name in self.manifest['segments']
+        ]
+        for segment in opened.values():
+            segment.retire(delete=False)
+        self.memstore = MemStore()
+        self.seq = self.manifest['flushed_seq']
+
+        for record in self.wal.replay():
+            if record['seq'] <= self.manifest['flushed_seq']:
+                continue
+            self.memstore.apply(record, self._metadata['max_timestamp'])
+            if record['seq'] > self.manifest['metadata_seq']:
+                self._count_rows(record)
+            self.seq = record['seq']
+        self.signature = self._disk_signature()
+
+    def _disk_signature(self) -> tuple:
+        descriptor = os.stat(os.path.join(self.path, TABLE_DESCRIPTOR))
+        wal = os.stat(self.wal.path)
+        return descriptor.st_ino, descriptor.st_mtime_ns, wal.st_size, wal.st_mtime_ns
+
+    def _sync(self) -> None:
+        """
+        Reload the table if another process changed it, the write lock has to be held
+        """
+        if not self.closed and self._disk_signature() != self.signature:
+            self._load()
+            self.reloads += 1
+
+    def _refresh(self) -> None:
+        """
+        Reload the table before a read if another process changed it
+        A thread already reading keeps the state it started with, the lock cannot be upgraded
+        """
+        if not self.closed and not self.lock.reading() and self._disk_signature() != self.signature:
+            with self.lock.write():
+                self._sync()
+
+    @property
+    def generation(self) -> int:
+        self._refresh()
+        return self.reloads
+
+    @classmethod
+    def create(cls, base_path: str, table_name: str, metadata: dict, **options) -> 'LSMTableStore':
+        path = os.path.join(base_path, table_name)
+        os.makedirs(path)
+        metadata['storage_engine'] = cls.engine_name
+        metadata.setdefault('cell_format', Segment.cell_format)
+        metadata.setdefault('bloom_false_positive_rate', DEFAULT_BLOOM_FALSE_POSITIVE_RATE)
+        if metadata['cell_format'] not in SEGMENT_FORMATS:
+            raise ValueError(f"Unknown cell format {metadata['cell_format']}")
+        _write_descriptor(path, {
+            "table_metadata": metadata,
+            "manifest": {"segments": [], "flushed_seq": 0, "metadata_seq": 0, "next_segment_id": 1},
+            "compaction": new_compaction_stats()
+        })
+        return cls(base_path, table_name, **options)
+
+    def _count_rows(self, mutation: dict) -> None:
+        if mutation['op'] == 'put' and mutation.get('new_row'):
+            self._metadata['rows'] = self._metadata['rows'] + 1
+        elif mutation['op'] == 'delete_row':
+            self._metadata['rows'] = self._metadata['rows'] - 1
+
+    def _save_descriptor(self) -> None:
+        self.manifest['segments'] = [segment.name for segment in self.segments]
+        self.manifest['metadata_seq'] = self.seq
+        _write_descriptor(self.path, {
+            "table_metadata": self._metadata,
+            "manifest": self.manifest,
+            "compaction": self.compaction_stats
+        })
+
+    def write_segment(self, path: str, rows: Iterator[Tuple[str, dict]], throttle=None, family: str = None) -> int:
+        """
+        Write sorted fragments to a new segment in the cell format and with the Bloom filter of the table
+        @param family: str (optional) - column family of every cell of the segment
+        @return: int - size of the segment in bytes
+        """
+        return self.segment_class.write(path, rows, throttle, false_positive_rate=self.bloom_false_positive_rate, family=family)
+
+    def write_family_segments(self, rows: Iterator[Tuple[str, dict]], throttle=None, marker_families: List[str] = ()) -> List[Segment]:
+        """
+        Write sorted fragments to one new segment per column family, like the stores of an HBase region
+        @param marker_families: list[str] (optional) - families that get the marker of every deleted row
+        @return: list[Segment] - the new segments in family order, opened
+        """
+        writers = {}
+        try:
+            for row_key, fragment in rows:
+                for family, part in split_fragment(fragment, marker_families):
+                    writer = writers.get(family)
+                    if writer is None:
+                        writer = writers[family] = SegmentWriter(
+                            self.segment_class, self.new_segment_path(), throttle,
+                            false_positive_rate=self.bloom_false_positive_rate, family=family
+                        )
+                    writer.add(row_key, part)
+            for writer in writers.values():
+                writer.finish()
+        except BaseException:
+            for writer in writers.values():
+                writer.abort()
+            raise
+        return [open_segment(writers[family].path) for family in sorted(writers)]
+
+    def _marker_families(self) -> List[str]:
+        """
+        Families whose segments may hold older cells of any row, they get the markers of deleted rows
+        """
+        families = set(self._metadata.get('column_families', []))
+        families.update(segment.family for segment in self.segments if segment.family is not None)
+        return sorted(families)
+
+    def _view(self, families: List[str] = None) -> List[Segment]:
+        """
+        Segments holding cells of some of the families, oldest first
+        Segments written before the families were split hold every family and are always read
+        """
+        if families is None:
+            return self.segments
+        return [segment for segment in self.segments if segment.family is None or segment.family in families]
+
+    def compaction_runs(self) -> List[List[Segment]]:
+        """
+        Runs of segments a minor compaction may merge, oldest first
+        A run holds the segments of one family with no segment of every family between them, or
+        adjacent segments of every family, so merging it never moves data past a tombstone
+        """
+        runs = []
+        open_runs: Dict[Union[str, None], List[Segment]] = {}
+        for segment in self.segments:
+            if segment.family is None:
+                runs.extend(run for family, run in open_runs.items() if family is not None)
+                open_runs = {family: run for family, run in open_runs.items() if family is None}
+            elif None in open_runs:
+                runs.append(open_runs.pop(None))
+            open_runs.setdefault(segment.family, []).append(segment)
+        runs.extend(open_runs.values())
+        return runs
+
+    def new_segment_path(self) -> str:
+        """
+        Reserve the path of the next segment file
+        @return: str
+        """
+        with self.lock.write():
+            segment_id = self.manifest.setdefault('next_segment_id', 1)
+            self.manifest['next_segment_id'] = segment_id + 1
+            return os.path.join(self.path, f'{segment_id:010d}-{os.getpid()}{SEGMENT_SUFFIX}')
+
+    @property
+    def metadata(self) -> dict:
+        self._refresh()
+        return dict(self._metadata)
+
+    def update_metadata(self, changes: dict) -> None:
+        with self.lock.write():
+            self._sync()
+            self._metadata.update(changes)
+            self._save_descriptor()
+
+    def _fragments(self, row_key: str, families: List[str] = None) -> Iterator[dict]:
+        fragment = self.memstore.get(row_key)
+        if fragment is not None:
+            yield fragment
+        for segment in reversed(self._view(families)):
+            fragment = segment.get(row_key)
+            if fragment is not None:
+                yield fragment
+
+    def get_row(self, row_key: str, families: List[str] = None) -> Union[dict, None]:
+        self._refresh()
+        with self.lock.read():
+            return merge_fragments(self._fragments(row_key, families), self._metadata['max_timestamp'], families)
+
+    def get_rows(self, row_keys: List[str], families: List[str] = None) -> Dict[str, dict]:
+        row_keys = sorted(set(row_keys))
+        self._refresh()
+        with self.lock.read():
+            # fragments of every key, newest first: the memstore, then the segments from the newest
+            fragments = {row_key: [] for row_key in row_keys}
+            for row_key in row_keys:
+                fragment = self.memstore.get(row_key)
+                if fragment is not None:
+                    fragments[row_key].append(fragment)
+            for segment in reversed(self._view(families)):
+                for row_key, fragment in segment.get_many(row_keys).items():
+                    fragments[row_key].append(fragment)
+            max_versions = self._metadata['max_timestamp']
+            rows = {}
+            for row_key, row_fragments in fragments.items():
+                row = merge_fragments(iter(row_fragments), max_versions, families)
+                if row is not None:
+                    rows[row_key] = row
+            return rows
+
+    def scan_rows(self, start_row: str = None, stop_row: str = None, key_filter: Callable[[str], bool] = None, families: List[str] = None) -> Iterator[Tuple[str, dict]]:
+        self._refresh()
+        with self.lock.read():
+            segments = list(reversed(self._view(families)))
+            for segment in segments:
+                segment.acquire()
+            sources = [self.memstore.scan(start_row, stop_row, key_filter)]
+            sources.extend(segment.scan(start_row, stop_row, key_filter) for segment in segments)
+            max_versions = self._metadata['max_timestamp']
+        try:
+            for row_key, fragments in merge_sources(sources):
+                row = merge_fragments(iter(fragments), max_versions, families)
+                if row is not None:
+                    yield row_key, row
+        finally:
+            for segment in segments:
+                segment.release()
+
+    def split_keys(self, start_row: str = None, stop_row: str = None) -> List[str]:
+        """
+        The first row key of every segment block, plus memstore keys sampled at the average number of rows per block
+        """
+        self._refresh()
+        with self.lock.read():
+            row_keys = set()
+            rows = blocks = 0
+            for segment in self.segments:
+                row_keys.update(segment.block_keys)
+                rows += segment.rows
+                blocks += len(segment.block_keys)
+            rows_per_block = max(1, rows // blocks) if blocks else 1
+            row_keys.update(sorted(self.memstore.rows)[::rows_per_block])
+        return sorted(
+            row_key for row_key in row_keys
+            if (start_row is None or row_key >= start_row) and (stop_row is None or row_key < stop_row)
+        )
+
+    def apply(self, mutations: List[dict]) -> None:
+        with self.lock.write():
+            self._sync()
+            for mutation in mutations:
+                self.seq += 1
+                mutation['seq'] = self.seq
+            self.wal.append(mutations)
+            max_versions = self._metadata['max_timestamp']
+            for mutation in mutations:
+                self.memstore.apply(mutation, max_versions)
+                self._count_rows(mutation)
+            if self.memstore.size >= self.memstore_flush_size:
+                self.flush()
+            self.signature = self._disk_signature()
+
+    def flush(self) -> None:
+        """
+        Write the memstore to a new segment and reset the write-ahead log
+        """
+        with self.lock.write():
+            self._sync()
+            if not self.memstore.rows:
+                return
+            self.segments.extend(self.write_family_segments(self.memstore.scan(), marker_families=self._marker_families()))
+            self.manifest['flushed_seq'] = self.seq
+            self._save_descriptor()
+            self.wal.reset()
+            self.memstore = MemStore()
+            self.signature = self._disk_signature()
+        if self.compactor is not None:
+            self.compactor.wake_up()
+
+    def load_rows(self, rows: Iterator[Tuple[str, dict]], new_rows: bool = False) -> int:
+        """
+        Write sorted rows straight to a new segment, bypassing the write-ahead log
+        """
+        with self.lock.write():
+            self.flush()
+            self.seq += 1
+            count = 0
+
+            def fragments():
+                nonlocal count
+                for row_key, row in rows:
+                    count += 1
+                    yield row_key, {"cells": row, "tombstones": {}, "deleted": False}
+
+            self.segments.extend(self.write_family_segments(fragments()))
+            self.manifest['flushed_seq'] = self.seq
+            if new_rows:
+                self._metadata['rows'] = self._metadata['rows'] + count
+            self._save_descriptor()
+            self.signature = self._disk_signature()
+            return count
+
+    def truncate(self) -> None:
+        with self.lock.write():
+            self._sync()
+            old_segments = self.segments
+            self.segments = []
+            self.memstore = MemStore()
+            self.manifest['flushed_seq'] = self.seq
+            self._metadata['rows'] = 0
+            self._save_descriptor()
+            self.wal.reset()
+            self.signature = self._disk_signature()
+            for segment in old_segments:
+                segment.retire()
+
+    def replace_segments(self, old_segments: List[Segment], new_segments: List[Segment], stats: dict) -> bool:
+        """
+        Swap a run of segments for the segments produced by compacting them, put where the newest of the run was
+        @param old_segments: list[Segment] - compacted segments, oldest first, a run of compaction_runs or every segment
+        @param new_segments: list[Segment] - result of the compaction, empty if nothing survived
+        @param stats: dict - {'major': bool, 'files_merged': int, 'bytes_reclaimed': int, 'duration': float}
+        @return: bool - False if the segments changed meanwhile and the result was discarded
+        """
+        with self.lock.write():
+            self._sync()
+            names = [segment.name for segment in self.segments]
+            old_names = {segment.name for segment in old_segments}
+            # segments are only appended or replaced, the run is intact if all of it is still there
+            if self.closed or not old_names <= set(names):
+                for segment in new_segments:
+                    segment.retire()
+                return False
+            newest = max(names.index(name) for name in old_names)
+            kept = [segment for segment in self.segments[:newest] if segment.name not in old_names]
+            self.segments = kept + list(new_segments) + self.segments[newest + 1:]
+            record_compaction(self.compaction_stats, stats)
+            if stats['major']:
+                self.compaction_stats['major_seq'] = self.manifest['flushed_seq']
+                self.compaction_stats['last_major_time'] = time.time()
+            self._save_descriptor()
+            self.signature = self._disk_signature()
+        for segment in old_segments:
+            segment.retire()
+        return True
+
+    def close(self) -> None:
+        with self.compaction_lock, self.lock.write():
+            if self.closed:
+                return
+            self.flush()
+            self._release_files()
+        self.lock.close()
+
+    def _release_files(self) -> None:
+        self.closed = True
+        if self.compactor is not None:
+            self.compactor.unregister(self)
+        self.wal.close()
+        for segment in self.segments:
+            segment.close()
+
+    def discard(self) -> None:
+        with self.compaction_lock, self.lock.write():
+            if not self.closed:
+                self._release_files()
+        self.lock.close()
+
+    def drop(self) -> None:
+        with self.compaction_lock, self.lock.write():
+            if not self.closed:
+                self._release_files()
+            shutil.rmtree(self.path)
+        self.lock.close()
+
+    def rename(self, new_name: str) -> None:
+        self.close()
+        os.rename(self.path, os.path.join(self.base_path, new_name))
+
+    def stats(self) -> dict:
+        self._refresh()
+        with self.lock.read():
+            return {
+                "storage_engine": self.engine_name,
+                "cell_format": self.cell_format,
+                "memstore_size": self.memstore.size,
+                "memstore_rows": len(self.memstore.rows),
+                "wal_size": self.wal.size(),
+                "segments": len(self.segments),
+                "segments_size": sum(segment.size for segment in self.segments),
+                "index_entries": sum(len(segment.block_offsets) for segment in self.segments),
+                "segment_files": [segment.stats() for segment in self.segments],
+                "compaction": dict(self.compaction_stats)
+            }
+
+
+def new_compaction_stats() -> dict:
+    """
+    Counters kept in the descriptor of every lsm table
+    """
+    return {
+        "minor_compactions": 0,
+        "major_compactions": 0,
+        "files_merged": 0,
+        "bytes_reclaimed": 0,
+        "total_duration": 0.0,
+        "major_seq": 0,
+        "last_major_time": None,
+        "last_compaction": None
+    }
+
+
+def record_compaction(compaction_stats: dict, stats: dict) -> None:
+    """
+    Add the outcome of one compaction to the counters of a table
+    """
+    if stats['major']:
+        compaction_stats['major_compactions'] += 1
+    else:
+        compaction_stats['minor_compactions'] += 1
+    compaction_stats['files_merged'] += stats['files_merged']
+    compaction_stats['bytes_reclaimed'] += stats['bytes_reclaimed']
+    compaction_stats['total_duration'] += stats['duration']
+    compaction_stats['last_compaction'] = stats
+
+
+def _ranked(source: Iterator[Tuple[str, dict]], rank: int) -> Iterator[Tuple[str, int, dict]]:
+    """
+    Tag the fragments of a source with its rank, lower ranks hold newer data
+    """
+    for row_key, fragment in source:
+        yield row_key, rank, fragment
+
+
+def _write_descriptor(path: str, descriptor: dict) -> None:
+    """
+    Atomically replace the table descriptor of an lsm table
+    """
+    descriptor_path = os.path.join(path, TABLE_DESCRIPTOR)
+    tmp_path = descriptor_path+'.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(descriptor, indent=4))
+    os.replace(tmp_path, descriptor_path)
+
+
+STORAGE_ENGINES = {
+    JsonTableStore.engine_name: JsonTableStore,
+    LSMTableStore.engine_name: LSMTableStore
+}
+
+
+def open_store(base_path: str, table_name: str, **options) -> TableStore:
+    """
+    Open a table with the engine it was created with
+    @param base_path: str - database directory
+    @param table_name: str
+    @param options: options forwarded to the lsm engine
+    @return: TableStore
+    """
+    if os.path.isfile(os.path.join(base_path, table_name, REGION_MAP)):
+        # regions.py builds on the engines of this module
+        from regions import RegionedTableStore
+        return RegionedTableStore(base_path, table_name, **options)
+    if os.path.isdir(os.path.join(base_path, table_name)):
+        return LSMTableStore(base_path, table_name, **options)
+    return JsonTableStore(base_path, table_name)
+
+
+def table_file_name(entry: str, base_path: str) -> Union[str, None]:
+    """
+    Map a directory entry of the database to the table it stores
+    @param entry: str - file or directory name
+    @param base_path: str - database directory
+    @return: str - table name or None if the entry is not a table
+    """
+    if entry.endswith('.json'):
+        return entry[:-len('.json')]
+    if os.path.isfile(os.path.join(base_path, entry, TABLE_DESCRIPTOR)) or os.path.isfile(os.path.join(base_path, entry, REGION_MAP)):
+        return entry
+    return None
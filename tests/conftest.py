@@ -0,0 +1,23 @@
+import os
+import sys
+import uuid
+import shutil
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from EBase import EBase
+
+
+@pytest.fixture(params=['lsm', 'json'])
+def db(request):
+    """
+    Database of the storage engine of the test, removed afterwards
+    """
+    db = EBase(f'test_{uuid.uuid4().hex[:8]}', storage_engine=request.param, background_compaction=False, scan_workers=1)
+    yield db
+    try:
+        db.close()
+    finally:
+        shutil.rmtree(db.relative_path, ignore_errors=True)
@@ -0,0 +1,85 @@
+import threading
+
+from group_commit import CommitPipeline
+
+
+def group_commit_table(db, table_name='t'):
+    """
+    Table with group commit on and writes still queued in its pipeline
+    """
+    assert db.create(table_name, ['cf'])['success']
+    row_key = db.put(table_name, 'cf', 'a', '1')['data']['row_key']
+    assert db.set_group_commit(table_name, True, 1000, 60000)['success']
+    output = db.put(table_name, 'cf', 'b', '2', row_key, wait=False)
+    assert output['success'] and not output['data']['future'].done()
+    return row_key, output['data']['future']
+
+
+def test_rename_with_group_commit(db):
+    row_key, future = group_commit_table(db)
+    assert db.disable('t')['success']
+    output = db.alter('t', new_name='renamed')
+    assert output['success'], output['message']
+    assert future.done() and future.exception() is None
+    assert db.list_tables()['data']['tables'] == ['renamed']
+    assert db.enable('renamed')['success']
+    assert db.get('renamed', row_key)['data']['data'] == {'cf': {'a': '1', 'b': '2'}}
+
+
+def test_drop_with_group_commit(db):
+    _, future = group_commit_table(db)
+    assert db.disable('t')['success']
+    output = db.drop('t')
+    assert output['success'], output['message']
+    assert future.done()
+    assert db.list_tables()['success']
+    assert db.list_tables()['data']['tables'] == []
+
+
+def test_convert_with_group_commit(db):
+    row_key, future = group_commit_table(db)
+    engine = 'json' if db.storage_engine == 'lsm' else 'lsm'
+    output = db.convert('t', engine)
+    assert output['success'], output['message']
+    assert future.done() and future.exception() is None
+    assert db.list_tables()['data']['tables'] == ['t']
+    assert db.describe('t')['data']['storage']['storage_engine'] == engine
+    assert db.get('t', row_key)['data']['data'] == {'cf': {'a': '1', 'b': '2'}}
+
+
+def test_batches_never_exceed_max_batch_mutations():
+    lock = threading.RLock()
+    committed = []
+    pipeline = CommitPipeline(committed.append, lambda: lock, max_batch_mutations=10, max_batch_delay_ms=20)
+    start = threading.Barrier(50)
+
+    def writer(i):
+        start.wait()
+        futures = [pipeline.submit([{"op": "put", "row": f'{i}-{j}'}]) for j in range(20)]
+        for future in futures:
+            future.result()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pipeline.close()
+    assert sum(len(batch) for batch in committed) == 1000
+    assert pipeline.stats()['largest_batch'] <= 10
+    assert max(len(batch) for batch in committed) <= 10
+
+
+def test_failed_batch_does_not_fail_other_batches():
+    lock = threading.RLock()
+
+    def commit(mutations):
+        if any(mutation['row'] == 'bad' for mutation in mutations):
+            raise ValueError('rejected')
+
+    pipeline = CommitPipeline(commit, lambda: lock, max_batch_mutations=1, max_batch_delay_ms=60000)
+    good = pipeline.submit([{"op": "put", "row": 'good'}])
+    bad = pipeline.submit([{"op": "put", "row": 'bad'}])
+    pipeline.close()
+    assert good.exception() is None
+    assert isinstance(bad.exception(), ValueError)
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+
+def test_inserted_rows_are_the_stored_rows(db):
+    assert db.create('t', ['cf'])['success']
+    frame = pd.DataFrame({
+        'name': ['Ana', np.nan, 'Luis', ''],
+        'age': [30, np.nan, np.nan, np.nan],
+        'score': [1.5, np.nan, 2.0, np.nan]
+    })
+    output = db.insert_many('t', 'cf', frame)
+    assert output['success'], output['message']
+    assert output['data']['number_of_rows_inserted'] == 2
+
+    inserted = output['data']['inserted_rows']
+    assert [row['data'] for row in inserted] == [
+        {'name': 'Ana', 'age': '30.0', 'score': '1.5'},
+        {'name': 'Luis', 'score': '2.0'}
+    ]
+    for row in inserted:
+        assert db.get('t', row['row_key'])['data']['data'] == {'cf': row['data']}
+    assert db.count('t', exact=True)['data']['rows'] == 2